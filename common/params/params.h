@@ -27,6 +27,7 @@ const std::unordered_map<std::string, KeyInfo> KEYS = {
   {"MapboxSettings", {ParamKeyType::JSON, "{}"}},
   {"MapboxRoute", {ParamKeyType::STRING, ""}},
   {"MapboxRecompute", {ParamKeyType::BOOL, "0"}},
+  {"MapboxAlternatives", {ParamKeyType::BOOL, "0"}},
 
 
   // CI test keys
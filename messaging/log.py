@@ -0,0 +1,255 @@
+"""Append-only message log of capnp frames with monotonic timestamps, written by system/loggerd.py.
+
+A log starts with a header holding the wall and monotonic clock at its start, followed by chunks. A chunk is a header
+(codec, sizes, record count and time range) and its records compressed as one block. A record is the message's
+publish time, the service name, flags and the serialized message. Closing the writer appends an index of the chunks
+and the logged service names, then a trailer pointing at them. A log cut short by a crash has no index, readers then
+rebuild it from the chunk headers and ignore a partially written last chunk.
+
+Chunks are compressed with zstd, lz4 when zstandard is not installed, and zlib when neither is.
+"""
+import os
+import struct
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Iterator
+
+try:
+  import zstandard
+except ImportError:
+  zstandard = None  # type: ignore[assignment]
+
+try:
+  import lz4.frame
+except ImportError:
+  lz4 = None
+
+MAGIC = b"MSGLOG01"
+FILE_HEADER = struct.Struct("<8sQQ")  # magic, wall time and monotonic time at the start in ns
+CHUNK_MAGIC = b"CHNK"
+CHUNK_HEADER = struct.Struct("<4sB3xIIIQQ")  # magic, codec, compressed size, raw size, records, first and last time
+RECORD = struct.Struct("<QIHB")  # time, data length, name length, flags
+INDEX_MAGIC = b"CIDX"  # chunk index
+INDEX_HEADER = struct.Struct("<4sII")  # magic, chunks, length of the service names following the entries
+INDEX_ENTRY = struct.Struct("<QIQQ")  # chunk offset, records, first and last time
+TRAILER_MAGIC = b"MSGINDEX"
+TRAILER = struct.Struct("<8sQ")  # magic, index offset
+
+FLAG_PACKED = 1  # message uses capnp's packed encoding
+
+CODECS = {"none": 0, "zlib": 1, "lz4": 2, "zstd": 3}
+DEFAULT_CHUNK_SIZE = 1024 * 1024  # uncompressed bytes buffered before a chunk is written
+DEFAULT_CHUNK_SECONDS = 1.0  # a chunk spans at most this long, bounding the loss on a crash
+
+
+def available_codecs() -> list[str]:
+  return [codec for codec in CODECS if (codec != "zstd" or zstandard is not None) and (codec != "lz4" or lz4 is not None)]
+
+
+def default_codec() -> str:
+  return "zstd" if zstandard is not None else "lz4" if lz4 is not None else "zlib"
+
+
+def compress(codec: str, data: bytes) -> bytes:
+  if codec not in available_codecs():
+    raise ValueError(f"Codec '{codec}' is not available")
+  if codec == "zstd":
+    return bytes(zstandard.ZstdCompressor(level=3).compress(data))
+  if codec == "lz4":
+    return bytes(lz4.frame.compress(data))
+  if codec == "zlib":
+    return zlib.compress(data, 6)
+  return data
+
+
+def decompress(codec_id: int, data: bytes, raw_size: int) -> bytes:
+  codec = next((name for name, value in CODECS.items() if value == codec_id), None)
+  if codec is None or codec not in available_codecs():
+    raise ValueError(f"Chunk codec {codec or codec_id} is not available, install {codec} to read this log")
+  if codec == "zstd":
+    return bytes(zstandard.ZstdDecompressor().decompress(data, max_output_size=raw_size))
+  if codec == "lz4":
+    return bytes(lz4.frame.decompress(data))
+  if codec == "zlib":
+    return zlib.decompress(data)
+  return data
+
+
+@dataclass
+class LogRecord:
+  time_ns: int  # monotonic publish time
+  name: str
+  data: bytes
+  packed: bool = False
+
+
+@dataclass
+class ChunkInfo:
+  offset: int
+  records: int
+  first_ns: int
+  last_ns: int
+
+
+class LogWriter:
+  def __init__(self, path, codec: str | None = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+               chunk_seconds: float = DEFAULT_CHUNK_SECONDS) -> None:
+    self.path = str(path)
+    self.codec = codec or default_codec()
+    if self.codec not in available_codecs():
+      raise ValueError(f"Codec '{self.codec}' is not available, choose one of {available_codecs()}")
+    self.chunk_size = chunk_size
+    self.chunk_ns = int(chunk_seconds * 1e9)
+    self.chunks: list[ChunkInfo] = []
+    self.services: set[str] = set()
+    self._records: list[bytes] = []
+    self._buffered = 0
+    self._first_ns: int | None = None
+    self._last_ns = 0
+    self._file = open(self.path, "xb")  # never overwrite a log
+    self._file.write(FILE_HEADER.pack(MAGIC, time.time_ns(), time.monotonic_ns()))
+    self._file.flush()
+
+  def write(self, name: str, data: bytes, time_ns: int, packed: bool = False) -> None:
+    if self._first_ns is not None and time_ns - self._first_ns >= self.chunk_ns:
+      self.flush()
+    encoded_name = name.encode()
+    self.services.add(name)
+    self._records.append(RECORD.pack(time_ns, len(data), len(encoded_name), FLAG_PACKED if packed else 0) + encoded_name + data)
+    self._buffered += RECORD.size + len(encoded_name) + len(data)
+    if self._first_ns is None:
+      self._first_ns = time_ns
+    self._last_ns = max(self._last_ns, time_ns)
+    if self._buffered >= self.chunk_size:
+      self.flush()
+
+  def flush_due(self, now_ns: int) -> None:
+    """Writes the buffered records once the oldest is chunk_seconds old, for services that went quiet."""
+    if self._first_ns is not None and now_ns - self._first_ns >= self.chunk_ns:
+      self.flush()
+
+  def flush(self) -> None:
+    """Compresses the buffered records into a chunk and appends it to the file."""
+    if not self._records or self._first_ns is None:
+      return
+    raw = b"".join(self._records)
+    compressed = compress(self.codec, raw)
+    offset = self._file.tell()
+    self._file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, CODECS[self.codec], len(compressed), len(raw), len(self._records),
+                                       self._first_ns, self._last_ns) + compressed)
+    self._file.flush()
+    self.chunks.append(ChunkInfo(offset, len(self._records), self._first_ns, self._last_ns))
+    self._records = []
+    self._buffered = 0
+    self._first_ns = None
+    self._last_ns = 0
+
+  def close(self) -> None:
+    """Writes the remaining records, the index and the trailer."""
+    if self._file.closed:
+      return
+    self.flush()
+    index_offset = self._file.tell()
+    entries = b"".join(INDEX_ENTRY.pack(chunk.offset, chunk.records, chunk.first_ns, chunk.last_ns) for chunk in self.chunks)
+    names = "\n".join(sorted(self.services)).encode()
+    self._file.write(INDEX_HEADER.pack(INDEX_MAGIC, len(self.chunks), len(names)) + entries + names + TRAILER.pack(TRAILER_MAGIC, index_offset))
+    self._file.flush()
+    os.fsync(self._file.fileno())
+    self._file.close()
+
+  def __enter__(self) -> "LogWriter":
+    return self
+
+  def __exit__(self, *exc) -> None:
+    self.close()
+
+
+class LogReader:
+  def __init__(self, path) -> None:
+    self.path = str(path)
+    self._file = open(self.path, "rb")
+    header = self._file.read(FILE_HEADER.size)
+    if len(header) < FILE_HEADER.size or header[:len(MAGIC)] != MAGIC:
+      self._file.close()
+      raise ValueError(f"{self.path} is not a message log")
+    _, self.start_wall_ns, self.start_mono_ns = FILE_HEADER.unpack(header)
+    self.size = os.fstat(self._file.fileno()).st_size
+    self._services: set[str] | None = None
+    index = self._read_index()
+    self.indexed = index is not None  # False for a log whose writer did not close it
+    self.chunks: list[ChunkInfo] = index if index is not None else self._scan_chunks()
+
+  def _read_index(self) -> list[ChunkInfo] | None:
+    if self.size < FILE_HEADER.size + INDEX_HEADER.size + TRAILER.size:
+      return None
+    self._file.seek(self.size - TRAILER.size)
+    magic, index_offset = TRAILER.unpack(self._file.read(TRAILER.size))
+    if magic != TRAILER_MAGIC or not FILE_HEADER.size <= index_offset <= self.size - TRAILER.size - INDEX_HEADER.size:
+      return None
+    self._file.seek(index_offset)
+    magic, count, names_length = INDEX_HEADER.unpack(self._file.read(INDEX_HEADER.size))
+    entries = self._file.read(count * INDEX_ENTRY.size)
+    names = self._file.read(names_length)
+    if magic != INDEX_MAGIC or len(entries) != count * INDEX_ENTRY.size or len(names) != names_length:
+      return None
+    self._services = set(names.decode().split("\n")) if names else set()
+    return [ChunkInfo(*INDEX_ENTRY.unpack_from(entries, i * INDEX_ENTRY.size)) for i in range(count)]
+
+  def _scan_chunks(self) -> list[ChunkInfo]:
+    """Chunk list from the chunk headers, for a log whose writer did not close it."""
+    chunks = []
+    offset = FILE_HEADER.size
+    while offset + CHUNK_HEADER.size <= self.size:
+      self._file.seek(offset)
+      magic, _, compressed_size, _, records, first_ns, last_ns = CHUNK_HEADER.unpack(self._file.read(CHUNK_HEADER.size))
+      end = offset + CHUNK_HEADER.size + compressed_size
+      if magic != CHUNK_MAGIC or end > self.size:  # the index, or a chunk cut short
+        break
+      chunks.append(ChunkInfo(offset, records, first_ns, last_ns))
+      offset = end
+    return chunks
+
+  @property
+  def services(self) -> set[str]:
+    """Logged service names, read from every chunk when the log has no index."""
+    if self._services is None:
+      self._services = {record.name for chunk in self.chunks for record in self.read_chunk(chunk)}
+    return self._services
+
+  def read_chunk(self, chunk: ChunkInfo) -> list[LogRecord]:
+    self._file.seek(chunk.offset)
+    magic, codec_id, compressed_size, raw_size, _, _, _ = CHUNK_HEADER.unpack(self._file.read(CHUNK_HEADER.size))
+    if magic != CHUNK_MAGIC:
+      raise ValueError(f"No chunk at offset {chunk.offset} of {self.path}")
+    raw = memoryview(decompress(codec_id, self._file.read(compressed_size), raw_size))
+
+    records = []
+    offset = 0
+    while offset < len(raw):
+      time_ns, data_length, name_length, flags = RECORD.unpack_from(raw, offset)
+      offset += RECORD.size
+      name = bytes(raw[offset:offset + name_length]).decode()
+      offset += name_length
+      records.append(LogRecord(time_ns, name, bytes(raw[offset:offset + data_length]), bool(flags & FLAG_PACKED)))
+      offset += data_length
+    return records
+
+  def records(self, services=None, start_ns: int | None = None) -> Iterator[LogRecord]:
+    """Records in the order they were logged, of the given services only, from start_ns on. Chunks ending before
+    start_ns are skipped using the index."""
+    for chunk in self.chunks:
+      if start_ns is not None and chunk.last_ns < start_ns:
+        continue
+      for record in self.read_chunk(chunk):
+        if (services is None or record.name in services) and (start_ns is None or record.time_ns >= start_ns):
+          yield record
+
+  def close(self) -> None:
+    self._file.close()
+
+  def __enter__(self) -> "LogReader":
+    return self
+
+  def __exit__(self, *exc) -> None:
+    self.close()
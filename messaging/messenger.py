@@ -1,37 +1,177 @@
 import threading
 import time
 import logging
-import asyncio
+import os
+import queue
+import struct
+import weakref
 from pathlib import Path
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 import capnp
+import numpy as np
 import yaml
 import zmq
-import zmq.asyncio as zmq_async
+
+from messaging.shm import DEFAULT_SLOT_SIZE, DEFAULT_SLOTS, ShmRing, ring_path
+from messaging.stats import ServiceStats
 
 
 schema = capnp.load("messaging/autonomy.capnp")
 
+TRANSPORTS = ("zmq", "shm")
+ENCODINGS = ("unpacked", "packed")  # capnp serialization, packed compresses zero words at some encode/decode cost
+POLL_TIMEOUT_MS = 100  # receive thread wakeup interval to notice close()
+STATS_LOG_INTERVAL = 10.0  # seconds between stats summaries in the log, when stats are enabled
+
+# Every frame starts with the publisher's sequence number of its first message, the monotonic send time and the
+# number of messages it carries. A single message follows the stamp directly, a batch has a table of message lengths
+# first. For shared-memory services the frame is only this stamp, a doorbell for the messages written to the ring.
+# The stamp is a prefix and batches are packed into one frame because ZMQ_CONFLATE does not support multipart messages.
+STAMP = struct.Struct("<QQII")  # first sequence number, send time, message count, padding to keep messages aligned
+BATCH_LENGTH = struct.Struct("<Q")
+WORD_SIZE = 8  # capnp segments must be word aligned to be read in place, unpacked messages are whole words
+DEFAULT_BATCH_LATENCY_MS = 10.0
+
+
+def pack_frame(seq: int, messages: list[bytes]) -> bytes:
+  stamp = STAMP.pack(seq, time.monotonic_ns(), len(messages), 0)
+  if len(messages) == 1:
+    return stamp + messages[0]
+  lengths = struct.pack(f"<{len(messages)}Q", *(len(message) for message in messages))
+  return b"".join([stamp, lengths, *messages])
+
+
+def frame_messages(frame) -> list[memoryview]:
+  """Messages of a received frame, oldest first, viewing the frame without copying."""
+  buffer = frame.buffer if isinstance(frame, zmq.Frame) else memoryview(frame)
+  count = STAMP.unpack_from(buffer)[2]
+  if count <= 1:
+    return [buffer[STAMP.size:]]
+  offset = STAMP.size + count * BATCH_LENGTH.size
+  messages = []
+  for length in struct.unpack_from(f"<{count}Q", buffer, STAMP.size):
+    messages.append(buffer[offset:offset + length])
+    offset += length
+  return messages
+
+
+def message_buffer(frame, packed=False):
+  """Newest message of a received frame, copied only when ZMQ placed it at an unaligned address. Packed messages are
+  unpacked into a new buffer when decoded, so they are never copied."""
+  buffer = frame_messages(frame)[-1]
+  if not packed and np.frombuffer(buffer, dtype=np.uint8).ctypes.data % WORD_SIZE:
+    return bytes(buffer)
+  return buffer
+
 
 @dataclass
 class CachedMessage:
   msg: object = None
   capnp_reader: object = None
+  frame: object = None  # received frame the reader views, kept alive while the reader is open
 
 
 @dataclass
 class Publisher:
   socket: zmq.Socket
   rate_hz: float
+  ring: ShmRing | None = None  # shared-memory transport, the socket then only carries doorbells
+  seq: int = 0  # sequence number of the next message
+  batch_size: int = 1  # messages packed into one frame, 1 sends every message as it is published
+  batch_latency: float = 0.0  # seconds a buffered message waits at most for its batch to fill
+  pending: list[bytes] = field(default_factory=list)
+  flush_deadline: float | None = None  # monotonic time the oldest pending message is due
+  lock: threading.Lock = field(default_factory=threading.Lock)  # publish() and the PubMaster's flush thread
+  packed: bool = False  # packed capnp encoding
+
+  def serialize(self, msg) -> bytes:
+    return bytes(msg.to_bytes_packed() if self.packed else msg.to_bytes())
 
   def publish(self, msg) -> None:
-    serialized = msg.to_bytes()
-    self.socket.send(serialized)
+    self.publish_serialized(self.serialize(msg))
+
+  def publish_serialized(self, serialized: bytes) -> None:
+    """Publishes a message already serialized in the service's encoding."""
+    with self.lock:
+      if self.batch_size <= 1:
+        self._send([serialized])
+        return
+      if not self.pending:
+        self.flush_deadline = time.monotonic() + self.batch_latency
+      self.pending.append(serialized)
+      if len(self.pending) >= self.batch_size:
+        self._flush()
+
+  def publish_many(self, msgs) -> None:
+    """Sends the pending messages and msgs in one frame, whatever the batch size."""
+    serialized = [self.serialize(msg) for msg in msgs]
+    with self.lock:
+      self.pending.extend(serialized)
+      self._flush()
+
+  def flush(self, now: float | None = None) -> None:
+    """Sends the pending messages, with now only when their deadline passed."""
+    with self.lock:
+      if now is None or (self.flush_deadline is not None and now >= self.flush_deadline):
+        self._flush()
+
+  def _flush(self) -> None:
+    if self.pending:
+      self._send(self.pending)
+    self.pending = []
+    self.flush_deadline = None
+
+  def _send(self, messages: list[bytes]) -> None:
+    if self.ring is not None:
+      first = self.ring.write(messages[0])
+      for message in messages[1:]:
+        self.ring.write(message)
+      self.seq = first
+      self.socket.send(STAMP.pack(first, time.monotonic_ns(), len(messages), 0))
+    else:
+      self.socket.send(pack_frame(self.seq, messages))
+    self.seq += len(messages)
+
+
+_registry_cache: dict[tuple[str, int], dict[str, dict]] = {}
+
+_context: zmq.Context | None = None
+_context_users = 0
+_context_pid: int | None = None
+_context_lock = threading.Lock()
+
+
+def acquire_context() -> zmq.Context:
+  """The ZMQ context shared by every PubMaster and SubMaster in the process, created on first use."""
+  global _context, _context_users, _context_pid
+  with _context_lock:
+    if _context is None or _context_pid != os.getpid():  # a forked child must not use the parent's context
+      _context = zmq.Context()
+      _context_users = 0
+      _context_pid = os.getpid()
+    _context_users += 1
+    return _context
+
+
+def release_context() -> None:
+  """Terminates the shared context once its last user closed all of its sockets, stopping ZMQ's I/O threads."""
+  global _context, _context_users
+  with _context_lock:
+    _context_users -= 1
+    if _context_users == 0 and _context is not None:
+      _context.term()
+      _context = None
 
 
 def load_registry(path="messaging/services.yaml") -> dict[str, dict]:
-  with Path(path).open() as file:
+  """Services by name, parsed once per process for each version of the file. The result is shared, do not modify it."""
+  resolved = Path(path).resolve()
+  cache_key = (str(resolved), resolved.stat().st_mtime_ns)
+  if (cached := _registry_cache.get(cache_key)) is not None:
+    return cached
+
+  with resolved.open() as file:
     config = yaml.safe_load(file)
 
   registry: dict[str, dict] = {}
@@ -43,10 +183,25 @@ def load_registry(path="messaging/services.yaml") -> dict[str, dict]:
     except AttributeError:
       raise ValueError(f"Schema '{schema_name}' not found in capnp for service '{service['name']}'")
 
+    transport = service.get("transport", "zmq")
+    if transport not in TRANSPORTS:
+      raise ValueError(f"Unknown transport '{transport}' for service '{service['name']}'")
+    encoding = service.get("encoding", "unpacked")
+    if encoding not in ENCODINGS:
+      raise ValueError(f"Unknown encoding '{encoding}' for service '{service['name']}'")
+
     registry[service["name"]] = {
       "rate_hz": service["rate_hz"],
       "schema_type": schema_type,
+      "conflate": bool(service.get("conflate", False)),  # subscribers keep only the newest message
+      "transport": transport,
+      "encoding": encoding,
+      "shm_slots": service.get("shm_slots", DEFAULT_SLOTS),
+      "shm_slot_size": service.get("shm_slot_size", DEFAULT_SLOT_SIZE),
+      "batch_size": service.get("batch_size", 1),  # messages a publisher packs into one frame
+      "batch_latency": service.get("batch_latency_ms", DEFAULT_BATCH_LATENCY_MS) / 1000,
     }
+  _registry_cache[cache_key] = registry
   return registry
 
 
@@ -54,38 +209,226 @@ class PubMaster:
   """Publishes messages to ZMQ publisher socket."""
 
   def __init__(self, service_names, registry_path="messaging/services.yaml") -> None:
+    self._pid = os.getpid()  # a forked child must leave the parent's sockets and context alone
     self.registry: dict[str, dict] = load_registry(registry_path)
     if isinstance(service_names, str):
       service_names = [service_names]
 
-    self.context = zmq.Context()
-    self.publishers = {}
+    self.publishers: dict[str, Publisher] = {}
+    self._closed = threading.Event()
+    self._flush_thread: threading.Thread | None = None
+    context = acquire_context()  # shared by every PubMaster and SubMaster in the process
+    self.context: zmq.Context | None = context
     for name in service_names:
       if name not in self.registry:
         raise KeyError(f"Unknown service {name}")
-      socket = self.context.socket(zmq.PUB)
+      service = self.registry[name]
+      socket = context.socket(zmq.PUB)
       socket.bind(f"ipc:///tmp/{name}.ipc")
-      self.publishers[name] = Publisher(socket, (1.0 / self.registry[name]["rate_hz"]))
+      ring = ShmRing.create(ring_path(name), service["shm_slots"], service["shm_slot_size"]) if service["transport"] == "shm" else None
+      self.publishers[name] = Publisher(socket, (1.0 / service["rate_hz"]), ring, batch_size=service["batch_size"],
+                                        batch_latency=service["batch_latency"], packed=service["encoding"] == "packed")
+
+    # Batched services buffer messages until the batch fills, this thread sends those waiting longer than the latency
+    batch_latencies = [publisher.batch_latency for publisher in self.publishers.values() if publisher.batch_size > 1]
+    if batch_latencies:
+      interval = max(min(batch_latencies) / 2, 0.0005)
+      self._flush_thread = threading.Thread(target=self._flush_loop, args=(weakref.ref(self), self._closed, interval), daemon=True,
+                                            name="messenger-flush")
+      self._flush_thread.start()
 
   def __getitem__(self, name):
     return self.publishers[name]
 
   def send(self, name, msg):
+    """Sends msg, or buffers it for a service with batch_size above 1."""
     self.publishers[name].publish(msg)
 
+  def send_serialized(self, name, data: bytes):
+    """Sends a message serialized in the service's encoding, as recorded by the logger."""
+    self.publishers[name].publish_serialized(data)
+
+  def send_many(self, name, msgs):
+    """Sends msgs in one frame, after any buffered ones. Subscribers receive them in order, SubMaster keeps the last."""
+    self.publishers[name].publish_many(msgs)
+
+  def flush(self, name=None):
+    """Sends the messages buffered for a service, or for all when name is None."""
+    for publisher in ([self.publishers[name]] if name is not None else self.publishers.values()):
+      publisher.flush()
+
+  @staticmethod
+  def _flush_loop(pub_master_ref, closed: threading.Event, interval: float) -> None:
+    """Holds the PubMaster weakly so that dropping it still closes it through __del__."""
+    while not closed.wait(interval):
+      pub_master = pub_master_ref()
+      if pub_master is None:
+        return
+      now = time.monotonic()
+      for publisher in list(pub_master.publishers.values()):
+        if publisher.flush_deadline is not None:
+          try:
+            publisher.flush(now)
+          except Exception as e:
+            logging.error(f"Error flushing messages: {e}", exc_info=True)
+      del pub_master
+
   def close(self):
+    if getattr(self, "context", None) is None:
+      return
+    if self._pid != os.getpid():  # inherited through fork(), releasing the context here would end the child's own
+      self.context = None
+      return
+    self._closed.set()
+    if self._flush_thread is not None and self._flush_thread is not threading.current_thread():
+      self._flush_thread.join()
     for publisher in self.publishers.values():
+      try:
+        publisher.flush()
+      except Exception as e:
+        logging.error(f"Error flushing messages: {e}", exc_info=True)
       publisher.socket.close()
-    self.context.term()
+      if publisher.ring is not None:
+        publisher.ring.close()
+    self.publishers = {}
+    self.context = None
+    release_context()
 
   def __del__(self):
     self.close()
 
 
+class Receiver:
+  """Process-wide thread receiving for every SubMaster from one poller.
+
+  Sockets are handed over on register() and closed by the thread on unregister(), so only it ever uses them.
+  Commands wake the poller through a pipe. Frames are kept without copying and decoded on first access. The thread
+  exits once the last SubMaster unregisters, so a process without subscribers has no thread to trip up fork().
+  """
+
+  def __init__(self) -> None:
+    self.stopped = False
+    self._commands: queue.SimpleQueue = queue.SimpleQueue()
+    self._wakeup_read, self._wakeup_write = os.pipe()
+    os.set_blocking(self._wakeup_read, False)
+    self._thread = threading.Thread(target=self._run, daemon=True, name="messenger-receiver")
+    self._thread.start()
+
+  def register(self, sub_master: "SubMaster") -> None:
+    """Starts receiving for sub_master, call with _receiver_lock held so the thread cannot stop meanwhile."""
+    self._command("register", sub_master)
+
+  def unregister(self, sub_master: "SubMaster", timeout: float = 1.0) -> bool:
+    """Stops receiving for sub_master and closes its sockets, returns whether that finished within timeout."""
+    done = threading.Event()
+    self._command("unregister", sub_master, done)
+    return done.wait(timeout)
+
+  def _command(self, action, sub_master, done=None) -> None:
+    self._commands.put((action, sub_master, done))
+    os.write(self._wakeup_write, b"\0")
+
+  def _run(self) -> None:
+    poller = zmq.Poller()
+    poller.register(self._wakeup_read, zmq.POLLIN)
+    owners: dict[zmq.Socket, tuple[SubMaster, str]] = {}
+    sub_masters: list[SubMaster] = []
+
+    while True:
+      try:
+        received: dict[SubMaster, list] = {}
+        for socket, _ in poller.poll(POLL_TIMEOUT_MS):
+          if socket == self._wakeup_read:
+            self._apply_commands(poller, owners, sub_masters)
+            if not sub_masters and self._stop():
+              return
+            continue
+          if socket not in owners:  # unregistered earlier in this iteration
+            continue
+          sub_master, name = owners[socket]
+          frames = 0
+          latest = None
+          stamps: list[tuple[int, int, int]] = []
+          try:
+            while True:  # drain to the newest frame, older queued ones are never read
+              frame = socket.recv(zmq.NOBLOCK, copy=False)
+              if len(frame) < STAMP.size:  # not from a PubMaster
+                continue
+              latest = frame
+              seq, sent_ns, count, _ = STAMP.unpack_from(frame.buffer)
+              frames += count
+              if sub_master._stats_enabled:
+                received_ns = time.monotonic_ns()
+                stamps.extend((seq + i, sent_ns, received_ns) for i in range(count))
+          except zmq.Again:
+            pass
+          if latest is not None:
+            received.setdefault(sub_master, []).append((name, latest, frames, stamps))
+
+        for sub_master, items in received.items():
+          sub_master._deliver(items)
+        for sub_master in sub_masters:
+          sub_master._log_stats()
+      except Exception as e:
+        logging.error(f"Error receiving messages: {e}", exc_info=True)
+
+  def _stop(self) -> bool:
+    with _receiver_lock:
+      if not self._commands.empty():  # registered meanwhile
+        return False
+      self.stopped = True
+    os.close(self._wakeup_read)
+    os.close(self._wakeup_write)
+    return True
+
+  def _apply_commands(self, poller, owners, sub_masters) -> None:
+    try:
+      while os.read(self._wakeup_read, 4096):
+        pass
+    except BlockingIOError:
+      pass
+
+    while not self._commands.empty():
+      action, sub_master, done = self._commands.get()
+      if action == "register":
+        sub_masters.append(sub_master)
+        for name, service in sub_master.services.items():
+          poller.register(service["socket"], zmq.POLLIN)
+          owners[service["socket"]] = (sub_master, name)
+      elif sub_master in sub_masters:
+        sub_masters.remove(sub_master)
+        for service in sub_master.services.values():
+          poller.unregister(service["socket"])
+          del owners[service["socket"]]
+          service["socket"].close(linger=0)
+      if done is not None:
+        done.set()
+
+
+_receiver: Receiver | None = None
+_receiver_pid: int | None = None
+_receiver_lock = threading.Lock()
+
+
+def register_sub_master(sub_master: "SubMaster") -> Receiver:
+  """Hands a SubMaster's sockets to the process's Receiver, started when there is none running. A forked child
+  does not inherit the parent's thread and gets its own."""
+  global _receiver, _receiver_pid
+  with _receiver_lock:
+    if _receiver is None or _receiver.stopped or _receiver_pid != os.getpid():
+      _receiver = Receiver()
+      _receiver_pid = os.getpid()
+    _receiver.register(sub_master)
+    return _receiver
+
+
 class SubMaster:
   """Subscribes to multiple ZMQ publisher sockets and maintains latest messages."""
 
-  def __init__(self, service_names=None, registry_path="messaging/services.yaml") -> None:
+  def __init__(self, service_names=None, registry_path="messaging/services.yaml", stats=None) -> None:
+    """With stats, or the MESSENGER_STATS environment variable set when None, per-service receive statistics are
+    collected (see the stats property) and summarized in the log every STATS_LOG_INTERVAL seconds."""
+    self._pid = os.getpid()  # a forked child must leave the parent's sockets and context alone
     self.registry: dict[str, dict] = load_registry(registry_path)
     if service_names is None:
       service_names = list(self.registry.keys())
@@ -96,9 +439,12 @@ class SubMaster:
 
     self.services: dict[str, dict] = {}
     self._lock = threading.Lock()  # Lock for thread safety
-    self.context = zmq_async.Context()  # Use asyncio context
-    self._running: bool = True  # Boolean for async loops
-    self._thread: threading.Thread | None = None  # Thread for running async loops
+    self._received = threading.Condition(self._lock)  # notified when any service receives a message
+    self.context: zmq.Context = acquire_context()  # shared by every PubMaster and SubMaster in the process
+    self._running: bool = True  # False once closed, wakes waiters
+    self._last_stats_log = time.monotonic()
+    self.updated: dict[str, bool] = {}  # services with a new message at the last update() or wait_for()
+    self._stats_enabled: bool = bool(os.getenv("MESSENGER_STATS")) if stats is None else stats
 
     for name in service_names:  # Initialize each service
       if name not in self.registry:
@@ -107,6 +453,8 @@ class SubMaster:
       schema_type = service["schema_type"]
 
       socket = self.context.socket(zmq.SUB)
+      if service["conflate"]:  # must be set before connecting, drops queued messages as newer ones arrive
+        socket.setsockopt(zmq.CONFLATE, 1)
       socket.connect(f"ipc:///tmp/{name}.ipc")
       socket.setsockopt(zmq.SUBSCRIBE, b"")  # Subscribe to all messages
 
@@ -119,44 +467,117 @@ class SubMaster:
         "rate_hz": service["rate_hz"],
         "last_timeout_logged": None,
         "cached": CachedMessage(),
+        "transport": service["transport"],
+        "packed": service["encoding"] == "packed",
+        "ring": None,  # opened on the first doorbell, the publisher creates it
+        "frame_count": 0,  # messages received, excluding those conflated away
+        "seen_frame_count": 0,  # frame_count at the last update() or wait_for()
+        "stats": ServiceStats(service["rate_hz"]) if self._stats_enabled else None,
       }
-    self._thread = threading.Thread(target=self._run_all_loops, daemon=True, name="SubMaster-all")
-    self._thread.start()
+      self.updated[name] = False
+    self._receiver = register_sub_master(self)
 
   def _update_cached_msg(self, name, data=None):
-    """Update the cached message for a service."""
-    cached = self.services[name]["cached"]
+    """Update the cached message for a service, reading it in place from the received frame, or unpacking it for a
+    packed service."""
+    service = self.services[name]
+    cached = service["cached"]
     if cached.capnp_reader is not None:  # clean up previous reader
       cached.capnp_reader.__exit__(None, None, None)
-    if data is not None:
-      cached.capnp_reader = self.services[name]["schema_type"].from_bytes(data)  # deserialize message
-      cached.msg = cached.capnp_reader.__enter__()
+      cached.capnp_reader = None
+    payload = self._payload(name, data) if data is not None else None
+    if payload is not None:
+      decode_start = time.perf_counter()
+      if service["packed"]:
+        cached.msg = service["schema_type"].from_bytes_packed(payload)  # owns its unpacked copy, no reader to close
+      else:
+        cached.capnp_reader = service["schema_type"].from_bytes(payload)  # deserialize message
+        cached.msg = cached.capnp_reader.__enter__()
+      cached.frame = data
+      if (stats := service["stats"]) is not None:
+        stats.record_decode(time.perf_counter() - decode_start)
     else:  # clear cached message
       cached.msg = None
       cached.capnp_reader = None
+      cached.frame = None
+
+  def _payload(self, name, data):
+    """Message bytes for a received frame. For shared-memory services the frame is only a doorbell, the newest
+    message is read from the ring, None when it could not be read."""
+    service = self.services[name]
+    if service["transport"] != "shm":
+      return message_buffer(data, service["packed"])
+    if service["ring"] is None:
+      service["ring"] = ShmRing.open(ring_path(name))
+      if service["ring"] is None:
+        return None
+    latest = service["ring"].read_latest()
+    return latest[1] if latest is not None else None
+
+  def _deliver(self, received) -> None:
+    """Store frames from the Receiver as the latest message of their services."""
+    with self._lock:
+      received_at = time.monotonic()
+      for name, frame, frames, stamps in received:
+        self.services[name]["last_data"] = frame
+        self.services[name]["received_at"] = received_at
+        self.services[name]["frame_count"] += frames
+        for seq, sent_ns, received_ns in stamps:
+          self.services[name]["stats"].record_receive(seq, sent_ns, received_ns)
+      self._received.notify_all()
+
+  def _log_stats(self) -> None:
+    """Log a stats summary when enabled and STATS_LOG_INTERVAL passed since the last one."""
+    if not self._stats_enabled or time.monotonic() - self._last_stats_log < STATS_LOG_INTERVAL:
+      return
+    self._last_stats_log = time.monotonic()
+    with self._lock:
+      for name, service in self.services.items():
+        logging.info(f"{name}: {service['stats'].format()}")
 
-  async def _async_loop(self, name):
-    """Asynchronously receive messages for a service."""
-    socket = self.services[name]["socket"]
-    while self._running:
-      try:
-        data = await asyncio.wait_for(socket.recv(), timeout=0.1)
-        with self._lock:
-          self.services[name]["last_data"] = data
-          self.services[name]["received_at"] = time.monotonic()
-          self._update_cached_msg(name, data)
-      except asyncio.TimeoutError:
-        continue
-      except Exception as e:
-        logging.error(f"Error receiving message for {name}: {e}", exc_info=True)
+  def update(self, timeout=None) -> bool:
+    """Block until any service has a new message or timeout seconds pass, then set updated to the services with one.
+
+    Returns whether any service was updated. Messages are read as usual with sm[name].
+    """
+    return self._wait(list(self.services), timeout)
 
-  def _run_all_loops(self):  # Run all loops concurrently in a single event loop.
-    asyncio.run(self._run_all_async_loops())
+  def wait_for(self, name, timeout=None) -> bool:
+    """Like update(), but block until service name has a new message. Returns whether it has one."""
+    if name not in self.services:
+      raise KeyError(f"Service {name} not subscribed")
+    return self._wait([name], timeout)
 
-  async def _run_all_async_loops(self):
-    await asyncio.gather(*[self._async_loop(name) for name in self.services])
+  def _wait(self, names, timeout) -> bool:
+    def has_new_message():
+      return not self._running or any(self.services[name]["frame_count"] > self.services[name]["seen_frame_count"] for name in names)
+
+    with self._received:
+      self._received.wait_for(has_new_message, timeout)
+      for name, service in self.services.items():
+        self.updated[name] = service["frame_count"] > service["seen_frame_count"]
+        service["seen_frame_count"] = service["frame_count"]
+      return any(self.updated[name] for name in names)
+
+  @property
+  def stats(self) -> dict[str, dict]:
+    """Per-service receive statistics, empty unless enabled: observed against configured rate, publish to receive
+    latency, gaps in sequence numbers and decode time."""
+    with self._lock:
+      return {name: service["stats"].summary() for name, service in self.services.items() if service["stats"] is not None}
+
+  @property
+  def frame_counts(self) -> dict[str, int]:
+    """Messages received per service, excluding those conflated away before reaching the subscriber"""
+    with self._lock:
+      return {name: service["frame_count"] for name, service in self.services.items()}
 
   def __getitem__(self, name):
+    """Latest message of a service, or None when there is none or it timed out.
+
+    Each message is decoded at most once, on the first access after it arrives, and stays valid until a newer
+    message is accessed.
+    """
     with self._lock:
       if name not in self.services:
         raise KeyError(f"Service {name} not subscribed")
@@ -174,6 +595,8 @@ class SubMaster:
           return None
 
       if data:
+        if self.services[name]["cached"].frame is not data:
+          self._update_cached_msg(name, data)
         return self.services[name]["cached"].msg
       return None
 
@@ -190,15 +613,30 @@ class SubMaster:
 
   def close(self):
     """Shutdown the subscriber and clean up."""
+    if not getattr(self, "_running", False):
+      return
+    if self._pid != os.getpid():  # inherited through fork(), releasing the context here would end the child's own
+      self._running = False
+      return
     logging.warning("SubMaster shutting down")
-    self._running = False
-    for name in self.services:
-      self._update_cached_msg(name)
-    if self._thread:
-      self._thread.join(timeout=1.0)
-    for service in self.services.values():
-      service['socket'].close()
-    self.context.term()
+    with self._received:
+      self._running = False
+      self._received.notify_all()
+    receiver = getattr(self, "_receiver", None)
+    if receiver is None:  # failed during __init__, the sockets were never handed over
+      for service in self.services.values():
+        service['socket'].close(linger=0)
+      release_context()
+    elif receiver.unregister(self):
+      release_context()
+    else:  # terminating the context would block on the sockets still open
+      logging.warning("SubMaster sockets were not released by the receiver thread")
+    with self._lock:
+      for name, service in self.services.items():
+        self._update_cached_msg(name)
+        if service['ring'] is not None:
+          service['ring'].close()
+          service['ring'] = None
 
   def __del__(self):
     self.close()
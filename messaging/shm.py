@@ -0,0 +1,123 @@
+"""Shared-memory ring buffer transport: one writer, any number of readers, no copy through the kernel per reader.
+
+A ring is a file in /dev/shm holding a header and fixed size slots. The writer fills slot seq % slots between two
+updates of the slot's sequence stamp (odd while writing, a seqlock), then advances the header's next sequence
+number. Readers take the newest complete slot and retry when the writer reused it during the copy. Wakeups are not
+part of the ring, the messenger rings a ZMQ doorbell after each write.
+"""
+import mmap
+import os
+import struct
+import tempfile
+
+MAGIC = b"SHMRING1"
+HEADER = struct.Struct("<8sIIQ")  # magic, slot count, slot size, next sequence number
+NEXT_SEQ_OFFSET = 16
+HEADER_SIZE = 64
+SLOT_HEADER = struct.Struct("<QQ")  # sequence stamp, payload length
+STAMP = struct.Struct("<Q")
+SLOT_ALIGNMENT = 64  # cache line, also keeps payloads word aligned for capnp
+
+DEFAULT_SLOTS = 8
+DEFAULT_SLOT_SIZE = 256 * 1024
+READ_ATTEMPTS = 8
+
+
+def ring_path(name: str) -> str:
+  directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+  return os.path.join(directory, f"{name}.ring")
+
+
+def _slot_stride(slot_size: int) -> int:
+  return -(-(SLOT_HEADER.size + slot_size) // SLOT_ALIGNMENT) * SLOT_ALIGNMENT
+
+
+class ShmRing:
+  def __init__(self, mm: mmap.mmap, slots: int, slot_size: int) -> None:
+    self._mm = mm
+    self.slots = slots
+    self.slot_size = slot_size
+    self._stride = _slot_stride(slot_size)
+    self._next_seq: int = STAMP.unpack_from(mm, NEXT_SEQ_OFFSET)[0]
+
+  @classmethod
+  def create(cls, path: str, slots: int = DEFAULT_SLOTS, slot_size: int = DEFAULT_SLOT_SIZE) -> "ShmRing":
+    """Creates or takes over the ring at path as its writer."""
+    if slots < 2:
+      raise ValueError("A ring needs at least 2 slots")
+    size = HEADER_SIZE + slots * _slot_stride(slot_size)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+      os.ftruncate(fd, size)
+      mm = mmap.mmap(fd, size)
+    finally:
+      os.close(fd)
+    # Stale stamps from a previous writer never match the restarted sequence numbers, so readers skip them
+    HEADER.pack_into(mm, 0, MAGIC, slots, slot_size, 0)
+    return cls(mm, slots, slot_size)
+
+  @classmethod
+  def open(cls, path: str) -> "ShmRing | None":
+    """Opens the ring at path for reading, None until a writer created it."""
+    try:
+      fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+      return None
+    try:
+      if os.fstat(fd).st_size < HEADER_SIZE:
+        return None
+      mm = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+    finally:
+      os.close(fd)
+    magic, slots, slot_size, _ = HEADER.unpack_from(mm, 0)
+    if magic != MAGIC or len(mm) < HEADER_SIZE + slots * _slot_stride(slot_size):
+      mm.close()
+      raise ValueError(f"{path} is not a shared-memory ring")
+    return cls(mm, slots, slot_size)
+
+  def write(self, data: bytes) -> int:
+    """Writes a message to the next slot and returns its sequence number."""
+    if len(data) > self.slot_size:
+      raise ValueError(f"Message of {len(data)} bytes exceeds the ring's {self.slot_size} byte slots")
+    seq = self._next_seq
+    offset = HEADER_SIZE + (seq % self.slots) * self._stride
+    STAMP.pack_into(self._mm, offset, 2 * seq + 1)
+    self._mm[offset + SLOT_HEADER.size:offset + SLOT_HEADER.size + len(data)] = data
+    SLOT_HEADER.pack_into(self._mm, offset, 2 * seq + 2, len(data))
+    self._next_seq = seq + 1
+    STAMP.pack_into(self._mm, NEXT_SEQ_OFFSET, self._next_seq)
+    return seq
+
+  def read_latest(self) -> tuple[int, bytes] | None:
+    """Sequence number and a copy of the newest complete message, None when there is none yet or the writer kept
+    overwriting it."""
+    for _ in range(READ_ATTEMPTS):
+      next_seq = STAMP.unpack_from(self._mm, NEXT_SEQ_OFFSET)[0]
+      if next_seq == 0:
+        return None
+      if (data := self._read_slot(next_seq - 1)) is not None:
+        return next_seq - 1, data
+    return None
+
+  def read(self, seq: int) -> bytes | None:
+    """Copy of the message with sequence number seq, None when it was not written yet or was already overwritten."""
+    for _ in range(READ_ATTEMPTS):
+      if (data := self._read_slot(seq)) is not None:
+        return data
+      next_seq = STAMP.unpack_from(self._mm, NEXT_SEQ_OFFSET)[0]
+      if seq >= next_seq or seq + self.slots < next_seq:
+        return None
+    return None
+
+  def _read_slot(self, seq: int) -> bytes | None:
+    offset = HEADER_SIZE + (seq % self.slots) * self._stride
+    stamp, length = SLOT_HEADER.unpack_from(self._mm, offset)
+    if stamp != 2 * seq + 2 or length > self.slot_size:
+      return None
+    data = self._mm[offset + SLOT_HEADER.size:offset + SLOT_HEADER.size + length]
+    if STAMP.unpack_from(self._mm, offset)[0] != stamp:
+      return None
+    return data
+
+  def close(self) -> None:
+    self._mm.close()
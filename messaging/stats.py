@@ -0,0 +1,86 @@
+"""Per-service receive statistics for SubMaster, from the sequence number and send time stamped on every message."""
+import bisect
+
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 50.0, 100.0, 250.0)  # upper bounds, the last bucket is open
+
+
+class ServiceStats:
+  def __init__(self, rate_hz: float) -> None:
+    self.rate_hz = rate_hz
+    self.received = 0
+    self.first_received_ns: int | None = None
+    self.last_received_ns: int | None = None
+    self.last_seq: int | None = None
+    self.gaps = 0  # times one or more messages were missing between two received ones
+    self.dropped = 0  # messages missing in total, conflated services drop all but the newest by design
+    self.latency_counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+    self.latency_sum_ms = 0.0
+    self.latency_max_ms = 0.0
+    self.decodes = 0
+    self.decode_sum_ms = 0.0
+    self.decode_max_ms = 0.0
+
+  def record_receive(self, seq: int, sent_ns: int, received_ns: int) -> None:
+    if self.last_seq is not None:
+      if seq > self.last_seq + 1:
+        self.gaps += 1
+        self.dropped += seq - self.last_seq - 1
+      # A lower sequence number is a restarted publisher, counting starts over
+    self.last_seq = seq
+
+    if self.first_received_ns is None:
+      self.first_received_ns = received_ns
+    self.last_received_ns = received_ns
+    self.received += 1
+
+    latency_ms = max(0, received_ns - sent_ns) / 1e6
+    self.latency_counts[bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+    self.latency_sum_ms += latency_ms
+    self.latency_max_ms = max(self.latency_max_ms, latency_ms)
+
+  def record_decode(self, seconds: float) -> None:
+    decode_ms = seconds * 1000
+    self.decodes += 1
+    self.decode_sum_ms += decode_ms
+    self.decode_max_ms = max(self.decode_max_ms, decode_ms)
+
+  @property
+  def observed_rate_hz(self) -> float:
+    if self.first_received_ns is None or self.last_received_ns is None or self.received < 2:
+      return 0.0
+    return (self.received - 1) / max((self.last_received_ns - self.first_received_ns) / 1e9, 1e-9)
+
+  def latency_percentile_ms(self, percentile: float) -> float:
+    """Upper bound of the histogram bucket holding the percentile, the max latency for the open bucket"""
+    if self.received == 0:
+      return 0.0
+    target = percentile / 100 * self.received
+    count = 0
+    for bucket, bucket_count in enumerate(self.latency_counts):
+      count += bucket_count
+      if count >= target and bucket_count:
+        return LATENCY_BUCKETS_MS[bucket] if bucket < len(LATENCY_BUCKETS_MS) else self.latency_max_ms
+    return self.latency_max_ms
+
+  def summary(self) -> dict:
+    return {
+      "received": self.received,
+      "rate_hz": self.rate_hz,
+      "observed_rate_hz": self.observed_rate_hz,
+      "gaps": self.gaps,
+      "dropped": self.dropped,
+      "latency_mean_ms": self.latency_sum_ms / self.received if self.received else 0.0,
+      "latency_p50_ms": self.latency_percentile_ms(50),
+      "latency_p99_ms": self.latency_percentile_ms(99),
+      "latency_max_ms": self.latency_max_ms,
+      "latency_histogram": dict(zip([*LATENCY_BUCKETS_MS, float("inf")], self.latency_counts, strict=True)),
+      "decodes": self.decodes,
+      "decode_mean_ms": self.decode_sum_ms / self.decodes if self.decodes else 0.0,
+      "decode_max_ms": self.decode_max_ms,
+    }
+
+  def format(self) -> str:
+    summary = self.summary()
+    return (f"{summary['observed_rate_hz']:.1f}/{self.rate_hz} Hz, latency p50 {summary['latency_p50_ms']:.2f} ms "
+            f"p99 {summary['latency_p99_ms']:.2f} ms max {summary['latency_max_ms']:.2f} ms, {self.dropped} dropped in {self.gaps} gaps, "
+            f"decode {summary['decode_mean_ms']:.3f} ms mean")
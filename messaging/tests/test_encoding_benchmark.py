@@ -0,0 +1,65 @@
+import os
+import time
+
+import pytest
+
+import messaging.messenger as messenger
+
+ITERATIONS = 2000
+
+
+def mapbox_settings():
+  msg = messenger.schema.MapboxSettings.new_message()
+  msg.timestamp = 1700000000
+  msg.upcomingTurn = "right"
+  msg.currentSpeedLimit = 13.4
+  msg.bannerInstructions = "Turn right onto Main Street"
+  msg.distanceToNextTurn = 250.0
+  msg.routeProgressPercent = 42.0
+  msg.totalDistanceRemaining = 5300.0
+  msg.totalTimeRemaining = 410.0
+  msg.valid = True
+  maneuvers = msg.init("allManeuvers", 8)
+  for i, maneuver in enumerate(maneuvers):
+    maneuver.distance = 400.0 * i
+    maneuver.type = "turn"
+    maneuver.modifier = "left" if i % 2 else "right"
+  return msg
+
+
+def live_location_kalman():
+  msg = messenger.schema.LiveLocationKalman.new_message()
+  for field, values in (("positionECEF", [4.0e6, -1.2e5, 4.9e6]), ("positionGeodetic", [52.52, 13.40, 34.0]),
+                        ("velocityECEF", [0.0, 0.0, 0.0]), ("calibratedOrientationNED", [0.0, 0.01, 1.57])):
+    measurement = getattr(msg, field)
+    measurement.value = values
+    measurement.std = [0.0, 0.0, 0.0]
+    measurement.valid = True
+  return msg
+
+
+@pytest.mark.skipif(not os.getenv("RUN_BENCHMARK"), reason="not enabled, run export RUN_BENCHMARK=1")
+@pytest.mark.parametrize("build", (mapbox_settings, live_location_kalman))
+def test_encoding_benchmark(build):
+  """Bytes per message and encode/decode cost of the unpacked and packed encodings, to pick a service's encoding"""
+  msg = build()
+  schema_type = getattr(messenger.schema, msg.schema.node.displayName.split(":")[-1])
+  for encoding in messenger.ENCODINGS:
+    publisher = messenger.Publisher(None, 1.0, packed=encoding == "packed")
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+      serialized = publisher.serialize(msg)
+      msg.clear_write_flag()
+    encode_us = (time.perf_counter() - start) / ITERATIONS * 1e6
+
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+      if publisher.packed:
+        schema_type.from_bytes_packed(serialized)
+      else:
+        with schema_type.from_bytes(serialized):
+          pass
+    decode_us = (time.perf_counter() - start) / ITERATIONS * 1e6
+
+    print(f"{build.__name__:>20} {encoding:>8}: {len(serialized):5d} bytes/msg, encode {encode_us:6.2f} us, "
+          f"decode {decode_us:6.2f} us")
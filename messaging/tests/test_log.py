@@ -0,0 +1,77 @@
+import pytest
+
+import messaging.log as log
+from messaging.log import LogReader, LogWriter
+
+
+def write_records(writer, count, start_ns=0, step_ns=1_000_000):
+  records = []
+  for i in range(count):
+    name = "livelocationd" if i % 2 else "navigationd"
+    data = f"message {i}".encode() * 8
+    writer.write(name, data, start_ns + i * step_ns, packed=bool(i % 3 == 0))
+    records.append((start_ns + i * step_ns, name, data, i % 3 == 0))
+  return records
+
+
+def as_tuples(records):
+  return [(record.time_ns, record.name, record.data, record.packed) for record in records]
+
+
+class TestLog:
+  @pytest.mark.parametrize("codec", log.available_codecs())
+  def test_round_trip(self, tmp_path, codec):
+    with LogWriter(tmp_path / "log", codec=codec, chunk_size=512) as writer:
+      records = write_records(writer, 100)
+    assert len(writer.chunks) > 1
+
+    with LogReader(tmp_path / "log") as reader:
+      assert reader.indexed
+      assert [chunk.records for chunk in reader.chunks] == [chunk.records for chunk in writer.chunks]
+      assert reader.services == {"navigationd", "livelocationd"}
+      assert as_tuples(reader.records()) == records
+      assert as_tuples(reader.records(services={"navigationd"})) == [record for record in records if record[1] == "navigationd"]
+      assert reader.start_mono_ns > 0 and reader.start_wall_ns > 0
+
+  def test_chunks_by_time(self, tmp_path, mocker):
+    with LogWriter(tmp_path / "log", chunk_seconds=0.01) as writer:
+      records = write_records(writer, 50)  # 1 ms apart
+      writer.write("navigationd", b"late", 10_000_000_000)
+      writer.flush_due(10_000_000_000)
+      assert writer._records  # the late record's chunk is not due yet
+      writer.flush_due(10_010_000_000)
+      assert not writer._records
+    assert all(chunk.last_ns - chunk.first_ns < 10_000_000 for chunk in writer.chunks)
+
+    with LogReader(tmp_path / "log") as reader:
+      read_chunk = mocker.spy(reader, "read_chunk")
+      assert as_tuples(reader.records(start_ns=40_000_000)) == records[40:] + [(10_000_000_000, "navigationd", b"late", False)]
+      assert all(call.args[0].last_ns >= 40_000_000 for call in read_chunk.call_args_list)  # earlier chunks are skipped through the index
+      assert read_chunk.call_count < len(reader.chunks)
+
+  def test_unclosed_log(self, tmp_path):
+    writer = LogWriter(tmp_path / "log", chunk_size=512)
+    records = write_records(writer, 100)
+    writer.flush()
+    writer._file.close()  # as if the logger crashed before writing the index
+    written = (tmp_path / "log").read_bytes()
+    (tmp_path / "log").write_bytes(written + written[log.FILE_HEADER.size:log.FILE_HEADER.size + 100])  # and a torn chunk
+
+    with LogReader(tmp_path / "log") as reader:
+      assert not reader.indexed
+      assert len(reader.chunks) == len(writer.chunks)
+      assert as_tuples(reader.records()) == records
+      assert reader.services == {"navigationd", "livelocationd"}
+
+  def test_errors(self, tmp_path):
+    LogWriter(tmp_path / "log").close()
+    with pytest.raises(FileExistsError):
+      LogWriter(tmp_path / "log")
+    with pytest.raises(ValueError):
+      LogWriter(tmp_path / "other", codec="brotli")
+
+    (tmp_path / "text").write_text("not a log")
+    with pytest.raises(ValueError):
+      LogReader(tmp_path / "text")
+    with LogReader(tmp_path / "log") as reader:
+      assert reader.chunks == [] and reader.services == set()
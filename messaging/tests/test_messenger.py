@@ -1,12 +1,21 @@
+import threading
 import time
 import tempfile
 import os
 
 import pytest
+import zmq
 
 import messaging.messenger as messenger
 
 
+def receiver_stopped(timeout=1.0):
+  deadline = time.monotonic() + timeout
+  while any(thread.name == "messenger-receiver" for thread in threading.enumerate()) and time.monotonic() < deadline:
+    time.sleep(0.01)
+  return not any(thread.name == "messenger-receiver" for thread in threading.enumerate())
+
+
 class TestMessenger:
   def setup_method(self):
     self.instances: list = []
@@ -21,6 +30,7 @@ class TestMessenger:
     assert "navigationd" in registry
     assert registry["navigationd"]["rate_hz"] == 3
     assert registry["navigationd"]["schema_type"] == messenger.schema.MapboxSettings
+    assert registry["livelocationd"]["conflate"]
 
   def test_sub_and_pub_master_init(self):
     pub = messenger.PubMaster("navigationd")
@@ -128,3 +138,429 @@ services:
     with sub._lock:
       sub.services["navigationd"]["received_at"] = time.monotonic() - sub.services["navigationd"]["timeout_seconds"]
     assert not sub.alive["navigationd"]
+
+  def test_lazy_decode(self, mocker):
+    pub = messenger.PubMaster("navigationd")
+    self.instances.append(pub)
+    sub = messenger.SubMaster("navigationd")
+    self.instances.append(sub)
+    time.sleep(0.01)
+    decode = mocker.spy(sub, "_update_cached_msg")
+
+    for timestamp in range(20):
+      msg = messenger.schema.MapboxSettings.new_message()
+      msg.timestamp = timestamp
+      pub.send('navigationd', msg)
+    time.sleep(0.05)
+    assert decode.call_count == 0  # nothing is decoded until read
+
+    assert sub["navigationd"].timestamp == 19
+    assert sub["navigationd"].timestamp == 19
+    assert decode.call_count == 1  # once per new message, however often it is read
+
+    msg = messenger.schema.MapboxSettings.new_message()
+    msg.timestamp = 20
+    pub.send('navigationd', msg)
+    time.sleep(0.01)
+    assert sub["navigationd"].timestamp == 20
+    assert decode.call_count == 2
+
+  def test_conflate(self):
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as file:
+      file.write("""
+services:
+- name: queued
+  rate_hz: 5
+  schema: MapboxSettings
+- name: conflated
+  rate_hz: 5
+  schema: MapboxSettings
+  conflate: true
+""")
+      temp_path = file.name
+
+    try:
+      assert not messenger.load_registry(temp_path)["queued"]["conflate"]
+      pub = messenger.PubMaster(["queued", "conflated"], registry_path=temp_path)
+      self.instances.append(pub)
+      sub = messenger.SubMaster(["queued", "conflated"], registry_path=temp_path)
+      self.instances.append(sub)
+      time.sleep(0.01)
+      assert sub.services["conflated"]["socket"].getsockopt(zmq.CONFLATE) == 1
+      assert sub.services["queued"]["socket"].getsockopt(zmq.CONFLATE) == 0
+
+      for timestamp in range(50):
+        for name in ("queued", "conflated"):
+          msg = messenger.schema.MapboxSettings.new_message()
+          msg.timestamp = timestamp
+          pub.send(name, msg)
+      time.sleep(0.05)
+      assert sub["queued"].timestamp == 49
+      assert sub["conflated"].timestamp == 49
+    finally:
+      os.unlink(temp_path)
+
+  def test_shm_transport(self):
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as file:
+      file.write("""
+services:
+- name: shm_service
+  rate_hz: 5
+  schema: MapboxSettings
+  transport: shm
+  shm_slots: 4
+  shm_slot_size: 4096
+""")
+      temp_path = file.name
+
+    try:
+      pub = messenger.PubMaster("shm_service", registry_path=temp_path)
+      self.instances.append(pub)
+      sub = messenger.SubMaster("shm_service", registry_path=temp_path)
+      self.instances.append(sub)
+      time.sleep(0.01)
+      assert sub["shm_service"] is None
+
+      for timestamp in range(10):
+        msg = messenger.schema.MapboxSettings.new_message()
+        msg.timestamp = timestamp
+        msg.bannerInstructions = f"Continue for {timestamp} meters"
+        pub.send("shm_service", msg)
+      time.sleep(0.01)
+
+      received = sub["shm_service"]
+      assert received is not None
+      assert received.timestamp == 9
+      assert received.bannerInstructions == "Continue for 9 meters"
+      assert len(sub.services["shm_service"]["last_data"]) == messenger.STAMP.size  # only the doorbell went over ZMQ
+    finally:
+      os.unlink(temp_path)
+
+  def test_unknown_transport(self):
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as file:
+      file.write("""
+services:
+- name: service1
+  rate_hz: 5
+  schema: MapboxSettings
+  transport: carrier_pigeon
+""")
+      temp_path = file.name
+
+    try:
+      with pytest.raises(ValueError):
+        messenger.load_registry(temp_path)
+    finally:
+      os.unlink(temp_path)
+
+  def test_packed_encoding(self):
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as file:
+      file.write("""
+services:
+- name: packed
+  rate_hz: 5
+  schema: MapboxSettings
+  encoding: packed
+- name: packed_shm
+  rate_hz: 5
+  schema: MapboxSettings
+  encoding: packed
+  transport: shm
+  shm_slot_size: 4096
+""")
+      temp_path = file.name
+
+    try:
+      pub = messenger.PubMaster(["packed", "packed_shm"], registry_path=temp_path)
+      self.instances.append(pub)
+      sub = messenger.SubMaster(["packed", "packed_shm"], registry_path=temp_path)
+      self.instances.append(sub)
+      time.sleep(0.01)
+
+      for name in ("packed", "packed_shm"):
+        msg = messenger.schema.MapboxSettings.new_message(timestamp=1, bannerInstructions="Turn left")
+        pub.send(name, msg)
+        assert sub.wait_for(name, timeout=1.0)
+        assert sub[name].timestamp == 1
+        assert sub[name].bannerInstructions == "Turn left"
+
+        pub.send_many(name, [messenger.schema.MapboxSettings.new_message(timestamp=timestamp) for timestamp in range(2, 5)])
+        assert sub.wait_for(name, timeout=1.0)
+        assert sub[name].timestamp == 4
+        assert sub.frame_counts[name] == 4
+
+      unpacked_size = len(messenger.schema.MapboxSettings.new_message(timestamp=4).to_bytes())
+      assert len(sub.services["packed"]["last_data"]) < messenger.STAMP.size + unpacked_size
+    finally:
+      os.unlink(temp_path)
+
+  def test_unknown_encoding(self):
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as file:
+      file.write("""
+services:
+- name: service1
+  rate_hz: 5
+  schema: MapboxSettings
+  encoding: zipped
+""")
+      temp_path = file.name
+
+    try:
+      with pytest.raises(ValueError):
+        messenger.load_registry(temp_path)
+    finally:
+      os.unlink(temp_path)
+
+  def test_update(self):
+    pub = messenger.PubMaster("navigationd")
+    self.instances.append(pub)
+    sub = messenger.SubMaster("navigationd")
+    self.instances.append(sub)
+    time.sleep(0.01)
+    assert not sub.update(timeout=0.02)
+    assert sub.updated == {"navigationd": False}
+
+    msg = messenger.schema.MapboxSettings.new_message()
+    msg.timestamp = 1
+    pub.send("navigationd", msg)
+    assert sub.update(timeout=1.0)
+    assert sub.updated == {"navigationd": True}
+    assert sub["navigationd"].timestamp == 1
+    assert sub.frame_counts == {"navigationd": 1}
+
+    assert not sub.update(timeout=0)  # nothing new since the last update
+    assert sub.updated == {"navigationd": False}
+
+  def test_wait_for(self):
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as file:
+      file.write("""
+services:
+- name: service1
+  rate_hz: 5
+  schema: MapboxSettings
+- name: service2
+  rate_hz: 5
+  schema: MapboxSettings
+""")
+      temp_path = file.name
+
+    try:
+      pub = messenger.PubMaster(["service1", "service2"], registry_path=temp_path)
+      self.instances.append(pub)
+      sub = messenger.SubMaster(["service1", "service2"], registry_path=temp_path)
+      self.instances.append(sub)
+      time.sleep(0.01)
+
+      pub.send("service2", messenger.schema.MapboxSettings.new_message())
+      assert not sub.wait_for("service1", timeout=0.05)
+      assert sub.updated == {"service1": False, "service2": True}
+
+      sender = threading.Timer(0.05, lambda: pub.send("service1", messenger.schema.MapboxSettings.new_message()))
+      sender.start()
+      start = time.monotonic()
+      assert sub.wait_for("service1", timeout=2.0)
+      assert time.monotonic() - start < 1.0
+      assert sub.updated == {"service1": True, "service2": False}
+      sender.join()
+
+      with pytest.raises(KeyError):
+        sub.wait_for("unknown_service")
+    finally:
+      os.unlink(temp_path)
+
+  def test_close_wakes_waiters(self):
+    sub = messenger.SubMaster("navigationd")
+    closer = threading.Timer(0.05, sub.close)
+    closer.start()
+    start = time.monotonic()
+    assert not sub.update()
+    assert time.monotonic() - start < 1.0
+    closer.join()
+
+  def test_stats(self):
+    pub = messenger.PubMaster("navigationd")
+    self.instances.append(pub)
+    sub = messenger.SubMaster("navigationd", stats=True)
+    self.instances.append(sub)
+    plain = messenger.SubMaster("navigationd", stats=False)
+    self.instances.append(plain)
+    time.sleep(0.01)
+
+    for timestamp in range(5):
+      msg = messenger.schema.MapboxSettings.new_message()
+      msg.timestamp = timestamp
+      pub.send("navigationd", msg)
+      assert sub.wait_for("navigationd", timeout=1.0)
+      assert sub["navigationd"].timestamp == timestamp
+    pub["navigationd"].seq += 3  # as if three messages were lost before reaching the socket
+    pub.send("navigationd", messenger.schema.MapboxSettings.new_message())
+    assert sub.wait_for("navigationd", timeout=1.0)
+
+    stats = sub.stats["navigationd"]
+    assert stats["received"] == 6
+    assert (stats["gaps"], stats["dropped"]) == (1, 3)
+    assert stats["decodes"] == 5
+    assert 0 < stats["latency_mean_ms"] < 1000
+    assert stats["rate_hz"] == 3
+    assert plain.stats == {}
+    assert plain["navigationd"] is not None
+
+  def test_frame_messages(self):
+    messages = [messenger.schema.MapboxSettings.new_message(timestamp=timestamp).to_bytes() for timestamp in range(3)]
+    frame = messenger.pack_frame(7, messages)
+    seq, _, count, _ = messenger.STAMP.unpack_from(frame)
+    assert (seq, count) == (7, 3)
+    assert [bytes(message) for message in messenger.frame_messages(frame)] == messages
+    with messenger.schema.MapboxSettings.from_bytes(messenger.message_buffer(frame)) as msg:
+      assert msg.timestamp == 2
+
+    single = messenger.pack_frame(0, messages[:1])
+    assert len(single) == messenger.STAMP.size + len(messages[0])
+    assert [bytes(message) for message in messenger.frame_messages(single)] == messages[:1]
+
+  def test_send_many(self):
+    pub = messenger.PubMaster("navigationd")
+    self.instances.append(pub)
+    sub = messenger.SubMaster("navigationd", stats=True)
+    self.instances.append(sub)
+    time.sleep(0.01)
+
+    pub.send_many("navigationd", [messenger.schema.MapboxSettings.new_message(timestamp=timestamp) for timestamp in range(5)])
+    assert sub.wait_for("navigationd", timeout=1.0)
+    assert sub["navigationd"].timestamp == 4
+    assert sub.frame_counts == {"navigationd": 5}
+    stats = sub.stats["navigationd"]
+    assert (stats["received"], stats["dropped"]) == (5, 0)
+
+    pub.send("navigationd", messenger.schema.MapboxSettings.new_message(timestamp=5))
+    assert sub.wait_for("navigationd", timeout=1.0)
+    assert sub["navigationd"].timestamp == 5
+    assert sub.stats["navigationd"]["dropped"] == 0
+
+  def test_batched_service(self):
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as file:
+      file.write("""
+services:
+- name: batched
+  rate_hz: 1000
+  schema: MapboxSettings
+  batch_size: 4
+  batch_latency_ms: 50
+- name: batched_shm
+  rate_hz: 1000
+  schema: MapboxSettings
+  transport: shm
+  shm_slot_size: 4096
+  batch_size: 4
+  batch_latency_ms: 50
+""")
+      temp_path = file.name
+
+    try:
+      pub = messenger.PubMaster(["batched", "batched_shm"], registry_path=temp_path)
+      self.instances.append(pub)
+      sub = messenger.SubMaster(["batched", "batched_shm"], registry_path=temp_path)
+      self.instances.append(sub)
+      time.sleep(0.01)
+
+      for name in ("batched", "batched_shm"):
+        for timestamp in range(4):  # a full batch goes out at once
+          pub.send(name, messenger.schema.MapboxSettings.new_message(timestamp=timestamp))
+        assert sub.wait_for(name, timeout=1.0)
+        assert sub[name].timestamp == 3
+        assert sub.frame_counts[name] == 4
+
+        start = time.monotonic()
+        pub.send(name, messenger.schema.MapboxSettings.new_message(timestamp=4))
+        assert not sub.wait_for(name, timeout=0.01)  # buffered until the batch latency passes
+        assert sub.wait_for(name, timeout=1.0)
+        assert time.monotonic() - start >= 0.05
+        assert sub[name].timestamp == 4
+        assert sub.frame_counts[name] == 5
+
+      pub.send("batched", messenger.schema.MapboxSettings.new_message(timestamp=5))
+      pub.flush("batched")
+      assert sub.wait_for("batched", timeout=0.02)
+      assert sub["batched"].timestamp == 5
+
+      pub.send("batched", messenger.schema.MapboxSettings.new_message(timestamp=6))
+      pub.close()  # sends what is still buffered
+      assert sub.wait_for("batched", timeout=1.0)
+      assert sub["batched"].timestamp == 6
+    finally:
+      os.unlink(temp_path)
+
+  @pytest.mark.filterwarnings("ignore:This process .* is multi-threaded:DeprecationWarning")  # ZMQ's I/O threads
+  def test_fork_leaves_inherited_pub_master_alone(self):
+    assert receiver_stopped()  # fork without other threads running
+    pub = messenger.PubMaster("navigationd")
+    self.instances.append(pub)
+
+    pid = os.fork()
+    if pid == 0:  # dropping the parent's PubMaster must not terminate the child's own context, which would hang
+      status = 1
+      try:
+        child_pub = messenger.PubMaster("livelocationd")
+        pub.close()  # as dropping it does
+        child_pub.send("livelocationd", messenger.schema.LiveLocationKalman.new_message())
+        child_pub.close()
+        status = 0
+      finally:
+        os._exit(status)
+
+    deadline = time.monotonic() + 5.0
+    while (waited := os.waitpid(pid, os.WNOHANG))[0] == 0 and time.monotonic() < deadline:
+      time.sleep(0.01)
+    if waited[0] == 0:
+      os.kill(pid, 9)
+      os.waitpid(pid, 0)
+    assert waited[0] == pid and os.waitstatus_to_exitcode(waited[1]) == 0
+
+    sub = messenger.SubMaster("navigationd")
+    self.instances.append(sub)
+    time.sleep(0.01)
+    msg = messenger.schema.MapboxSettings.new_message()
+    msg.timestamp = 7
+    pub.send("navigationd", msg)  # the parent's PubMaster still works
+    assert sub.wait_for("navigationd", timeout=1.0)
+    assert sub["navigationd"].timestamp == 7
+
+  def test_shared_runtime(self):
+    assert receiver_stopped()  # the thread of earlier tests exits shortly after their SubMasters closed
+    threads = threading.active_count()
+    pub = messenger.PubMaster("navigationd")
+    self.instances.append(pub)
+    subs = [messenger.SubMaster("navigationd") for _ in range(5)]
+    self.instances.extend(subs)
+    pubs = [messenger.PubMaster("livelocationd")]
+    self.instances.extend(pubs)
+    assert threading.active_count() <= threads + 1  # at most the receiver thread, once per process
+    assert len({sub.context for sub in subs} | {pub.context for pub in pubs}) == 1
+    assert len({id(sub.registry) for sub in subs}) == 1
+    assert messenger.load_registry() is messenger.load_registry("messaging/services.yaml")
+
+    time.sleep(0.01)
+    msg = messenger.schema.MapboxSettings.new_message()
+    msg.timestamp = 42
+    pub.send("navigationd", msg)
+    for sub in subs:
+      assert sub.wait_for("navigationd", timeout=1.0)
+      assert sub["navigationd"].timestamp == 42
+
+    subs[0].close()
+    msg = messenger.schema.MapboxSettings.new_message()
+    msg.timestamp = 43
+    pub.send("navigationd", msg)
+    assert subs[1].wait_for("navigationd", timeout=1.0)
+    assert subs[1]["navigationd"].timestamp == 43
+    assert subs[0].frame_counts == {"navigationd": 1}
+
+    for sub in subs[1:]:
+      sub.close()
+    assert receiver_stopped()
+
+    sub = messenger.SubMaster("navigationd")  # starts a new receiver
+    self.instances.append(sub)
+    time.sleep(0.01)
+    pub.send("navigationd", messenger.schema.MapboxSettings.new_message())
+    assert sub.wait_for("navigationd", timeout=1.0)
@@ -0,0 +1,76 @@
+import pytest
+
+from messaging.shm import HEADER_SIZE, SLOT_HEADER, STAMP, ShmRing
+
+
+class TestShmRing:
+  def setup_method(self):
+    self.rings: list = []
+
+  def teardown_method(self):
+    for ring in self.rings:
+      ring.close()
+
+  def create(self, path, **kwargs):
+    ring = ShmRing.create(str(path), **kwargs)
+    self.rings.append(ring)
+    return ring
+
+  def open(self, path):
+    ring = ShmRing.open(str(path))
+    if ring is not None:
+      self.rings.append(ring)
+    return ring
+
+  def test_open_before_writer(self, tmp_path):
+    assert self.open(tmp_path / "ring") is None
+
+  def test_read_latest(self, tmp_path):
+    writer = self.create(tmp_path / "ring", slots=4, slot_size=64)
+    reader = self.open(tmp_path / "ring")
+    assert reader.read_latest() is None
+    assert (reader.slots, reader.slot_size) == (4, 64)
+
+    for seq in range(10):  # wraps around the ring twice
+      assert writer.write(f"message {seq}".encode()) == seq
+      assert reader.read_latest() == (seq, f"message {seq}".encode())
+
+  def test_read(self, tmp_path):
+    writer = self.create(tmp_path / "ring", slots=4, slot_size=64)
+    reader = self.open(tmp_path / "ring")
+    assert reader.read(0) is None
+
+    for seq in range(6):
+      writer.write(f"message {seq}".encode())
+    assert [reader.read(seq) for seq in range(2, 6)] == [f"message {seq}".encode() for seq in range(2, 6)]
+    assert reader.read(1) is None  # overwritten
+    assert reader.read(6) is None  # not written yet
+
+  def test_restarted_writer(self, tmp_path):
+    writer = self.create(tmp_path / "ring", slots=4, slot_size=64)
+    for seq in range(6):
+      writer.write(bytes([seq]))
+    reader = self.open(tmp_path / "ring")
+    restarted = self.create(tmp_path / "ring", slots=4, slot_size=64)
+    assert reader.read_latest() is None
+    restarted.write(b"again")
+    assert reader.read_latest() == (0, b"again")
+
+  def test_skips_slot_being_written(self, tmp_path):
+    writer = self.create(tmp_path / "ring", slots=4, slot_size=64)
+    reader = self.open(tmp_path / "ring")
+    writer.write(b"first")
+    STAMP.pack_into(writer._mm, HEADER_SIZE, 2 * 0 + 1)  # writer interrupted while rewriting slot 0
+    assert reader.read_latest() is None
+    SLOT_HEADER.pack_into(writer._mm, HEADER_SIZE, 2 * 0 + 2, 5)
+    assert reader.read_latest() == (0, b"first")
+
+  def test_errors(self, tmp_path):
+    writer = self.create(tmp_path / "ring", slots=2, slot_size=8)
+    with pytest.raises(ValueError):
+      writer.write(b"too long for a slot")
+    with pytest.raises(ValueError):
+      self.create(tmp_path / "single", slots=1)
+    (tmp_path / "other").write_bytes(b"\0" * 128)
+    with pytest.raises(ValueError):
+      self.open(tmp_path / "other")
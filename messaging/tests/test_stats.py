@@ -0,0 +1,47 @@
+import pytest
+
+from messaging.stats import LATENCY_BUCKETS_MS, ServiceStats
+
+
+class TestServiceStats:
+  def test_empty(self):
+    summary = ServiceStats(20).summary()
+    assert summary["received"] == 0
+    assert summary["observed_rate_hz"] == 0.0
+    assert summary["latency_p99_ms"] == 0.0
+
+  def test_rate_and_latency(self):
+    stats = ServiceStats(20)
+    for seq in range(21):
+      sent_ns = seq * 50_000_000
+      stats.record_receive(seq, sent_ns, sent_ns + (3_000_000 if seq == 20 else 200_000))
+    summary = stats.summary()
+    assert summary["observed_rate_hz"] == pytest.approx(20, rel=0.01)
+    assert summary["latency_p50_ms"] == 0.25
+    assert summary["latency_p99_ms"] == 5.0
+    assert summary["latency_max_ms"] == pytest.approx(3.0)
+    assert summary["latency_histogram"][0.25] == 20 and sum(summary["latency_histogram"].values()) == 21
+    assert summary["latency_histogram"][float("inf")] == 0
+
+  def test_open_bucket_reports_max(self):
+    stats = ServiceStats(20)
+    stats.record_receive(0, 0, int((LATENCY_BUCKETS_MS[-1] + 100) * 1e6))
+    assert stats.latency_percentile_ms(99) == pytest.approx(LATENCY_BUCKETS_MS[-1] + 100)
+
+  def test_gaps(self):
+    stats = ServiceStats(20)
+    for seq in (0, 1, 4, 5, 9):
+      stats.record_receive(seq, 0, 0)
+    assert (stats.gaps, stats.dropped) == (2, 5)
+    stats.record_receive(0, 0, 0)  # restarted publisher
+    stats.record_receive(1, 0, 0)
+    assert (stats.gaps, stats.dropped) == (2, 5)
+
+  def test_decode(self):
+    stats = ServiceStats(20)
+    stats.record_decode(0.001)
+    stats.record_decode(0.003)
+    summary = stats.summary()
+    assert summary["decodes"] == 2
+    assert summary["decode_mean_ms"] == pytest.approx(2.0)
+    assert summary["decode_max_ms"] == pytest.approx(3.0)
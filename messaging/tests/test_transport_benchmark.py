@@ -0,0 +1,106 @@
+import os
+import statistics
+import tempfile
+import time
+
+import pytest
+
+import messaging.messenger as messenger
+
+PAYLOAD_SIZES = (1024, 64 * 1024, 192 * 1024)
+MESSAGES = 500
+
+
+def wait_for_message(sub, name, marker, timeout=1.0):
+  """Waits until the latest NavRoute message carries marker as its totalDistance, returns the time it was seen"""
+  deadline = time.perf_counter() + timeout
+  while (remaining := deadline - time.perf_counter()) > 0:
+    sub.wait_for(name, timeout=remaining)
+    received = sub[name]
+    if received is not None and received.totalDistance == marker:
+      return time.perf_counter()
+  raise TimeoutError(f"{name} did not receive message {marker}")
+
+
+@pytest.mark.skipif(not os.getenv("RUN_BENCHMARK"), reason="not enabled, run export RUN_BENCHMARK=1")
+@pytest.mark.parametrize("transport", messenger.TRANSPORTS)
+def test_transport_benchmark(transport):
+  """Publish to receive latency and publish throughput of a transport for a few payload sizes"""
+  name = f"benchmark_{transport}"
+  with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as file:
+    file.write(f"""
+services:
+- name: {name}
+  rate_hz: 100
+  schema: NavRoute
+  transport: {transport}
+""")
+    registry_path = file.name
+
+  pub = messenger.PubMaster(name, registry_path=registry_path)
+  sub = messenger.SubMaster(name, registry_path=registry_path)
+  try:
+    time.sleep(0.05)
+    for size in PAYLOAD_SIZES:
+      payload = bytes(size)
+      latencies = []
+      for marker in range(1, MESSAGES + 1):
+        msg = messenger.schema.NavRoute.new_message()
+        msg.geometry = payload
+        msg.totalDistance = marker
+        sent = time.perf_counter()
+        pub.send(name, msg)
+        latencies.append(wait_for_message(sub, name, marker) - sent)
+
+      start = time.perf_counter()
+      for _ in range(MESSAGES):
+        msg = messenger.schema.NavRoute.new_message()
+        msg.geometry = payload
+        pub.send(name, msg)
+      throughput = MESSAGES / (time.perf_counter() - start)
+
+      latencies.sort()
+      print(f"{transport} {size // 1024:4d} KiB: latency median {statistics.median(latencies) * 1e6:7.1f} us, "
+            f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:7.1f} us, publish {throughput:8.0f} msg/s")
+  finally:
+    sub.close()
+    pub.close()
+    os.unlink(registry_path)
+
+
+@pytest.mark.skipif(not os.getenv("RUN_BENCHMARK"), reason="not enabled, run export RUN_BENCHMARK=1")
+@pytest.mark.parametrize("batch_size", (1, 16, 64))
+def test_batch_benchmark(batch_size):
+  """Publish throughput and delivery of small high-rate messages, one frame per message against batched frames"""
+  name = f"benchmark_batch_{batch_size}"
+  with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as file:
+    file.write(f"""
+services:
+- name: {name}
+  rate_hz: 1000
+  schema: NavRoute
+  batch_size: {batch_size}
+  batch_latency_ms: 5
+""")
+    registry_path = file.name
+
+  pub = messenger.PubMaster(name, registry_path=registry_path)
+  sub = messenger.SubMaster(name, registry_path=registry_path)
+  try:
+    time.sleep(0.05)
+    messages = MESSAGES * 20
+    start = time.perf_counter()
+    for marker in range(1, messages + 1):
+      msg = messenger.schema.NavRoute.new_message()
+      msg.totalDistance = marker
+      pub.send(name, msg)
+    pub.flush(name)
+    throughput = messages / (time.perf_counter() - start)
+    wait_for_message(sub, name, messages)
+    received = sub.frame_counts[name]
+
+    print(f"batch {batch_size:3d}: publish {throughput:8.0f} msg/s, {received}/{messages} messages delivered")
+  finally:
+    sub.close()
+    pub.close()
+    os.unlink(registry_path)
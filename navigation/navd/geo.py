@@ -0,0 +1,71 @@
+'''Vectorized geodesic utilities.
+
+Every function takes NumPy arrays (or scalars) and broadcasts like a ufunc. Public functions take degrees; the
+*_rad variants take radians with cos(latitude) precomputed, for hot paths that reuse the same points every query.
+haversine_scalar is the same formula on plain floats, for single distances where NumPy call overhead dominates.
+'''
+import math
+
+import numpy as np
+
+EARTH_MEAN_RADIUS = 6371007.2
+
+ArrayLike = np.ndarray | float
+
+
+def haversine_rad(lat1: ArrayLike, lon1: ArrayLike, cos_lat1: ArrayLike, lat2: ArrayLike, lon2: ArrayLike, cos_lat2: ArrayLike) -> np.ndarray:
+  '''Great circle distance in meters between points in radians'''
+  haversine_dlat = np.sin((lat2 - lat1) / 2.0)
+  haversine_dlon = np.sin((lon2 - lon1) / 2.0)
+  y = haversine_dlat * haversine_dlat + cos_lat1 * cos_lat2 * haversine_dlon * haversine_dlon
+  return np.asarray(2.0 * np.arcsin(np.sqrt(np.minimum(y, 1.0))) * EARTH_MEAN_RADIUS)
+
+
+def haversine(lat1: ArrayLike, lon1: ArrayLike, lat2: ArrayLike, lon2: ArrayLike) -> np.ndarray:
+  '''Great circle distance in meters between points in degrees'''
+  lat1, lat2 = np.radians(lat1), np.radians(lat2)
+  return haversine_rad(lat1, np.radians(lon1), np.cos(lat1), lat2, np.radians(lon2), np.cos(lat2))
+
+
+def haversine_scalar(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+  '''Great circle distance in meters between two points in degrees'''
+  haversine_dlat = math.sin(math.radians(lat2 - lat1) / 2.0)
+  haversine_dlon = math.sin(math.radians(lon2 - lon1) / 2.0)
+  y = haversine_dlat * haversine_dlat + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * haversine_dlon * haversine_dlon
+  return 2.0 * math.asin(math.sqrt(min(y, 1.0))) * EARTH_MEAN_RADIUS
+
+
+def bearing(lat1: ArrayLike, lon1: ArrayLike, lat2: ArrayLike, lon2: ArrayLike) -> np.ndarray:
+  '''Initial bearing in degrees [0, 360) of the great circle from point 1 to point 2'''
+  lat1, lat2 = np.radians(lat1), np.radians(lat2)
+  dlon = np.radians(lon2) - np.radians(lon1)
+  y = np.sin(dlon) * np.cos(lat2)
+  x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+  return np.asarray(np.degrees(np.arctan2(y, x)) % 360.0)
+
+
+def cross_track_distance(lat: ArrayLike, lon: ArrayLike, lat1: ArrayLike, lon1: ArrayLike, lat2: ArrayLike, lon2: ArrayLike) -> np.ndarray:
+  '''Signed distance in meters from a point to the great circle through points 1 and 2, positive to the right'''
+  angular_distance = haversine(lat1, lon1, lat, lon) / EARTH_MEAN_RADIUS
+  dtheta = np.radians(bearing(lat1, lon1, lat, lon) - bearing(lat1, lon1, lat2, lon2))
+  return np.asarray(np.arcsin(np.clip(np.sin(angular_distance) * np.sin(dtheta), -1.0, 1.0)) * EARTH_MEAN_RADIUS)
+
+
+def along_track_distance(lat: ArrayLike, lon: ArrayLike, lat1: ArrayLike, lon1: ArrayLike, lat2: ArrayLike, lon2: ArrayLike) -> np.ndarray:
+  '''Signed distance in meters from point 1 towards point 2 of a point's projection onto their great circle'''
+  angular_distance = haversine(lat1, lon1, lat, lon) / EARTH_MEAN_RADIUS
+  dtheta = np.radians(bearing(lat1, lon1, lat, lon) - bearing(lat1, lon1, lat2, lon2))
+  cross_track = np.arcsin(np.clip(np.sin(angular_distance) * np.sin(dtheta), -1.0, 1.0))
+  along_track = np.arccos(np.clip(np.cos(angular_distance) / np.cos(cross_track), -1.0, 1.0))
+  return np.asarray(np.copysign(along_track, np.cos(dtheta)) * EARTH_MEAN_RADIUS)
+
+
+def local_enu_rad(lat: ArrayLike, lon: ArrayLike, lat0: float, lon0: float, cos_lat0: float) -> tuple[np.ndarray, np.ndarray]:
+  '''East and north offsets in meters of points in radians from an origin, equirectangular around the origin'''
+  return np.asarray((lon - lon0) * cos_lat0 * EARTH_MEAN_RADIUS), np.asarray((lat - lat0) * EARTH_MEAN_RADIUS)
+
+
+def local_enu(lat: ArrayLike, lon: ArrayLike, lat0: float, lon0: float) -> tuple[np.ndarray, np.ndarray]:
+  '''East and north offsets in meters of points in degrees from an origin, accurate within a few kilometers'''
+  lat0_rad = np.radians(lat0)
+  return local_enu_rad(np.radians(lat), np.radians(lon), lat0_rad, np.radians(lon0), float(np.cos(lat0_rad)))
@@ -1,17 +1,17 @@
 from __future__ import annotations
 
 import json
-import math
 import numpy as np
+from collections.abc import Iterator
 from typing import Any, cast
 
 from common.params.params import Params
 from navigation.common.constants import CV
+from navigation.navd import geo
 
 DIRECTIONS = ('left', 'right', 'straight')
 MODIFIABLE_DIRECTIONS = ('left', 'right')
 
-EARTH_MEAN_RADIUS = 6371007.2
 SPEED_CONVERSIONS = {
   'km/h': CV.KPH_TO_MS,
   'mph': CV.MPH_TO_MS,
@@ -19,10 +19,11 @@ SPEED_CONVERSIONS = {
 
 
 class Coordinate:
+  __slots__ = ('latitude', 'longitude')
+
   def __init__(self, latitude: float, longitude: float) -> None:
     self.latitude = latitude
     self.longitude = longitude
-    self.annotations: dict[str, float] = {}
 
   @classmethod
   def from_mapbox_tuple(cls, t: tuple[float, float]) -> Coordinate:
@@ -55,18 +56,51 @@ class Coordinate:
     return self.latitude * other.latitude + self.longitude * other.longitude
 
   def distance_to(self, other: Coordinate) -> float:
-    # Haversine formula
-    dlat = math.radians(other.latitude - self.latitude)
-    dlon = math.radians(other.longitude - self.longitude)
+    return geo.haversine_scalar(self.latitude, self.longitude, other.latitude, other.longitude)
+
+
+class RouteGeometry:
+  '''Route polyline stored as contiguous float64 latitude and longitude arrays in degrees.
+
+  Indexing returns a Coordinate and slicing returns a RouteGeometry viewing the same arrays, so a route costs
+  16 bytes per point instead of one Python object per point.
+  '''
+
+  __slots__ = ('latitudes', 'longitudes')
+
+  def __init__(self, latitudes: np.ndarray, longitudes: np.ndarray) -> None:
+    self.latitudes = np.asarray(latitudes, dtype=np.float64)
+    self.longitudes = np.asarray(longitudes, dtype=np.float64)
+    if self.latitudes.shape != self.longitudes.shape or self.latitudes.ndim != 1:
+      raise ValueError('latitudes and longitudes must be 1-D arrays of the same length')
+
+  @classmethod
+  def from_dicts(cls, points: list[dict[str, float]]) -> RouteGeometry:
+    '''Builds a geometry from {'latitude', 'longitude'} dicts as stored in the MapboxSettings param'''
+    count = len(points)
+    return cls(np.fromiter((point['latitude'] for point in points), dtype=np.float64, count=count),
+               np.fromiter((point['longitude'] for point in points), dtype=np.float64, count=count))
+
+  @classmethod
+  def from_coordinates(cls, coordinates: list[Coordinate]) -> RouteGeometry:
+    count = len(coordinates)
+    return cls(np.fromiter((coord.latitude for coord in coordinates), dtype=np.float64, count=count),
+               np.fromiter((coord.longitude for coord in coordinates), dtype=np.float64, count=count))
+
+  def __len__(self) -> int:
+    return len(self.latitudes)
 
-    haversine_dlat = math.sin(dlat / 2.0)
-    haversine_dlat *= haversine_dlat
-    haversine_dlon = math.sin(dlon / 2.0)
-    haversine_dlon *= haversine_dlon
+  def __getitem__(self, idx):
+    if isinstance(idx, slice):
+      return RouteGeometry(self.latitudes[idx], self.longitudes[idx])
+    return Coordinate(float(self.latitudes[idx]), float(self.longitudes[idx]))
 
-    y = haversine_dlat + math.cos(math.radians(self.latitude)) * math.cos(math.radians(other.latitude)) * haversine_dlon
-    x = 2 * math.asin(math.sqrt(y))
-    return x * EARTH_MEAN_RADIUS
+  def __iter__(self) -> Iterator[Coordinate]:
+    for latitude, longitude in zip(self.latitudes.tolist(), self.longitudes.tolist(), strict=True):
+      yield Coordinate(latitude, longitude)
+
+  def __repr__(self) -> str:
+    return f'RouteGeometry({len(self)} points)'
 
 
 def minimum_distance(a: Coordinate, b: Coordinate, p: Coordinate):
@@ -80,27 +114,26 @@ def minimum_distance(a: Coordinate, b: Coordinate, p: Coordinate):
   return projection.distance_to(p)
 
 
-def distance_along_geometry(geometry: list[Coordinate], pos: Coordinate) -> float:
+def distance_along_geometry(geometry: list[Coordinate] | RouteGeometry, pos: Coordinate) -> float:
   if len(geometry) <= 2:
     return geometry[0].distance_to(pos)
 
+  if not isinstance(geometry, RouteGeometry):
+    geometry = RouteGeometry.from_coordinates(geometry)
+  lat, lon = geometry.latitudes, geometry.longitudes
+
   # 1. Find segment that is closest to current position
   # 2. Total distance is sum of distance to start of closest segment
   #    + all previous segments
-  total_distance = 0.0
-  total_distance_closest = 0.0
-  closest_distance = 1e9
-
-  for i in range(len(geometry) - 1):
-    d = minimum_distance(geometry[i], geometry[i + 1], pos)
-
-    if d < closest_distance:
-      closest_distance = d
-      total_distance_closest = total_distance + geometry[i].distance_to(pos)
-
-    total_distance += geometry[i].distance_to(geometry[i + 1])
-
-  return total_distance_closest
+  segment_lengths = geo.haversine(lat[:-1], lon[:-1], lat[1:], lon[1:])
+  dlat, dlon = np.diff(lat), np.diff(lon)
+  length_sq = dlat * dlat + dlon * dlon
+  t = np.clip(((pos.latitude - lat[:-1]) * dlat + (pos.longitude - lon[:-1]) * dlon) / np.where(length_sq > 0.0, length_sq, 1.0), 0.0, 1.0)
+  start_distances = geo.haversine(lat[:-1], lon[:-1], pos.latitude, pos.longitude)
+  distances = np.where(segment_lengths < 0.01, start_distances, geo.haversine(lat[:-1] + dlat * t, lon[:-1] + dlon * t, pos.latitude, pos.longitude))
+
+  closest = int(np.argmin(distances))
+  return float(np.sum(segment_lengths[:closest]) + start_distances[closest])
 
 
 def coordinate_from_param(param: str, params: Params = None) -> Coordinate | None:
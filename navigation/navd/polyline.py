@@ -0,0 +1,57 @@
+'''Encoded polyline format, as used by Mapbox with geometries=polyline6.
+
+Each coordinate is the zigzag encoded delta from the previous one, scaled by 10^precision, split in 5 bit chunks
+offset into printable ASCII, latitude before longitude. Decoding is vectorized over the whole string.
+'''
+import numpy as np
+
+from navigation.navd.helpers import RouteGeometry
+
+CHUNK_BITS = 5
+CONTINUATION = 0x20
+ASCII_OFFSET = 63
+
+
+def decode_polyline(encoded: str | bytes, precision: int = 6) -> RouteGeometry:
+  data = encoded.encode('ascii') if isinstance(encoded, str) else encoded
+  chunks = np.frombuffer(data, dtype=np.uint8).astype(np.int64) - ASCII_OFFSET
+  if len(chunks) == 0:
+    return RouteGeometry(np.empty(0), np.empty(0))
+  if chunks.min() < 0 or chunks.max() > 0x3f or chunks[-1] & CONTINUATION:
+    raise ValueError('Invalid encoded polyline')
+
+  # Each value ends at the first chunk without the continuation bit, its chunks are little endian
+  ends = np.flatnonzero((chunks & CONTINUATION) == 0)
+  starts = np.concatenate(([0], ends[:-1] + 1))
+  position = np.arange(len(chunks)) - np.repeat(starts, ends - starts + 1)
+  values = np.add.reduceat((chunks & 0x1f) << (CHUNK_BITS * position), starts)
+  if len(values) % 2:
+    raise ValueError('Invalid encoded polyline')
+
+  deltas = (values >> 1) ^ -(values & 1)
+  # Dividing rounds to the nearest double of the decimal value, multiplying by 10^-precision does not
+  scale = 10.0 ** precision
+  return RouteGeometry(np.cumsum(deltas[0::2]) / scale, np.cumsum(deltas[1::2]) / scale)
+
+
+def encode_polyline(geometry: RouteGeometry, precision: int = 6) -> str:
+  scaled = np.round(np.column_stack((geometry.latitudes, geometry.longitudes)) * 10.0 ** precision).astype(np.int64)
+  deltas = np.diff(scaled, axis=0, prepend=0).ravel()
+  values = np.where(deltas < 0, ~(deltas << 1), deltas << 1).tolist()
+
+  out = bytearray()
+  for value in values:
+    while value >= CONTINUATION:
+      out.append((CONTINUATION | (value & 0x1f)) + ASCII_OFFSET)
+      value >>= CHUNK_BITS
+    out.append(value + ASCII_OFFSET)
+  return out.decode('ascii')
+
+
+def as_route_geometry(geometry: RouteGeometry | str | list[dict[str, float]]) -> RouteGeometry:
+  '''Route geometry from any stored form: a RouteGeometry, a polyline6 string or {'latitude', 'longitude'} dicts'''
+  if isinstance(geometry, RouteGeometry):
+    return geometry
+  if isinstance(geometry, str):
+    return decode_polyline(geometry)
+  return RouteGeometry.from_dicts(geometry)
@@ -0,0 +1,250 @@
+'''Compact directed road graph for offline routing.
+
+The file is a small JSON header followed by little-endian arrays: node positions in 1e-7 degrees, a CSR adjacency
+(per-node edge offsets and edge targets), edge lengths in meters, travel speeds and speed limits in km/h (0 when
+unknown) and indexes into a table of road names. Routes are searched with A* on travel time.
+'''
+import heapq
+import json
+import math
+import os
+import struct
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from navigation.navd import geo
+from navigation.navd.geo import EARTH_MEAN_RADIUS
+
+MAGIC = b'NAVGRAPH'
+VERSION = 1
+COORDINATE_SCALE = 1e7
+DEFAULT_SPEED = 50  # km/h, travel speed of edges built without one
+MAX_SPEED = 130.0  # km/h, travel speeds are capped here so the A* heuristic never overestimates
+MAX_EXPANSIONS = 500_000  # bounds the search time on unreachable or very distant destinations
+
+ARRAYS = (
+  ('latitudes', '<i4'),
+  ('longitudes', '<i4'),
+  ('offsets', '<u4'),
+  ('targets', '<u4'),
+  ('lengths', '<f4'),
+  ('speeds', '<u1'),
+  ('speed_limits', '<u1'),
+  ('name_ids', '<u4'),
+)
+
+# Speeds for OSM highway types without a maxspeed tag
+OSM_HIGHWAY_SPEEDS = {
+  'motorway': 110, 'motorway_link': 60, 'trunk': 90, 'trunk_link': 50, 'primary': 70, 'primary_link': 50,
+  'secondary': 60, 'secondary_link': 40, 'tertiary': 50, 'tertiary_link': 40, 'unclassified': 40, 'residential': 30,
+  'living_street': 10, 'service': 20,
+}
+
+
+class RoadGraph:
+  def __init__(self, latitudes: np.ndarray, longitudes: np.ndarray, offsets: np.ndarray, targets: np.ndarray, lengths: np.ndarray,
+               speeds: np.ndarray, speed_limits: np.ndarray, name_ids: np.ndarray, names: list[str]) -> None:
+    self.latitudes = np.asarray(latitudes, dtype=np.float64)
+    self.longitudes = np.asarray(longitudes, dtype=np.float64)
+    self.offsets = np.asarray(offsets)
+    self.targets = np.asarray(targets)
+    self.lengths = np.asarray(lengths)
+    self.speeds = np.asarray(speeds)
+    self.speed_limits = np.asarray(speed_limits)
+    self.name_ids = np.asarray(name_ids)
+    self.names = names
+
+    # Lists for the search loop, indexing NumPy arrays one element at a time is several times slower
+    self._lat_rad = np.radians(self.latitudes).tolist()
+    self._lon_rad = np.radians(self.longitudes).tolist()
+    self._cos_lat = np.cos(np.radians(self.latitudes)).tolist()
+    self._offsets = self.offsets.tolist()
+    self._targets = self.targets.tolist()
+    self._costs = (self.lengths / (np.clip(self.speeds, 1, MAX_SPEED) / 3.6)).tolist()  # seconds
+    self._has_outgoing = np.diff(self.offsets) > 0
+    self._has_incoming = np.bincount(self.targets, minlength=len(self.latitudes)) > 0
+
+  @property
+  def node_count(self) -> int:
+    return len(self.latitudes)
+
+  @property
+  def edge_count(self) -> int:
+    return len(self.targets)
+
+  @classmethod
+  def from_edges(cls, latitudes, longitudes, sources, targets, speeds=None, speed_limits=None, name_ids=None, names: list[str] | None = None) -> 'RoadGraph':
+    '''Builds a graph from node positions in degrees and directed edges, a two-way road being one edge each way'''
+    latitudes, longitudes = np.asarray(latitudes, dtype=np.float64), np.asarray(longitudes, dtype=np.float64)
+    sources, targets = np.asarray(sources, dtype=np.uint32), np.asarray(targets, dtype=np.uint32)
+    speeds = np.full(len(sources), DEFAULT_SPEED, dtype=np.uint8) if speeds is None else np.asarray(speeds, dtype=np.uint8)
+    speed_limits = np.zeros(len(sources), dtype=np.uint8) if speed_limits is None else np.asarray(speed_limits, dtype=np.uint8)
+    name_ids = np.zeros(len(sources), dtype=np.uint32) if name_ids is None else np.asarray(name_ids, dtype=np.uint32)
+
+    order = np.argsort(sources, kind='stable')
+    sources, targets, speeds, speed_limits, name_ids = sources[order], targets[order], speeds[order], speed_limits[order], name_ids[order]
+    offsets = np.searchsorted(sources, np.arange(len(latitudes) + 1)).astype(np.uint32)
+    lengths = geo.haversine(latitudes[sources], longitudes[sources], latitudes[targets], longitudes[targets]).astype(np.float32)
+    return cls(latitudes, longitudes, offsets, targets, lengths, speeds, speed_limits, name_ids, names or [''])
+
+  @classmethod
+  def load(cls, path: str) -> 'RoadGraph':
+    with open(path, 'rb') as f:
+      data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+      raise ValueError(f'{path} is not a road graph')
+    header_size, = struct.unpack_from('<I', data, len(MAGIC))
+    header_start = len(MAGIC) + 4
+    header = json.loads(data[header_start:header_start + header_size])
+    if header['version'] != VERSION:
+      raise ValueError(f'Unsupported road graph version {header["version"]}')
+
+    arrays = {}
+    offset = header_start + header_size
+    for name, dtype in ARRAYS:
+      count = header['counts'][name]
+      arrays[name] = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+      offset += count * np.dtype(dtype).itemsize
+    arrays['latitudes'] = arrays['latitudes'] / COORDINATE_SCALE
+    arrays['longitudes'] = arrays['longitudes'] / COORDINATE_SCALE
+    return cls(**arrays, names=header['names'])
+
+  def save(self, path: str) -> None:
+    arrays = {
+      'latitudes': np.round(self.latitudes * COORDINATE_SCALE),
+      'longitudes': np.round(self.longitudes * COORDINATE_SCALE),
+      'offsets': self.offsets,
+      'targets': self.targets,
+      'lengths': self.lengths,
+      'speeds': self.speeds,
+      'speed_limits': self.speed_limits,
+      'name_ids': self.name_ids,
+    }
+    header = json.dumps({'version': VERSION, 'counts': {name: len(arrays[name]) for name, _ in ARRAYS}, 'names': self.names}).encode()
+    with open(path, 'wb') as f:
+      f.write(MAGIC + struct.pack('<I', len(header)) + header)
+      for name, dtype in ARRAYS:
+        f.write(np.ascontiguousarray(arrays[name], dtype=dtype).tobytes())
+
+  def nearest_node(self, latitude: float, longitude: float, incoming: bool = False) -> tuple[int, float]:
+    '''Index of and distance in meters to the closest node that has outgoing edges, to start a route from, or incoming
+    edges when incoming is set, to end one at'''
+    east, north = geo.local_enu(self.latitudes, self.longitudes, latitude, longitude)
+    distances_sq = np.where(self._has_incoming if incoming else self._has_outgoing, east * east + north * north, np.inf)
+    idx = int(np.argmin(distances_sq))
+    return idx, float(np.sqrt(distances_sq[idx]))
+
+  def shortest_path(self, source: int, target: int, max_expansions: int = MAX_EXPANSIONS) -> list[int] | None:
+    '''Nodes of the fastest path from source to target with A*, None when there is none within max_expansions'''
+    lat, lon, cos_lat, offsets, targets, costs = self._lat_rad, self._lon_rad, self._cos_lat, self._offsets, self._targets, self._costs
+    target_lat, target_lon, cos_target = lat[target], lon[target], cos_lat[target]
+    seconds_per_radian = EARTH_MEAN_RADIUS / (MAX_SPEED / 3.6)
+
+    def heuristic(node: int) -> float:
+      # Great circle distance over the fastest speed, never more than the travel time along roads. The margin covers
+      # edge lengths rounded to float32.
+      haversine_dlat = math.sin((lat[node] - target_lat) / 2.0)
+      haversine_dlon = math.sin((lon[node] - target_lon) / 2.0)
+      y = haversine_dlat * haversine_dlat + cos_lat[node] * cos_target * haversine_dlon * haversine_dlon
+      return 2.0 * math.asin(math.sqrt(min(y, 1.0))) * seconds_per_radian * 0.9999
+
+    best = {source: 0.0}
+    previous: dict[int, int] = {}
+    queue = [(heuristic(source), 0.0, source)]
+    expansions = 0
+    while queue:
+      _, cost, node = heapq.heappop(queue)
+      if node == target:
+        path = [node]
+        while node != source:
+          node = previous[node]
+          path.append(node)
+        return path[::-1]
+      if cost > best[node]:
+        continue
+      expansions += 1
+      if expansions > max_expansions:
+        return None
+
+      for edge in range(offsets[node], offsets[node + 1]):
+        neighbor = targets[edge]
+        neighbor_cost = cost + costs[edge]
+        if neighbor_cost < best.get(neighbor, math.inf):
+          best[neighbor] = neighbor_cost
+          previous[neighbor] = node
+          heapq.heappush(queue, (neighbor_cost + heuristic(neighbor), neighbor_cost, neighbor))
+    return None
+
+  def edge_between(self, source: int, target: int) -> int:
+    '''Fastest edge from source to target'''
+    edges = range(self._offsets[source], self._offsets[source + 1])
+    return min((edge for edge in edges if self._targets[edge] == target), key=self._costs.__getitem__)
+
+  def edge_cost(self, edge: int) -> float:
+    '''Travel time in seconds along an edge'''
+    return float(self._costs[edge])
+
+
+def parse_maxspeed(value: str | None) -> int:
+  '''km/h from an OSM maxspeed tag, 0 when missing or not numeric'''
+  if not value:
+    return 0
+  number = value.split()[0]
+  if not number.isdigit():
+    return 0
+  return round(int(number) * 1.609344) if value.endswith('mph') else int(number)
+
+
+def osm_to_road_graph(path: str) -> RoadGraph:
+  '''Converts an OSM XML extract to a RoadGraph of its drivable ways'''
+  node_positions: dict[int, tuple[float, float]] = {}
+  ways: list[tuple[list[int], dict[str, str]]] = []
+  for _, element in ET.iterparse(path, events=('end',)):
+    if element.tag == 'node':
+      node_positions[int(element.attrib['id'])] = (float(element.attrib['lat']), float(element.attrib['lon']))
+      element.clear()
+    elif element.tag == 'way':
+      tags = {tag.attrib['k']: tag.attrib['v'] for tag in element.iter('tag')}
+      if tags.get('highway') in OSM_HIGHWAY_SPEEDS:
+        ways.append(([int(node_ref.attrib['ref']) for node_ref in element.iter('nd')], tags))
+      element.clear()
+
+  node_ids: dict[int, int] = {}
+  names: list[str] = []
+  name_ids_by_name: dict[str, int] = {}
+  sources, targets, speeds, speed_limits, name_ids = [], [], [], [], []
+  for refs, tags in ways:
+    refs = [ref for ref in refs if ref in node_positions]
+    speed_limit = parse_maxspeed(tags.get('maxspeed'))
+    speed = speed_limit or OSM_HIGHWAY_SPEEDS[tags['highway']]
+    name = tags.get('name', '')
+    if name not in name_ids_by_name:
+      name_ids_by_name[name] = len(names)
+      names.append(name)
+
+    oneway = tags.get('oneway', 'yes' if tags['highway'] in ('motorway', 'motorway_link') else 'no')
+    directions = {'-1': (False, True), 'yes': (True, False), 'true': (True, False), '1': (True, False)}.get(oneway, (True, True))
+    for a, b in zip(refs, refs[1:], strict=False):
+      a_idx, b_idx = node_ids.setdefault(a, len(node_ids)), node_ids.setdefault(b, len(node_ids))
+      for source, target, enabled in zip((a_idx, b_idx), (b_idx, a_idx), directions, strict=True):
+        if enabled:
+          sources.append(source)
+          targets.append(target)
+          speeds.append(speed)
+          speed_limits.append(speed_limit)
+          name_ids.append(name_ids_by_name[name])
+
+  positions = np.array([node_positions[node_id] for node_id in node_ids], dtype=np.float64).reshape(-1, 2)
+  return RoadGraph.from_edges(positions[:, 0], positions[:, 1], sources, targets, speeds, speed_limits, name_ids, names)
+
+
+if __name__ == '__main__':
+  import sys
+
+  if len(sys.argv) != 3:
+    print(f'usage: {os.path.basename(sys.argv[0])} <extract.osm> <output graph>')
+    sys.exit(1)
+  graph = osm_to_road_graph(sys.argv[1])
+  graph.save(sys.argv[2])
+  print(f'{graph.node_count} nodes, {graph.edge_count} edges, {os.path.getsize(sys.argv[2]) / 1e6:.1f} MB')
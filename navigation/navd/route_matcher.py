@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import numpy as np
+
+from navigation.navd.geo import EARTH_MEAN_RADIUS, haversine_rad, local_enu_rad
+from navigation.navd.helpers import RouteGeometry
+
+SEARCH_BEHIND = 50.0  # meters of route searched behind the last match
+SEARCH_AHEAD = 250.0  # meters of route searched ahead of the last match
+RELOCALIZE_DISTANCE = 50.0  # windowed matches further than this fall back to a full search
+BACKTRACK_PENALTY = 5.0  # meters added to segments behind the last match, keeps ties on overlapping legs moving forward
+GRID_CELL_SIZE = 250.0  # meters, spatial index cell edge
+GRID_MAX_RINGS = 20  # rings of cells searched around a position before falling back to a full search
+
+
+class SegmentGrid:
+  '''Uniform lat/lon grid over polyline segment bounding boxes, stored as sorted cell keys with CSR offsets.'''
+
+  def __init__(self, lat: np.ndarray, lon: np.ndarray) -> None:
+    self.lat_step = GRID_CELL_SIZE / EARTH_MEAN_RADIUS
+    # Cells are narrowest in meters at the most equatorward point of the route, never wider than GRID_CELL_SIZE
+    self.cos_ref = float(np.max(np.cos(lat))) if len(lat) else 1.0
+    self.lon_step = self.lat_step / self.cos_ref
+
+    ix = np.floor(lon / self.lon_step).astype(np.int64)
+    iy = np.floor(lat / self.lat_step).astype(np.int64)
+    self.ix_min = int(ix.min()) if len(ix) else 0
+    self.iy_min = int(iy.min()) if len(iy) else 0
+    self.width = int(ix.max()) - self.ix_min + 1 if len(ix) else 0
+    self.height = int(iy.max()) - self.iy_min + 1 if len(iy) else 0
+    ix -= self.ix_min
+    iy -= self.iy_min
+
+    # Expand every segment into the cells covered by its bounding box
+    x0, x1 = np.minimum(ix[:-1], ix[1:]), np.maximum(ix[:-1], ix[1:])
+    y0, y1 = np.minimum(iy[:-1], iy[1:]), np.maximum(iy[:-1], iy[1:])
+    nx, ny = x1 - x0 + 1, y1 - y0 + 1
+    counts = nx * ny
+    segment_ids = np.repeat(np.arange(len(counts), dtype=np.int64), counts)
+    offset = np.arange(len(segment_ids), dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+    cell_x = np.repeat(x0, counts) + offset % np.repeat(nx, counts)
+    cell_y = np.repeat(y0, counts) + offset // np.repeat(nx, counts)
+    keys = cell_y * self.width + cell_x
+
+    order = np.argsort(keys, kind='stable')
+    self.keys, starts = np.unique(keys[order], return_index=True)
+    self.offsets = np.append(starts, len(order))
+    self.segment_ids = segment_ids[order]
+
+  def cell_of(self, lat: float, lon: float) -> tuple[int, int]:
+    return int(np.floor(lon / self.lon_step)) - self.ix_min, int(np.floor(lat / self.lat_step)) - self.iy_min
+
+  def min_cell_extent(self, lat: float) -> float:
+    '''Smallest cell edge in meters at the given latitude in radians'''
+    return GRID_CELL_SIZE * min(1.0, float(np.cos(lat)) / self.cos_ref)
+
+  def ring(self, cx: int, cy: int, radius: int) -> np.ndarray | None:
+    '''Segment ids in the cells at Chebyshev distance radius from cell (cx, cy), None once the ring is past the grid'''
+    if radius > max(abs(cx), abs(self.width - 1 - cx), abs(cy), abs(self.height - 1 - cy)):
+      return None
+
+    if radius == 0:
+      xs, ys = np.array([cx]), np.array([cy])
+    else:
+      span = np.arange(-radius, radius + 1)
+      side = span[1:-1]
+      xs = cx + np.concatenate([span, span, np.full(len(side), -radius), np.full(len(side), radius)])
+      ys = cy + np.concatenate([np.full(len(span), -radius), np.full(len(span), radius), side, side])
+    inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+    keys = ys[inside] * self.width + xs[inside]
+
+    positions = np.searchsorted(self.keys, keys)
+    hits = positions < len(self.keys)
+    positions, keys = positions[hits], keys[hits]
+    positions = positions[self.keys[positions] == keys]
+    if not len(positions):
+      return np.empty(0, dtype=np.int64)
+    return np.concatenate([self.segment_ids[self.offsets[pos]:self.offsets[pos + 1]] for pos in positions])
+
+
+class RouteMatcher:
+  '''Matches positions against a route polyline stored as contiguous NumPy arrays.
+
+  Positions are projected onto polyline segments, so matches return the fractional distance along the route
+  instead of the distance at the nearest vertex. Searches without a previous match go through a SegmentGrid.
+  '''
+
+  def __init__(self, geometry: RouteGeometry, cumulative: np.ndarray | None = None) -> None:
+    '''cumulative optionally passes distances along the route already known, e.g. when splicing routes'''
+    self.lat = np.radians(geometry.latitudes)
+    self.lon = np.radians(geometry.longitudes)
+    self.cos_lat = np.cos(self.lat)
+
+    if cumulative is not None:
+      self.cumulative = np.asarray(cumulative, dtype=np.float64)
+    else:
+      self.cumulative = np.zeros(len(geometry), dtype=np.float64)
+      if len(geometry) > 1:
+        segment_lengths = haversine_rad(self.lat[:-1], self.lon[:-1], self.cos_lat[:-1], self.lat[1:], self.lon[1:], self.cos_lat[1:])
+        np.cumsum(segment_lengths, out=self.cumulative[1:])
+
+    self.grid = SegmentGrid(self.lat, self.lon)
+    self.last_idx: int | None = None
+
+  def __len__(self) -> int:
+    return len(self.lat)
+
+  def distances_to(self, latitude: float, longitude: float, start: int = 0, end: int | None = None) -> np.ndarray:
+    '''Distance in meters from a position in degrees to the polyline points in [start, end)'''
+    lat = np.radians(latitude)
+    return haversine_rad(lat, np.radians(longitude), np.cos(lat), self.lat[start:end], self.lon[start:end], self.cos_lat[start:end])
+
+  def nearest_point(self, latitude: float, longitude: float, start: int = 0) -> tuple[int, float]:
+    '''Index of and distance to the closest polyline point at or after start, preferring the earliest on ties'''
+    lat = np.radians(latitude)
+    cx, cy = self.grid.cell_of(lat, np.radians(longitude))
+    extent = self.grid.min_cell_extent(lat)
+    best_idx, best_distance = -1, np.inf
+    for radius in range(GRID_MAX_RINGS):
+      segments = self.grid.ring(cx, cy, radius)
+      if segments is None:  # every cell of the grid has been visited
+        break
+      points = np.unique(np.concatenate([segments, segments + 1]))
+      points = points[points >= start]
+      if len(points):
+        distances = haversine_rad(lat, np.radians(longitude), np.cos(lat), self.lat[points], self.lon[points], self.cos_lat[points])
+        idx = int(np.argmin(distances))
+        if distances[idx] < best_distance:
+          best_idx, best_distance = int(points[idx]), float(distances[idx])
+      # Unvisited points are at least radius cells away
+      if best_idx >= 0 and best_distance <= radius * extent:
+        return best_idx, best_distance
+
+    if best_idx >= 0 and segments is None:
+      return best_idx, best_distance
+
+    # Too far from the route for the index to narrow the search, or a single point route
+    distances = self.distances_to(latitude, longitude, start)
+    idx = int(np.argmin(distances))
+    return start + idx, float(distances[idx])
+
+  def project(self, latitude: float, longitude: float, start: int = 0, end: int | None = None, backtrack_idx: int = 0) -> tuple[int, float, float]:
+    '''Projects a position onto the segments between polyline points [start, end).
+
+    Returns the index of the closest segment's first point, the distance to the route in meters and the
+    position along the route in meters. Segments before backtrack_idx are penalized by BACKTRACK_PENALTY.
+    '''
+    end = len(self.lat) if end is None else end
+    if end - start < 2:
+      return start, float(self.distances_to(latitude, longitude, start, start + 1)[0]), float(self.cumulative[start])
+    return self._project_segments(latitude, longitude, np.arange(start, end - 1), backtrack_idx)
+
+  def locate(self, latitude: float, longitude: float) -> tuple[int, float, float]:
+    '''Projects a position onto the whole route, visiting only segments near it through the spatial index'''
+    if len(self.lat) < 2:
+      return self.project(latitude, longitude)
+
+    lat = np.radians(latitude)
+    cx, cy = self.grid.cell_of(lat, np.radians(longitude))
+    extent = self.grid.min_cell_extent(lat)
+    best: tuple[int, float, float] | None = None
+    for radius in range(GRID_MAX_RINGS):
+      segments = self.grid.ring(cx, cy, radius)
+      if segments is None:  # every cell of the grid has been visited
+        return best if best is not None else self.project(latitude, longitude)
+      if len(segments):
+        candidate = self._project_segments(latitude, longitude, segments)
+        if best is None or candidate[1] < best[1]:
+          best = candidate
+      # Unvisited segments are at least radius cells away
+      if best is not None and best[1] <= radius * extent:
+        return best
+
+    # Too far from the route for the index to narrow the search
+    return self.project(latitude, longitude)
+
+  def _project_segments(self, latitude: float, longitude: float, segments: np.ndarray, backtrack_idx: int = 0) -> tuple[int, float, float]:
+    # Local ENU frame centred on the position, accurate for the nearby segments that can win
+    lat0, lon0 = np.radians(latitude), np.radians(longitude)
+    cos_lat0 = float(np.cos(lat0))
+    ax, ay = local_enu_rad(self.lat[segments], self.lon[segments], lat0, lon0, cos_lat0)
+    bx, by = local_enu_rad(self.lat[segments + 1], self.lon[segments + 1], lat0, lon0, cos_lat0)
+    dx, dy = bx - ax, by - ay
+    length_sq = dx * dx + dy * dy
+    t = np.clip(-(ax * dx + ay * dy) / np.where(length_sq > 0.0, length_sq, 1.0), 0.0, 1.0)
+    costs = np.hypot(ax + t * dx, ay + t * dy)
+    costs[segments < backtrack_idx] += BACKTRACK_PENALTY
+
+    best = int(np.argmin(costs))
+    idx, fraction = int(segments[best]), float(t[best])
+
+    # Exact distance to the projected point with haversine
+    projected_lat = self.lat[idx] + fraction * (self.lat[idx + 1] - self.lat[idx])
+    projected_lon = self.lon[idx] + fraction * (self.lon[idx + 1] - self.lon[idx])
+    distance = float(haversine_rad(lat0, lon0, cos_lat0, projected_lat, projected_lon, np.cos(projected_lat)))
+    along = float(self.cumulative[idx] + fraction * (self.cumulative[idx + 1] - self.cumulative[idx]))
+    return idx, distance, along
+
+  def match(self, latitude: float, longitude: float) -> tuple[int, float, float]:
+    '''Projects a position onto the route, searching a window around the previous match when still on route.
+
+    Returns the same segment index, distance from route and position along the route as project.
+    '''
+    if self.last_idx is not None:
+      idx, distance, along = self._match_window(latitude, longitude, self.last_idx)
+      if distance <= RELOCALIZE_DISTANCE:
+        self.last_idx = idx
+        return idx, distance, along
+
+    idx, distance, along = self.locate(latitude, longitude)
+    self.last_idx = idx
+    return idx, distance, along
+
+  def reset(self) -> None:
+    self.last_idx = None
+
+  def _match_window(self, latitude: float, longitude: float, center_idx: int) -> tuple[int, float, float]:
+    count = len(self.lat)
+    while True:
+      center = self.cumulative[center_idx]
+      start = min(int(np.searchsorted(self.cumulative, center - SEARCH_BEHIND, side='left')), max(center_idx - 1, 0))
+      end = max(int(np.searchsorted(self.cumulative, center + SEARCH_AHEAD, side='right')), min(center_idx + 3, count))
+      idx, distance, along = self.project(latitude, longitude, start, end, backtrack_idx=center_idx)
+
+      # Slide the window forward while the best match sits on its leading segment
+      if idx != end - 2 or end == count or idx == center_idx:
+        return idx, distance, along
+      center_idx = idx
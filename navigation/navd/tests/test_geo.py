@@ -0,0 +1,97 @@
+import math
+import os
+import time
+
+import numpy as np
+import pytest
+
+from navigation.navd import geo
+from navigation.navd.helpers import Coordinate, RouteGeometry, distance_along_geometry, minimum_distance
+
+
+def scalar_haversine(lat1, lon1, lat2, lon2):
+  dlat = math.radians(lat2 - lat1)
+  dlon = math.radians(lon2 - lon1)
+  y = math.sin(dlat / 2.0) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2.0) ** 2
+  return 2 * math.asin(math.sqrt(y)) * geo.EARTH_MEAN_RADIUS
+
+
+def random_points(count, seed=0):
+  rng = np.random.default_rng(seed)
+  return rng.uniform(33.0, 35.0, count), rng.uniform(-120.0, -118.0, count)
+
+
+class TestGeo:
+  def test_haversine_matches_scalar(self):
+    lat1, lon1 = random_points(100, seed=1)
+    lat2, lon2 = random_points(100, seed=2)
+    distances = geo.haversine(lat1, lon1, lat2, lon2)
+    assert distances.shape == (100,)
+    for i in range(100):
+      assert distances[i] == pytest.approx(scalar_haversine(lat1[i], lon1[i], lat2[i], lon2[i]), rel=1e-9)
+
+  def test_haversine_broadcasts(self):
+    lat, lon = random_points(10)
+    distances = geo.haversine(34.0, -119.0, lat, lon)
+    assert distances.shape == (10,)
+    assert distances[3] == pytest.approx(scalar_haversine(34.0, -119.0, lat[3], lon[3]))
+
+  def test_coordinate_distance_delegates(self):
+    a, b = Coordinate(34.0, -119.0), Coordinate(34.01, -119.02)
+    assert isinstance(a.distance_to(b), float)
+    assert a.distance_to(b) == pytest.approx(scalar_haversine(34.0, -119.0, 34.01, -119.02), rel=1e-12)
+
+  def test_bearing(self):
+    assert geo.bearing(0.0, 0.0, 1.0, 0.0) == pytest.approx(0.0)
+    assert geo.bearing(0.0, 0.0, 0.0, 1.0) == pytest.approx(90.0)
+    assert geo.bearing(0.0, 0.0, -1.0, 0.0) == pytest.approx(180.0)
+    assert geo.bearing(0.0, 0.0, 0.0, -1.0) == pytest.approx(270.0)
+    np.testing.assert_allclose(geo.bearing(np.zeros(2), np.zeros(2), np.array([1.0, 0.0]), np.array([0.0, 1.0])), [0.0, 90.0], atol=1e-9)
+
+  def test_cross_and_along_track(self):
+    # Path along the equator, point 0.001 deg north of it, halfway along
+    offset = math.radians(0.001) * geo.EARTH_MEAN_RADIUS
+    assert geo.cross_track_distance(0.001, 0.005, 0.0, 0.0, 0.0, 0.01) == pytest.approx(-offset, rel=1e-6)
+    assert geo.cross_track_distance(-0.001, 0.005, 0.0, 0.0, 0.0, 0.01) == pytest.approx(offset, rel=1e-6)
+    assert geo.along_track_distance(0.001, 0.005, 0.0, 0.0, 0.0, 0.01) == pytest.approx(scalar_haversine(0, 0, 0, 0.005), rel=1e-6)
+    assert geo.along_track_distance(0.0, -0.005, 0.0, 0.0, 0.0, 0.01) == pytest.approx(-scalar_haversine(0, 0, 0, 0.005), rel=1e-6)
+
+  def test_local_enu(self):
+    east, north = geo.local_enu(np.array([34.001, 34.0]), np.array([-119.0, -118.999]), 34.0, -119.0)
+    assert north[0] == pytest.approx(scalar_haversine(34.0, -119.0, 34.001, -119.0), rel=1e-6)
+    assert east[0] == pytest.approx(0.0)
+    assert east[1] == pytest.approx(scalar_haversine(34.0, -119.0, 34.0, -118.999), rel=1e-4)
+
+  def test_distance_along_geometry_matches_scalar_loop(self):
+    lat = 34.0 + np.cumsum(np.full(200, 0.0002))
+    lon = -119.0 + np.cumsum(np.sin(np.arange(200) / 10.0) * 0.0002)
+    geometry = RouteGeometry(lat, lon)
+    for pos in (geometry[50], Coordinate(lat[120] + 0.0001, lon[120] - 0.0001), Coordinate(33.9, -119.1)):
+      total, closest_total, closest = 0.0, 0.0, 1e9
+      for i in range(len(geometry) - 1):
+        d = minimum_distance(geometry[i], geometry[i + 1], pos)
+        if d < closest:
+          closest, closest_total = d, total + geometry[i].distance_to(pos)
+        total += geometry[i].distance_to(geometry[i + 1])
+      assert distance_along_geometry(geometry, pos) == pytest.approx(closest_total, rel=1e-9)
+
+
+@pytest.mark.skipif(not os.getenv("RUN_BENCHMARK"), reason="not enabled, run export RUN_BENCHMARK=1")
+def test_benchmark_scalar_vs_batched(capsys):
+  count = 100_000
+  lat, lon = random_points(count)
+  origin = Coordinate(34.0, -119.0)
+  coords = [Coordinate(a, b) for a, b in zip(lat.tolist(), lon.tolist(), strict=True)]
+
+  start = time.perf_counter()
+  scalar = [origin.distance_to(coord) for coord in coords]
+  scalar_time = time.perf_counter() - start
+
+  start = time.perf_counter()
+  batched = geo.haversine(origin.latitude, origin.longitude, lat, lon)
+  batched_time = time.perf_counter() - start
+
+  np.testing.assert_allclose(batched, scalar, rtol=1e-9)
+  with capsys.disabled():
+    print(f"\nhaversine over {count} points: scalar {count / scalar_time / 1e6:.2f} M/s, batched {count / batched_time / 1e6:.2f} M/s "
+          f"({scalar_time / batched_time:.0f}x)")
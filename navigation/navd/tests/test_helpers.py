@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from navigation.navd.helpers import Coordinate, RouteGeometry, distance_along_geometry
+
+
+class TestRouteGeometry:
+  def setup_method(self):
+    self.points = [{'latitude': 34.0 + i * 0.001, 'longitude': -119.0 - i * 0.001} for i in range(10)]
+    self.geometry = RouteGeometry.from_dicts(self.points)
+
+  def test_coordinate_has_no_instance_dict(self):
+    assert not hasattr(Coordinate(34.0, -119.0), '__dict__')
+
+  def test_indexing(self):
+    assert len(self.geometry) == 10
+    assert self.geometry[3] == Coordinate(self.points[3]['latitude'], self.points[3]['longitude'])
+    assert self.geometry[-1] == Coordinate(self.points[-1]['latitude'], self.points[-1]['longitude'])
+    assert isinstance(self.geometry[3].latitude, float)
+    assert list(self.geometry) == [Coordinate(p['latitude'], p['longitude']) for p in self.points]
+
+  def test_slice_is_a_view(self):
+    tail = self.geometry[4:]
+    assert isinstance(tail, RouteGeometry)
+    assert len(tail) == 6
+    assert np.shares_memory(tail.latitudes, self.geometry.latitudes)
+    assert tail[0] == self.geometry[4]
+
+  def test_from_coordinates(self):
+    geometry = RouteGeometry.from_coordinates(list(self.geometry))
+    assert np.array_equal(geometry.latitudes, self.geometry.latitudes)
+    assert np.array_equal(geometry.longitudes, self.geometry.longitudes)
+
+  def test_empty(self):
+    geometry = RouteGeometry.from_dicts([])
+    assert len(geometry) == 0
+    assert not geometry
+
+  def test_mismatched_arrays(self):
+    with pytest.raises(ValueError):
+      RouteGeometry(np.zeros(3), np.zeros(4))
+
+  def test_distance_along_geometry(self):
+    # On the route at point 5, the distance along it is the length of the first five segments
+    expected = sum(self.geometry[i].distance_to(self.geometry[i + 1]) for i in range(5))
+    assert distance_along_geometry(self.geometry, self.geometry[5]) == pytest.approx(expected, rel=1e-9)
+    assert distance_along_geometry(list(self.geometry), self.geometry[5]) == pytest.approx(expected, rel=1e-9)
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from navigation.navd.helpers import Coordinate, RouteGeometry
+from navigation.navd.polyline import as_route_geometry, decode_polyline, encode_polyline
+
+# Example from the encoded polyline format documentation, at precision 5
+REFERENCE = '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+REFERENCE_POINTS = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+
+
+class TestPolyline:
+  def test_reference_decode(self):
+    geometry = decode_polyline(REFERENCE, precision=5)
+    assert list(geometry) == [Coordinate(*point) for point in REFERENCE_POINTS]
+
+  def test_reference_encode(self):
+    geometry = RouteGeometry(*np.array(REFERENCE_POINTS).T)
+    assert encode_polyline(geometry, precision=5) == REFERENCE
+
+  def test_round_trip(self):
+    rng = np.random.default_rng(0)
+    latitudes = np.round(34.0 + np.cumsum(rng.normal(0, 1e-3, 5000)), 6)
+    longitudes = np.round(-119.0 + np.cumsum(rng.normal(0, 1e-3, 5000)), 6)
+    decoded = decode_polyline(encode_polyline(RouteGeometry(latitudes, longitudes)))
+    assert np.allclose(decoded.latitudes, latitudes, rtol=0, atol=1e-9)
+    assert np.allclose(decoded.longitudes, longitudes, rtol=0, atol=1e-9)
+
+  def test_extremes(self):
+    geometry = RouteGeometry(np.array([-90.0, 90.0, 0.0]), np.array([180.0, -180.0, 0.0]))
+    decoded = decode_polyline(encode_polyline(geometry).encode())
+    assert list(decoded) == list(geometry)
+
+  def test_empty(self):
+    assert len(decode_polyline('')) == 0
+    assert encode_polyline(RouteGeometry(np.empty(0), np.empty(0))) == ''
+
+  @pytest.mark.parametrize('encoded', ['_p~iF~ps|U_', '_p~iF', 'abc def'])
+  def test_invalid(self, encoded):
+    with pytest.raises(ValueError):
+      decode_polyline(encoded)
+
+  def test_as_route_geometry(self):
+    points = [{'latitude': 34.0, 'longitude': -119.0}, {'latitude': 34.001, 'longitude': -119.002}]
+    geometry = RouteGeometry.from_dicts(points)
+    assert as_route_geometry(geometry) is geometry
+    assert list(as_route_geometry(points)) == list(geometry)
+    assert list(as_route_geometry(encode_polyline(geometry))) == list(geometry)
@@ -0,0 +1,119 @@
+import pytest
+
+from navigation.navd import geo
+from navigation.navd.road_graph import RoadGraph, osm_to_road_graph, parse_maxspeed
+from navigation.tests.routes import SPACING, make_grid
+
+
+def path_length(graph: RoadGraph, path: list[int]) -> float:
+  lat, lon = graph.latitudes[path], graph.longitudes[path]
+  return float(geo.haversine(lat[:-1], lon[:-1], lat[1:], lon[1:]).sum())
+
+
+OSM_EXTRACT = '''<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6">
+  <node id="1" lat="34.0" lon="-119.0"/>
+  <node id="2" lat="34.001" lon="-119.0"/>
+  <node id="3" lat="34.002" lon="-119.0"/>
+  <node id="4" lat="34.002" lon="-118.999"/>
+  <node id="5" lat="34.5" lon="-118.5"/>
+  <way id="10">
+    <nd ref="1"/><nd ref="2"/><nd ref="3"/>
+    <tag k="highway" v="primary"/><tag k="name" v="Main Street"/><tag k="maxspeed" v="35 mph"/>
+  </way>
+  <way id="11">
+    <nd ref="3"/><nd ref="4"/>
+    <tag k="highway" v="residential"/><tag k="oneway" v="yes"/>
+  </way>
+  <way id="12">
+    <nd ref="4"/><nd ref="5"/>
+    <tag k="highway" v="footway"/>
+  </way>
+</osm>
+'''
+
+
+class TestRoadGraph:
+  def test_from_edges(self):
+    graph = make_grid(size=3)
+    assert graph.node_count == 9
+    assert graph.edge_count == 2 * 2 * 3 * 2
+    assert sorted(graph.targets[graph.offsets[4]:graph.offsets[5]]) == [1, 3, 5, 7]
+    assert graph.lengths[0] == pytest.approx(SPACING * 111_195 * 0.829, rel=0.01)
+
+  def test_save_load(self, tmp_path):
+    graph = make_grid(size=5)
+    path = str(tmp_path / 'graph')
+    graph.save(path)
+    loaded = RoadGraph.load(path)
+    assert loaded.names == graph.names
+    assert loaded.latitudes == pytest.approx(graph.latitudes, abs=1e-7)
+    for name in ('offsets', 'targets', 'lengths', 'speeds', 'speed_limits', 'name_ids'):
+      assert (getattr(loaded, name) == getattr(graph, name)).all()
+    assert loaded.shortest_path(0, 24) is not None
+
+  def test_load_rejects_other_files(self, tmp_path):
+    path = tmp_path / 'graph'
+    path.write_bytes(b'not a graph')
+    with pytest.raises(ValueError):
+      RoadGraph.load(str(path))
+
+  def test_nearest_node(self):
+    graph = make_grid(size=5)
+    idx, distance = graph.nearest_node(34.0 + 2 * SPACING + 0.0001, -119.0 + 3 * SPACING)
+    assert idx == 2 * 5 + 3
+    assert distance == pytest.approx(11.1, abs=0.1)
+
+  def test_nearest_node_at_one_way_end(self, tmp_path):
+    path = tmp_path / 'extract.osm'
+    path.write_text(OSM_EXTRACT)
+    graph = osm_to_road_graph(str(path))
+    # The end of the one-way street has no outgoing edges, routes can end there but not start
+    assert graph.nearest_node(34.002, -118.999)[0] == 2
+    assert graph.nearest_node(34.002, -118.999, incoming=True) == (3, 0.0)
+
+  def test_shortest_path_on_grid(self):
+    graph = make_grid()
+    path = graph.shortest_path(0, 99)
+    assert path[0] == 0 and path[-1] == 99
+    assert len(path) == 19  # any monotonic staircase is a fastest path on a uniform grid
+    assert all(b - a in (1, 10) for a, b in zip(path, path[1:], strict=False))
+
+  def test_shortest_path_prefers_faster_roads(self):
+    graph = make_grid(avenue_speed=120)
+    path = graph.shortest_path(5 * 10, 5 * 10 + 9)
+    assert path == list(range(50, 60))
+    # From one row off the avenue, detouring over it is faster than the direct street
+    slow = make_grid(avenue_speed=None)
+    assert slow.shortest_path(40, 49) == list(range(40, 50))
+    assert set(range(51, 59)) <= set(graph.shortest_path(40, 49))
+    assert path_length(graph, graph.shortest_path(40, 49)) > path_length(slow, slow.shortest_path(40, 49))
+
+  def test_shortest_path_fastest_at_high_latitude(self):
+    # Through P (60, 10) is 1% faster than through Q (57, 6.17); an equirectangular heuristic overestimates the
+    # remaining time at P, which is poleward of the target, and settled for Q
+    graph = RoadGraph.from_edges([60.0, 60.0, 57.0, 55.0], [11.0, 10.0, 6.17, 0.0], [0, 1, 0, 2], [1, 3, 2, 3], speeds=[130] * 4)
+    assert graph.shortest_path(0, 3) == [0, 1, 3]
+
+  def test_shortest_path_unreachable(self):
+    graph = RoadGraph.from_edges([34.0, 34.001, 34.002], [-119.0, -119.0, -119.0], [0, 1], [1, 0])
+    assert graph.shortest_path(0, 2) is None
+    assert make_grid().shortest_path(0, 99, max_expansions=5) is None
+
+  def test_parse_maxspeed(self):
+    assert parse_maxspeed('50') == 50
+    assert parse_maxspeed('30 mph') == 48
+    assert parse_maxspeed('none') == 0
+    assert parse_maxspeed(None) == 0
+
+  def test_osm_to_road_graph(self, tmp_path):
+    path = tmp_path / 'extract.osm'
+    path.write_text(OSM_EXTRACT)
+    graph = osm_to_road_graph(str(path))
+    assert graph.node_count == 4  # the footway and its far node are not drivable
+    assert graph.names == ['Main Street', '']
+    assert graph.shortest_path(0, 3) == [0, 1, 2, 3]
+    assert graph.shortest_path(3, 0) is None  # one way
+    first = graph.edge_between(0, 1)
+    assert graph.speed_limits[first] == 56 and graph.speeds[first] == 56
+    assert graph.speed_limits[graph.edge_between(2, 3)] == 0 and graph.speeds[graph.edge_between(2, 3)] == 30
@@ -0,0 +1,113 @@
+import random
+
+import pytest
+
+from navigation.navd.helpers import Coordinate, RouteGeometry
+from navigation.navd.route_matcher import RouteMatcher
+from navigation.tests.routes import make_geometry
+
+
+class TestRouteMatcher:
+  def setup_method(self):
+    self.geometry = make_geometry()
+    self.matcher = RouteMatcher(RouteGeometry.from_coordinates(self.geometry))
+
+  def test_cumulative_distances(self):
+    expected = 0.0
+    assert self.matcher.cumulative[0] == 0.0
+    for idx in range(1, len(self.geometry)):
+      expected += self.geometry[idx - 1].distance_to(self.geometry[idx])
+      assert self.matcher.cumulative[idx] == pytest.approx(expected, abs=1e-6)
+
+  def test_nearest_point_matches_scalar_search(self):
+    rng = random.Random(1)
+    for _ in range(50):
+      anchor = self.geometry[rng.randrange(len(self.geometry))]
+      position = Coordinate(anchor.latitude + rng.uniform(-0.001, 0.001), anchor.longitude + rng.uniform(-0.001, 0.001))
+      expected_idx, expected_distance = min(((idx, position.distance_to(coord)) for idx, coord in enumerate(self.geometry)), key=lambda x: x[1])
+
+      idx, distance = self.matcher.nearest_point(position.latitude, position.longitude)
+      assert idx == expected_idx
+      assert distance == pytest.approx(expected_distance, abs=1e-6)
+
+  def test_single_point_route(self):
+    matcher = RouteMatcher(RouteGeometry.from_coordinates(self.geometry[:1]))
+    assert len(matcher) == 1
+    assert matcher.cumulative.tolist() == [0.0]
+    idx, distance = matcher.nearest_point(self.geometry[0].latitude, self.geometry[0].longitude)
+    assert idx == 0
+    assert distance == pytest.approx(0.0)
+
+  def test_match_tracks_along_route(self):
+    for idx in range(0, len(self.geometry), 3):
+      point = self.geometry[idx]
+      matched_idx, distance, along = self.matcher.match(point.latitude, point.longitude)
+      assert matched_idx in (idx - 1, idx)
+      assert distance == pytest.approx(0.0, abs=1e-3)
+      assert along == pytest.approx(self.matcher.cumulative[idx], abs=1e-3)
+
+  def test_match_relocalizes_after_jump(self):
+    self.matcher.match(self.geometry[10].latitude, self.geometry[10].longitude)
+    assert self.matcher.last_idx in (9, 10)
+    far = self.geometry[400]
+    assert self.matcher.match(far.latitude, far.longitude)[0] in (399, 400)
+
+  def test_match_does_not_snap_to_overlapping_segment(self):
+    # Out and back along the same road: the return leg overlaps the outbound leg
+    outbound = [Coordinate(34.0 + i * 0.0001, -119.0) for i in range(100)]
+    geometry = outbound + outbound[::-1][1:]
+    matcher = RouteMatcher(RouteGeometry.from_coordinates(geometry))
+    for idx, point in enumerate(geometry):
+      matched_idx, _, _ = matcher.match(point.latitude, point.longitude + 0.00001)
+      if abs(idx - len(outbound)) > 2:  # points around the turnaround are equidistant to both legs
+        assert matched_idx in (idx - 1, idx)
+
+    matcher.reset()
+    assert matcher.last_idx is None
+
+  def test_project_onto_segment(self):
+    a, b = self.geometry[20], self.geometry[21]
+    midpoint = Coordinate((a.latitude + b.latitude) / 2, (a.longitude + b.longitude) / 2)
+    idx, distance, along = self.matcher.project(midpoint.latitude, midpoint.longitude)
+    assert idx == 20
+    assert distance == pytest.approx(0.0, abs=1e-3)
+    assert along == pytest.approx((self.matcher.cumulative[20] + self.matcher.cumulative[21]) / 2, abs=1e-2)
+
+  def test_project_offset_from_segment(self):
+    # 30 m north of the middle of an east-west segment
+    geometry = [Coordinate(34.0, -119.0), Coordinate(34.0, -118.99)]
+    matcher = RouteMatcher(RouteGeometry.from_coordinates(geometry))
+    offset = 30.0 / 111_195
+    idx, distance, along = matcher.project(34.0 + offset, -118.995)
+    assert idx == 0
+    assert distance == pytest.approx(30.0, rel=1e-3)
+    assert along == pytest.approx(matcher.cumulative[1] / 2, rel=1e-3)
+
+    # Beyond the end clamps onto the last point
+    _, distance, along = matcher.project(34.0, -118.98)
+    assert distance == pytest.approx(geometry[1].distance_to(Coordinate(34.0, -118.98)), rel=1e-6)
+    assert along == pytest.approx(matcher.cumulative[1])
+
+  def test_project_single_point_route(self):
+    matcher = RouteMatcher(RouteGeometry.from_coordinates(self.geometry[:1]))
+    point = self.geometry[1]
+    assert matcher.project(point.latitude, point.longitude) == (0, pytest.approx(self.geometry[0].distance_to(point)), 0.0)
+
+  def test_locate_matches_full_projection(self):
+    rng = random.Random(2)
+    for _ in range(200):
+      anchor = self.geometry[rng.randrange(len(self.geometry))]
+      spread = rng.choice((0.0005, 0.005, 0.05))
+      latitude, longitude = anchor.latitude + rng.uniform(-spread, spread), anchor.longitude + rng.uniform(-spread, spread)
+      idx, distance, along = self.matcher.locate(latitude, longitude)
+      expected_idx, expected_distance, expected_along = self.matcher.project(latitude, longitude)
+      assert distance == pytest.approx(expected_distance, abs=1e-6)
+      if idx == expected_idx:
+        assert along == pytest.approx(expected_along)
+
+  def test_grid_covers_every_segment(self):
+    grid = self.matcher.grid
+    assert sorted(set(grid.segment_ids.tolist())) == list(range(len(self.geometry) - 1))
+    for segment in (0, 123, len(self.geometry) - 2):
+      cx, cy = grid.cell_of(self.matcher.lat[segment], self.matcher.lon[segment])
+      assert segment in grid.ring(cx, cy, 0)
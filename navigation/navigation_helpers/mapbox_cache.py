@@ -0,0 +1,91 @@
+import hashlib
+import logging
+import os
+import re
+import time
+
+from navigation.navigation_helpers.route_store import atomic_write
+
+CACHE_DIR = 'MapboxCache'
+GEOCODE_TTL = 30 * 24 * 3600  # seconds, addresses rarely move
+ROUTE_TTL = 24 * 3600  # seconds, road closures and new speed limits should show up within a day
+MAX_ENTRIES = 256
+MAX_BYTES = 32 * 1024 * 1024
+
+PROXIMITY_BUCKET = 0.1  # degrees, about 11 km: the proximity hint only breaks ties between far apart matches
+ORIGIN_BUCKET = 0.001  # degrees, about 100 m: well within what the route matcher snaps onto
+DESTINATION_BUCKET = 0.0001  # degrees, about 10 m
+BEARING_BUCKET = 45  # degrees
+
+
+def geocode_key(address: str, proximity_lon: float, proximity_lat: float) -> str:
+  '''Key on the address with case, punctuation and whitespace normalized, and a coarse proximity bucket'''
+  normalized = ' '.join(re.sub(r'[^\w\s]', ' ', address.casefold()).split())
+  return f'geocode:{normalized}:{_bucket(proximity_lon, PROXIMITY_BUCKET)}:{_bucket(proximity_lat, PROXIMITY_BUCKET)}'
+
+
+def route_key(start_lon: float, start_lat: float, end_lon: float, end_lat: float, bearing: float | None = None, alternatives: bool = False) -> str:
+  start = f'{_bucket(start_lon, ORIGIN_BUCKET)},{_bucket(start_lat, ORIGIN_BUCKET)}'
+  end = f'{_bucket(end_lon, DESTINATION_BUCKET)},{_bucket(end_lat, DESTINATION_BUCKET)}'
+  heading = 'none' if bearing is None else str(round((bearing % 360) / BEARING_BUCKET) % (360 // BEARING_BUCKET))
+  return f'{"alternatives" if alternatives else "routes"}:{start};{end}:{heading}'
+
+
+def _bucket(value: float, size: float) -> int:
+  return round(value / size)
+
+
+class MapboxCache:
+  '''Size bounded LRU cache of Mapbox responses, one file per entry under the params directory.
+
+  An entry's mtime is when it was stored and drives the TTL, its atime is set explicitly on every hit and drives
+  eviction, so the cache works the same on noatime mounts.
+  '''
+
+  def __init__(self, path: str, max_entries: int = MAX_ENTRIES, max_bytes: int = MAX_BYTES) -> None:
+    self.path = path
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+    os.makedirs(path, exist_ok=True)
+
+  def _entry_path(self, key: str) -> str:
+    return os.path.join(self.path, hashlib.sha256(key.encode()).hexdigest()[:32])
+
+  def get(self, key: str, ttl: float) -> bytes | None:
+    path = self._entry_path(key)
+    try:
+      with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        if time.time() - stat.st_mtime > ttl:
+          return None
+        data = f.read()
+      os.utime(path, ns=(time.time_ns(), stat.st_mtime_ns))
+    except FileNotFoundError:
+      return None
+    return data
+
+  def put(self, key: str, value: bytes) -> None:
+    '''Best effort, a full or read-only disk only costs the next lookup a network request'''
+    try:
+      atomic_write(self._entry_path(key), value)
+      self._evict()
+    except OSError:
+      logging.warning(f'Failed to cache {key}', exc_info=True)
+
+  def clear(self) -> None:
+    for entry in os.scandir(self.path):
+      os.remove(entry.path)
+
+  def _evict(self) -> None:
+    # Oldest access first, skipping in-progress atomic writes
+    entries = sorted(((entry.path, entry.stat()) for entry in os.scandir(self.path) if not entry.name.startswith('.')),
+                     key=lambda entry: entry[1].st_atime_ns)
+    count, total = len(entries), sum(stat.st_size for _, stat in entries)
+    for path, stat in entries:
+      if count <= self.max_entries and total <= self.max_bytes:
+        break
+      try:
+        os.remove(path)
+      except FileNotFoundError:
+        pass
+      count, total = count - 1, total - stat.st_size
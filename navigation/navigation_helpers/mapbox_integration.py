@@ -1,12 +1,48 @@
-import requests
+import json
+import logging
+import os
+import time
 from urllib.parse import quote
 
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
 from common.params.params import Params
+from navigation.navd.polyline import as_route_geometry
+from navigation.navigation_helpers.mapbox_cache import CACHE_DIR, GEOCODE_TTL, ROUTE_TTL, MapboxCache, geocode_key, route_key
+from navigation.navigation_helpers.route_store import remove_route, route_path, write_route
+from navigation.navigation_helpers.router import Geocoder, Router
+
+MAPBOX_BASE_URL = 'https://api.mapbox.com'
+REQUEST_TIMEOUT = 5  # seconds, per attempt
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
 
 
 class MapboxIntegration:
-  def __init__(self):
+  def __init__(self, base_url: str = MAPBOX_BASE_URL, retries: int = 2, backoff_factor: float = 0.3):
     self.params = Params()
+    self.base_url = base_url.rstrip('/')
+    self.request_times: dict[str, float] = {}  # seconds taken by the last request of each kind, retries included
+    self.cache = MapboxCache(os.path.join(self.params.params_dir, CACHE_DIR))
+    self.alternative_routes: list[dict] = []  # alternatives to the route stored by the last nav_confirmed
+
+    # One keep-alive session for geocoding and directions, so only the first request pays for DNS, TCP and TLS
+    retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=RETRY_STATUS_CODES, allowed_methods=('GET',), raise_on_status=False)
+    self.session = requests.Session()
+    self.session.mount('https://', HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=2))
+    self.session.mount('http://', HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=2))
+
+  def close(self) -> None:
+    self.session.close()
+
+  def _get(self, kind: str, path: str, params: dict) -> requests.Response:
+    start = time.monotonic()
+    try:
+      return self.session.get(f'{self.base_url}{path}', params=params, timeout=REQUEST_TIMEOUT)
+    finally:
+      self.request_times[kind] = time.monotonic() - start
+      logging.debug(f'Mapbox {kind} request took {self.request_times[kind] * 1000:.1f} ms')
 
   def get_public_token(self) -> str:
     token = str(self.params.get('MapboxToken', return_default=True))
@@ -18,25 +54,38 @@ class MapboxIntegration:
       return postvars, True
 
     addr = postvars['place_name']
-    if not addr:
+    if (location := self.geocode(addr, current_lon, current_lat)) is None:
       return postvars, False
+    longitude, latitude = location
+
+    postvars.update({'latitude': latitude, 'longitude': longitude, 'name': addr})
+    self.nav_confirmed(postvars, current_lon, current_lat, bearing)
+    return postvars, True
+
+  def geocode(self, addr, current_lon, current_lat) -> tuple[float, float] | None:
+    '''(longitude, latitude) of an address, the match closest to the current position'''
+    if not addr:
+      return None
+    cache_key = geocode_key(addr, current_lon, current_lat)
+    if (cached := self.cache.get(cache_key, GEOCODE_TTL)) is not None:
+      longitude, latitude = json.loads(cached)
+      return longitude, latitude
 
     token = self.get_public_token()
-    query = f'https://api.mapbox.com/geocoding/v5/mapbox.places/{quote(addr)}.json?access_token={token}&limit=1&proximity={current_lon},{current_lat}'
+    query = {'access_token': token, 'limit': 1, 'proximity': f'{current_lon},{current_lat}'}
     try:
-      response = requests.get(query, timeout=5)
-      if response.status_code == 200:
-        features = response.json()['features']
-        if features:
-          longitude, latitude = features[0]['geometry']['coordinates']
-          postvars.update({'latitude': latitude, 'longitude': longitude, 'name': addr})
-          self.nav_confirmed(postvars, current_lon, current_lat, bearing)
-          return postvars, True
+      response = self._get('geocoding', f'/geocoding/v5/mapbox.places/{quote(addr)}.json', query)
+      features = response.json()['features'] if response.status_code == 200 else None
     except requests.RequestException:
-      pass  # Handle network errors without crashing service
-    return postvars, False
+      features = None  # Handle network errors without crashing service
+    if not features:
+      return None
+    longitude, latitude = features[0]['geometry']['coordinates']
+    self.cache.put(cache_key, json.dumps([longitude, latitude]).encode())
+    return longitude, latitude
 
-  def nav_confirmed(self, postvars, start_lon, start_lat, bearing=None) -> None:
+  def nav_confirmed(self, postvars, start_lon, start_lat, bearing=None, router: Router | None = None) -> None:
+    '''Routes to the destination in postvars with router, Mapbox directions when None, and stores the route'''
     if not postvars:
       return
 
@@ -45,42 +94,67 @@ class MapboxIntegration:
 
     data: dict = {'navData': {'current': {'latitude': latitude, 'longitude': longitude}, 'route': {}}}
 
-    token = self.get_public_token()
-    route_data = self.generate_route(start_lon, start_lat, longitude, latitude, token, bearing)
+    # The route itself goes to a binary file next to the params, MapboxSettings only keeps the destination
+    alternatives = bool(self.params.get('MapboxAlternatives', return_default=True))
+    if router is not None:
+      routes = router.generate_routes(start_lon, start_lat, longitude, latitude, bearing, alternatives)
+    else:
+      routes = self.generate_routes(start_lon, start_lat, longitude, latitude, self.get_public_token(), bearing, alternatives)
+    route_data = routes[0] if routes else None
+    self.alternative_routes = routes[1:]
     if route_data:
-      data['navData']['route'] = route_data
+      write_route(route_path(self.params.params_dir), route_data, data['navData']['current'])
+    else:
+      remove_route(route_path(self.params.params_dir))
     self.params.put('MapboxSettings', data)
 
   def generate_route(self, start_lon, start_lat, end_lon, end_lat, token, bearing=None) -> dict | None:
+    routes = self.generate_routes(start_lon, start_lat, end_lon, end_lat, token, bearing)
+    return routes[0] if routes else None
+
+  def generate_routes(self, start_lon, start_lat, end_lon, end_lat, token, bearing=None, alternatives=False) -> list[dict]:
+    '''The recommended route first, followed by any alternatives Mapbox found when requested'''
     if not token:
-      return None
+      return []
+
+    cache_key = route_key(start_lon, start_lat, end_lon, end_lat, bearing, alternatives)
+    if (cached := self.cache.get(cache_key, ROUTE_TTL)) is not None:
+      return [self._decode_geometry(route) for route in json.loads(cached)]
 
     params = {
       'access_token': token,
-      'geometries': 'geojson',
+      'geometries': 'polyline6',  # a few bytes per point instead of a JSON coordinate pair
       'steps': 'true',
       'overview': 'full',
       'annotations': 'maxspeed',
-      'alternatives': 'false',
+      'alternatives': 'true' if alternatives else 'false',
       'banner_instructions': 'true',
     }
     if bearing is not None:
       params['bearings'] = f'{int((bearing + 360) % 360):.0f},90;'
 
     try:
-      response = requests.get(f'https://api.mapbox.com/directions/v5/mapbox/driving/{start_lon},{start_lat};{end_lon},{end_lat}', params=params, timeout=5)
+      response = self._get('directions', f'/directions/v5/mapbox/driving/{start_lon},{start_lat};{end_lon},{end_lat}', params)
       data = response.json() if response.status_code == 200 else {}
     except requests.RequestException:
-      return None
+      return []
 
     routes = data['routes'] if data else None
-    legs = routes[0]['legs'] if routes else None
+    if data.get('code') != 'Ok' or not routes or not routes[0]['legs']:
+      return []
 
-    if data.get('code') != 'Ok' or not routes or not legs:
-      return None
+    # Cached with the geometry still encoded, routes are returned with it decoded
+    route_data = [self._parse_route(route) for route in routes if route['legs']]
+    self.cache.put(cache_key, json.dumps(route_data).encode())
+    return [self._decode_geometry(route) for route in route_data]
+
+  @staticmethod
+  def _decode_geometry(route: dict) -> dict:
+    return {**route, 'geometry': as_route_geometry(route['geometry'])}
 
-    route = routes[0]
-    leg = legs[0]
+  @staticmethod
+  def _parse_route(route: dict) -> dict:
+    leg = route['legs'][0]
 
     steps = [
       {
@@ -101,6 +175,22 @@ class MapboxIntegration:
       'steps': steps,
       'totalDistance': route['distance'],
       'totalDuration': route['duration'],
-      'geometry': [{'longitude': coord[0], 'latitude': coord[1]} for coord in route['geometry']['coordinates']],
+      'geometry': route['geometry'],
       'maxspeed': maxspeed,
     }
+
+
+class MapboxRouter(Router):
+  def __init__(self, mapbox: MapboxIntegration) -> None:
+    self.mapbox = mapbox
+
+  def generate_routes(self, start_lon, start_lat, end_lon, end_lat, bearing=None, alternatives=False) -> list[dict]:
+    return self.mapbox.generate_routes(start_lon, start_lat, end_lon, end_lat, self.mapbox.get_public_token(), bearing, alternatives)
+
+
+class MapboxGeocoder(Geocoder):
+  def __init__(self, mapbox: MapboxIntegration) -> None:
+    self.mapbox = mapbox
+
+  def geocode(self, address: str, near_lon: float, near_lat: float) -> tuple[float, float] | None:
+    return self.mapbox.geocode(address, near_lon, near_lat)
@@ -1,6 +1,33 @@
+import bisect
+import logging
+import time
+
+import numpy as np
+
 from common.params.params import Params
 from navigation.common.constants import CV
-from navigation.navd.helpers import Coordinate, string_to_direction
+from navigation.navd.helpers import Coordinate, RouteGeometry, string_to_direction
+from navigation.navd.polyline import as_route_geometry
+from navigation.navd.route_matcher import RouteMatcher
+from navigation.navigation_helpers.route_store import read_route, route_path
+
+ON_ROUTE_DISTANCE = 25  # meters, matches further from the route don't count as progress
+REJOIN_AHEAD = 2000  # meters past the last on-route position where a recovery route rejoins the route
+REJOIN_DISTANCE = 50  # meters, the furthest a recovery route may end from its rejoin point
+
+
+def prepare_route(route: dict) -> dict:
+  '''Converts a route as from generate_route or the MapboxSettings JSON to RouteGeometry geometry and (speed, unit) tuple maxspeed.
+
+  Geometry may already be a RouteGeometry, or a polyline6 string or {'latitude', 'longitude'} dicts as stored in JSON.
+  '''
+  # Consecutive points mostly share a speed limit, keep one tuple per distinct value instead of one per point
+  maxspeed_values: dict[tuple, tuple] = {}
+  return {
+    **route,
+    'geometry': as_route_geometry(route['geometry']),
+    'maxspeed': [maxspeed_values.setdefault(value, value) for value in ((speed['speed'], speed['unit']) for speed in route['maxspeed'])],
+  }
 
 
 class NavigationInstructions:
@@ -10,6 +37,9 @@ class NavigationInstructions:
     self._cached_route = None
     self._route_loaded = False
     self._no_route = False
+    self.route_ingest_time: float = 0.0  # seconds spent building the cached route from params
+    self.last_on_route_cumulative: float | None = None
+    self.alternatives: list[dict] = []  # ingested alternative routes to the same destination
 
   def get_route_progress(self, current_lat, current_lon) -> dict | None:
     '''Get current position on route and progress information'''
@@ -17,15 +47,13 @@ class NavigationInstructions:
     if not route or not route['geometry'] or not route['steps']:
       return None
 
-    self.coord.latitude = current_lat
-    self.coord.longitude = current_lon
-
-    # Find closest point on the route polyline
-    closest_idx, min_distance = min(((idx, self.coord.distance_to(coord)) for idx, coord in enumerate(route['geometry'])), key=lambda x: x[1])
-    closest_cumulative = route['cumulative_distances'][closest_idx]
+    # Project onto the route polyline, tracking from the previous match
+    _, min_distance, closest_cumulative = route['matcher'].match(current_lat, current_lon)
+    if min_distance <= ON_ROUTE_DISTANCE:
+      self.last_on_route_cumulative = closest_cumulative
 
     # Find the current step idx: the highest idx where the step location cumulative <= closest_cumulative
-    current_step_idx = max((idx for idx, step in enumerate(route['steps']) if step['cumulative_distance'] <= closest_cumulative), default=-1)
+    current_step_idx = bisect.bisect_right(route['step_cumulative_distances'], closest_cumulative) - 1
     current_step = route['steps'][current_step_idx if current_step_idx >= 0 else 0] if route['steps'] else None
 
     # Next turn is the next step after current
@@ -41,9 +69,9 @@ class NavigationInstructions:
     total_distance_remaining: float = max(0, route['total_distance'] - closest_cumulative)
     total_time_remaining: float = 0.0
     if current_step:
-      progress_in_step = (closest_cumulative - current_step['cumulative_distance']) / current_step['distance']
+      progress_in_step = (closest_cumulative - current_step['cumulative_distance']) / current_step['distance'] if current_step['distance'] > 0 else 1.0
       time_left_in_step = (1 - progress_in_step) * current_step['duration']
-      total_time_remaining = time_left_in_step + sum(step['duration'] for step in route['steps'][current_step_idx + 1 :])
+      total_time_remaining = time_left_in_step + route['remaining_durations'][current_step_idx + 1]
 
     all_maneuvers: list = []
     max_maneuvers = 2
@@ -76,46 +104,191 @@ class NavigationInstructions:
     if self._no_route:
       return None
 
-    param_value = self.params.get('MapboxSettings')
-    route = param_value['navData']['route'] if param_value else None
+    ingest_start = time.monotonic()
+    route = self._load_route()
     if not route:
       self._no_route = True
       return None
-    steps = []
 
-    geometry = [Coordinate(coord['latitude'], coord['longitude']) for coord in route['geometry']]
-    cumulative_distances = [0.0]
-    cumulative_distances.extend(cumulative_distances[-1] + geometry[step - 1].distance_to(geometry[step]) for step in range(1, len(geometry)))
-    maxspeed = [(speed['speed'], speed['unit']) for speed in route['maxspeed']]
+    self._set_route(self.ingest_route(route))
+    self.route_ingest_time = time.monotonic() - ingest_start
+    logging.debug(f'Route ingested in {self.route_ingest_time * 1000:.1f} ms ({len(route["geometry"])} points, {len(route["steps"])} steps)')
+    return self._cached_route
+
+  @classmethod
+  def ingest_route(cls, route: dict) -> dict:
+    '''Builds the cached route structure used for progress queries from a route as returned by prepare_route'''
+    geometry = route['geometry']
+    matcher = RouteMatcher(geometry)
+    maxspeed = route['maxspeed']
+    steps = cls._anchor_steps(route['steps'], matcher, maxspeed)
+    return cls._build_route(steps, route['totalDistance'], route['totalDuration'], matcher, geometry, maxspeed)
+
+  @staticmethod
+  def _anchor_steps(route_steps: list, matcher: RouteMatcher, maxspeed: list) -> list[dict]:
     steps = []
-    for step in route['steps']:
+    closest_idx = 0
+    for step in route_steps:
+      # Steps are ordered along the geometry, so each one is anchored at or after the previous anchor
       location = Coordinate(step['location']['latitude'], step['location']['longitude'])
-      closest_idx = min(range(len(geometry)), key=lambda i: location.distance_to(geometry[i]))
+      closest_idx, _ = matcher.nearest_point(location.latitude, location.longitude, closest_idx)
       steps.append({
         'bannerInstructions': step['bannerInstructions'],
         'distance': step['distance'],
         'duration': step['duration'],
         'maneuver': step['maneuver'],
         'location': location,
-        'cumulative_distance': cumulative_distances[closest_idx],
+        'cumulative_distance': float(matcher.cumulative[closest_idx]),
         'maxspeed': maxspeed[closest_idx] if closest_idx < len(maxspeed) else None,
         'modifier': string_to_direction(step['modifier']),
       })
-    self._cached_route = {
+    return steps
+
+  @staticmethod
+  def _build_route(steps: list[dict], total_distance: float, total_duration: float, matcher: RouteMatcher, geometry: RouteGeometry,
+                   maxspeed: list) -> dict:
+    # remaining_durations[i] is the total duration of steps[i:], with a trailing 0.0 for past the last step
+    remaining_durations = [0.0] * (len(steps) + 1)
+    for idx in range(len(steps) - 1, -1, -1):
+      remaining_durations[idx] = remaining_durations[idx + 1] + steps[idx]['duration']
+
+    return {
       'steps': steps,
-      'total_distance': route['totalDistance'],
-      'total_duration': route['totalDuration'],
+      'step_cumulative_distances': [step['cumulative_distance'] for step in steps],
+      'remaining_durations': remaining_durations,
+      'total_distance': total_distance,
+      'total_duration': total_duration,
       'geometry': geometry,
-      'cumulative_distances': cumulative_distances,
+      'cumulative_distances': matcher.cumulative,
       'maxspeed': maxspeed,
+      'matcher': matcher,
     }
+
+  def _set_route(self, route: dict) -> None:
+    self._cached_route = route
     self._route_loaded = True
-    return self._cached_route
+    self.last_on_route_cumulative = None
+
+  def set_alternatives(self, alternatives: list[dict]) -> None:
+    '''Alternative routes to the current destination, as built by ingest_route'''
+    self.alternatives = alternatives
+
+  def switch_to_alternative(self, current_lat, current_lon) -> bool:
+    '''Makes the closest alternative within ON_ROUTE_DISTANCE the current route, keeping the current one as an alternative'''
+    best_idx, best_distance = None, ON_ROUTE_DISTANCE
+    for idx, alternative in enumerate(self.alternatives):
+      _, distance, _ = alternative['matcher'].locate(current_lat, current_lon)
+      if distance <= best_distance:
+        best_idx, best_distance = idx, distance
+    if best_idx is None:
+      return False
+
+    route = self.alternatives.pop(best_idx)
+    if self._cached_route is not None:
+      self.alternatives.append(self._cached_route)
+    route['matcher'].reset()
+    self._set_route(route)
+    logging.debug(f'Switched to alternative route, {best_distance:.1f} m away')
+    return True
+
+  def rejoin_point(self) -> tuple[int, Coordinate] | None:
+    '''Route point a recovery route should rejoin the current route at, None when a full reroute is needed'''
+    route = self._cached_route
+    if route is None or self.last_on_route_cumulative is None:
+      return None
+    cumulative = route['cumulative_distances']
+    idx = int(np.searchsorted(cumulative, self.last_on_route_cumulative + REJOIN_AHEAD))
+    if idx >= len(cumulative) - 1:  # close to the destination, route there directly
+      return None
+    return idx, route['geometry'][idx]
+
+  def splice_route(self, recovery: dict, rejoin_idx: int) -> bool:
+    '''Replaces the current route up to rejoin_idx with a recovery route ending there, as from generate_route.
+
+    Only the recovery route is ingested: the rest of the route keeps its geometry, steps and distances, shifted by
+    the difference in length. A recovery route ending further than REJOIN_DISTANCE from the rejoin point is rejected.
+    '''
+    route = self._cached_route
+    if route is None or not recovery or len(recovery['geometry']) < 2 or not 0 <= rejoin_idx < len(route['geometry']) - 1:
+      return False
+
+    splice_start = time.monotonic()
+    recovery = prepare_route(recovery)
+    recovery_geometry = recovery['geometry']
+    if (miss := recovery_geometry[-1].distance_to(route['geometry'][rejoin_idx])) > REJOIN_DISTANCE:
+      logging.warning(f'Recovery route ends {miss:.0f} m from its rejoin point {rejoin_idx}, not splicing')
+      return False
+    recovery_matcher = RouteMatcher(recovery_geometry)
+    recovery_maxspeed = recovery['maxspeed']
+    recovery_steps = self._anchor_steps([step for step in recovery['steps'] if step['maneuver'] != 'arrive'], recovery_matcher, recovery_maxspeed)
+
+    # The recovery route ends at the rejoin point, the old route continues from the point after it
+    old_geometry, old_cumulative = route['geometry'], route['cumulative_distances']
+    tail_start = rejoin_idx + 1
+    rejoin_cumulative = float(recovery_matcher.cumulative[-1])
+    gap = recovery_geometry[-1].distance_to(old_geometry[tail_start])
+    offset = rejoin_cumulative + gap - float(old_cumulative[tail_start])
+
+    geometry = RouteGeometry(np.concatenate((recovery_geometry.latitudes, old_geometry.latitudes[tail_start:])),
+                             np.concatenate((recovery_geometry.longitudes, old_geometry.longitudes[tail_start:])))
+    cumulative = np.concatenate((recovery_matcher.cumulative, old_cumulative[tail_start:] + offset))
+
+    # Speed limits are per point, pad the recovery part so the old limits stay aligned with their points
+    recovery_maxspeed = recovery_maxspeed[:len(recovery_geometry)]
+    padding = recovery_maxspeed[-1] if recovery_maxspeed else (route['maxspeed'][rejoin_idx] if rejoin_idx < len(route['maxspeed']) else None)
+    maxspeed = recovery_maxspeed + [padding] * (len(recovery_geometry) - len(recovery_maxspeed)) + route['maxspeed'][tail_start:]
+
+    # The old step in progress at the rejoin point resumes from there, later steps only move along the route
+    old_rejoin_cumulative = float(old_cumulative[rejoin_idx])
+    step_idx = bisect.bisect_right(route['step_cumulative_distances'], old_rejoin_cumulative) - 1
+    steps = recovery_steps
+    if step_idx >= 0:
+      resumed = route['steps'][step_idx]
+      step_end = resumed['cumulative_distance'] + resumed['distance']
+      distance = max(0.0, step_end - old_rejoin_cumulative)
+      steps.append({
+        **resumed,
+        'distance': distance,
+        'duration': resumed['duration'] * distance / resumed['distance'] if resumed['distance'] > 0 else 0.0,
+        'location': old_geometry[rejoin_idx],
+        'cumulative_distance': rejoin_cumulative,
+      })
+    steps.extend({**step, 'cumulative_distance': step['cumulative_distance'] + offset} for step in route['steps'][step_idx + 1:])
+
+    matcher = RouteMatcher(geometry, cumulative)
+    total_duration = sum(step['duration'] for step in steps)
+    self._set_route(self._build_route(steps, route['total_distance'] + offset, total_duration, matcher, geometry, maxspeed))
+    self.route_ingest_time = time.monotonic() - splice_start
+    logging.debug(f'Route spliced in {self.route_ingest_time * 1000:.1f} ms ({len(recovery_geometry)} new points, rejoining at {rejoin_idx})')
+    return True
+
+  def _load_route(self) -> dict | None:
+    '''Loads the route from the binary route file, or from MapboxSettings JSON when a route is stored inline there.
+
+    The returned route has a RouteGeometry geometry and (speed, unit) tuple maxspeed.
+    '''
+    param_value = self.params.get('MapboxSettings')
+    nav_data = param_value.get('navData') if param_value else None
+    if not nav_data:
+      return None
+
+    if route := nav_data.get('route'):
+      return prepare_route(route)
+
+    stored = read_route(route_path(self.params.params_dir))
+    if stored is None:
+      return None
+    route, destination = stored
+    if destination != nav_data.get('current'):  # left over from a previous destination
+      return None
+    return route
 
   def clear_route_cache(self):
     self._cached_route = None
     self._route_loaded = False
     self._no_route = False
+    self.last_on_route_cumulative = None
+    self.alternatives = []
 
   def get_upcoming_turn_from_progress(self, progress, current_lat, current_lon) -> str:
     if progress and progress['next_turn']:
@@ -0,0 +1,150 @@
+import json
+import logging
+import mmap
+import os
+import tempfile
+
+import capnp
+import numpy as np
+
+import messaging.messenger as messenger
+from navigation.navd.helpers import RouteGeometry
+from navigation.navd.polyline import as_route_geometry
+
+ROUTE_FILE = 'MapboxRouteData'
+
+
+class LazyBanners:
+  '''Step bannerInstructions kept as JSON text and decoded on first access.'''
+
+  __slots__ = ('_text', '_banners')
+
+  def __init__(self, text: str) -> None:
+    self._text = text
+    self._banners: list | None = None
+
+  def _decoded(self) -> list:
+    if self._banners is None:
+      self._banners = json.loads(self._text) if self._text else []
+    return self._banners
+
+  def __len__(self) -> int:
+    return len(self._decoded())
+
+  def __getitem__(self, idx):
+    return self._decoded()[idx]
+
+  def __iter__(self):
+    return iter(self._decoded())
+
+
+def route_path(params_dir: str) -> str:
+  return os.path.join(params_dir, ROUTE_FILE)
+
+
+def encode_route(route: dict, destination: dict) -> bytes:
+  '''Serializes a route as returned by MapboxIntegration.generate_route into a NavRoute message'''
+  msg = messenger.schema.NavRoute.new_message()
+  msg.destinationLatitude = destination['latitude']
+  msg.destinationLongitude = destination['longitude']
+  msg.totalDistance = route['totalDistance']
+  msg.totalDuration = route['totalDuration']
+
+  geometry = as_route_geometry(route['geometry'])
+  msg.geometry = np.column_stack((geometry.latitudes, geometry.longitudes)).astype('<f8').tobytes()
+
+  units = sorted({item['unit'] for item in route['maxspeed']})
+  msg.maxspeed = np.array([item['speed'] for item in route['maxspeed']], dtype='<f8').tobytes()
+  msg.maxspeedUnit = np.array([units.index(item['unit']) for item in route['maxspeed']], dtype=np.uint8).tobytes()
+  msg.maxspeedUnits = units
+
+  steps = msg.init('steps', len(route['steps']))
+  for step, src in zip(steps, route['steps'], strict=True):
+    step.maneuver = src['maneuver']
+    step.instruction = src.get('instruction', '')
+    step.distance = src['distance']
+    step.duration = src['duration']
+    step.latitude = src['location']['latitude']
+    step.longitude = src['location']['longitude']
+    step.modifier = src['modifier']
+    step.bannerInstructions = json.dumps(src['bannerInstructions'])
+  return bytes(msg.to_bytes())
+
+
+def decode_route(data) -> tuple[dict, dict]:
+  '''Inverse of encode_route, returning the route and its destination.
+
+  Geometry comes back as a RouteGeometry, maxspeed as (speed, unit) tuples shared between points with the same
+  limit, and bannerInstructions as LazyBanners.
+  '''
+  with messenger.schema.NavRoute.from_bytes(data) as msg:
+    points = np.frombuffer(msg.geometry, dtype='<f8').reshape(-1, 2)
+    units = list(msg.maxspeedUnits)
+    speeds = np.frombuffer(msg.maxspeed, dtype='<f8').tolist()
+    unit_idxs = np.frombuffer(msg.maxspeedUnit, dtype=np.uint8).tolist()
+    maxspeed_values: dict[tuple, tuple] = {}
+    maxspeed = [maxspeed_values.setdefault(key, (key[0], units[key[1]])) for key in zip(speeds, unit_idxs, strict=True)]
+    route = {
+      'steps': [
+        {
+          'maneuver': step.maneuver,
+          'instruction': step.instruction,
+          'distance': step.distance,
+          'duration': step.duration,
+          'location': {'latitude': step.latitude, 'longitude': step.longitude},
+          'modifier': step.modifier,
+          'bannerInstructions': LazyBanners(step.bannerInstructions),
+        }
+        for step in msg.steps
+      ],
+      'totalDistance': msg.totalDistance,
+      'totalDuration': msg.totalDuration,
+      'geometry': RouteGeometry(np.ascontiguousarray(points[:, 0]), np.ascontiguousarray(points[:, 1])),
+      'maxspeed': maxspeed,
+    }
+    destination = {'latitude': msg.destinationLatitude, 'longitude': msg.destinationLongitude}
+  return route, destination
+
+
+def atomic_write(path: str, data: bytes) -> None:
+  '''Atomically replaces a file, like params writes'''
+  fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp_')
+  try:
+    with os.fdopen(fd, 'wb') as f:
+      f.write(data)
+      f.flush()
+      os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+  except OSError:
+    os.unlink(tmp_path)
+    raise
+
+
+def write_route(path: str, route: dict, destination: dict) -> None:
+  atomic_write(path, encode_route(route, destination))
+
+
+def read_route(path: str) -> tuple[dict, dict] | None:
+  '''Memory maps and decodes the route file, None when there is no route stored.
+
+  A file that does not decode, empty, corrupt or written by an incompatible version, is removed and counts as no route.
+  '''
+  try:
+    f = open(path, 'rb')
+  except FileNotFoundError:
+    return None
+  with f:
+    try:
+      with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:  # ValueError on an empty file
+        return decode_route(mapped)
+    except (capnp.KjException, ValueError, IndexError):
+      logging.warning(f'Removing unreadable route file {path}', exc_info=True)
+  remove_route(path)
+  return None
+
+
+def remove_route(path: str) -> None:
+  try:
+    os.remove(path)
+  except FileNotFoundError:
+    pass
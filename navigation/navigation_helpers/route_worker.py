@@ -0,0 +1,96 @@
+import logging
+import queue
+import threading
+from dataclasses import dataclass, field
+
+from navigation.navd.helpers import Coordinate
+from navigation.navigation_helpers.mapbox_integration import MapboxIntegration
+from navigation.navigation_helpers.nav_instructions import NavigationInstructions, prepare_route
+from navigation.navigation_helpers.router import Geocoder, Router
+
+
+@dataclass
+class RouteRequest:
+  destination: str
+  longitude: float
+  latitude: float
+  bearing: float | None = None
+  rejoin: Coordinate | None = None  # when set, only route back to this point on the current route
+  rejoin_idx: int = 0
+  route: dict | None = None  # the current route a rejoin request was made for, rejoin_idx indexes its geometry
+
+
+@dataclass
+class RouteResult:
+  request: RouteRequest
+  valid: bool
+  route: dict | None = None  # the recovery route of a rejoin request
+  alternatives: list[dict] = field(default_factory=list)  # ingested alternatives to a new route
+
+
+class RouteWorker:
+  '''Runs geocoding and routing on a background thread so the caller's loop never blocks on HTTP.
+
+  Only one request is in flight at a time. Submitting while busy replaces the pending request, since only the
+  newest destination and position matter.
+  '''
+
+  def __init__(self, mapbox: MapboxIntegration, router: Router, geocoder: Geocoder) -> None:
+    self.mapbox = mapbox  # stores the route and its destination
+    self.router = router
+    self.geocoder = geocoder
+    self._condition = threading.Condition()
+    self._pending: RouteRequest | None = None
+    self._in_flight: bool = False
+    self._results: queue.Queue[RouteResult] = queue.Queue()
+    self._thread = threading.Thread(target=self._run, daemon=True, name='RouteWorker')
+    self._thread.start()
+
+  @property
+  def busy(self) -> bool:
+    with self._condition:
+      return self._pending is not None or self._in_flight
+
+  def submit(self, request: RouteRequest) -> None:
+    with self._condition:
+      self._pending = request
+      self._condition.notify()
+
+  def poll(self) -> RouteResult | None:
+    '''Newest finished result, if any, without blocking'''
+    result = None
+    while True:
+      try:
+        result = self._results.get_nowait()
+      except queue.Empty:
+        return result
+
+  def _run(self) -> None:
+    while True:
+      with self._condition:
+        while self._pending is None:
+          self._condition.wait()
+        request, self._pending = self._pending, None
+        self._in_flight = True
+
+      route, alternatives = None, []
+      try:
+        if request.rejoin is not None:
+          route = self.router.generate_route(request.longitude, request.latitude, request.rejoin.longitude, request.rejoin.latitude, request.bearing)
+          valid = route is not None
+        elif (location := self.geocoder.geocode(request.destination, request.longitude, request.latitude)) is None:
+          valid = False
+        else:
+          longitude, latitude = location
+          postvars = {'place_name': request.destination, 'name': request.destination, 'latitude': latitude, 'longitude': longitude}
+          self.mapbox.nav_confirmed(postvars, request.longitude, request.latitude, request.bearing, self.router)
+          valid = True
+          # Ingest alternatives here, so switching to one later costs the navigationd loop nothing
+          alternatives = [NavigationInstructions.ingest_route(prepare_route(alternative)) for alternative in self.mapbox.alternative_routes]
+      except Exception:
+        logging.exception(f'Routing to {request.destination} failed')
+        valid = False
+
+      with self._condition:
+        self._results.put(RouteResult(request, valid, route, alternatives))
+        self._in_flight = False
@@ -0,0 +1,208 @@
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from navigation.navd import geo
+from navigation.navd.helpers import RouteGeometry
+from navigation.navd.road_graph import RoadGraph
+
+ROAD_GRAPH_FILE = 'RoadGraph'
+MAX_SNAP_DISTANCE = 500  # meters, farther start or end points are outside the graph's coverage
+STRAIGHT_ANGLE = 20  # degrees of heading change below which a junction is passed straight through
+TURN_ANGLE = 45  # degrees of heading change at a junction that makes a turn step
+
+
+def road_graph_path(params_dir: str) -> str:
+  return os.path.join(params_dir, ROAD_GRAPH_FILE)
+
+
+class Router(ABC):
+  '''Source of routes, each in the dict shape returned by MapboxIntegration.generate_routes'''
+
+  @abstractmethod
+  def generate_routes(self, start_lon, start_lat, end_lon, end_lat, bearing=None, alternatives=False) -> list[dict]:
+    '''The recommended route first, followed by any alternatives when requested and supported, empty on failure'''
+
+  def generate_route(self, start_lon, start_lat, end_lon, end_lat, bearing=None) -> dict | None:
+    routes = self.generate_routes(start_lon, start_lat, end_lon, end_lat, bearing)
+    return routes[0] if routes else None
+
+
+class FallbackRouter(Router):
+  '''Tries each router in order, returning the first routes found'''
+
+  def __init__(self, routers: list[Router]) -> None:
+    self.routers = routers
+
+  def generate_routes(self, start_lon, start_lat, end_lon, end_lat, bearing=None, alternatives=False) -> list[dict]:
+    for router in self.routers:
+      if routes := router.generate_routes(start_lon, start_lat, end_lon, end_lat, bearing, alternatives):
+        return routes
+      logging.debug(f'{type(router).__name__} found no route, trying the next router')
+    return []
+
+
+class Geocoder(ABC):
+  '''Source of destination coordinates for an address, kept apart from routing'''
+
+  @abstractmethod
+  def geocode(self, address: str, near_lon: float, near_lat: float) -> tuple[float, float] | None:
+    '''(longitude, latitude) of the address, preferring matches near the given position, None when not found'''
+
+
+class FallbackGeocoder(Geocoder):
+  '''Tries each geocoder in order, returning the first match'''
+
+  def __init__(self, geocoders: list[Geocoder]) -> None:
+    self.geocoders = geocoders
+
+  def geocode(self, address: str, near_lon: float, near_lat: float) -> tuple[float, float] | None:
+    for geocoder in self.geocoders:
+      if (location := geocoder.geocode(address, near_lon, near_lat)) is not None:
+        return location
+      logging.debug(f'{type(geocoder).__name__} did not find {address}, trying the next geocoder')
+    return None
+
+
+def turn_modifier(angle: float) -> str:
+  '''Mapbox maneuver modifier for a heading change in degrees, positive to the right'''
+  magnitude = abs(angle)
+  if magnitude < STRAIGHT_ANGLE:
+    return 'straight'
+  if magnitude > 170:
+    return 'uturn'
+  side = 'right' if angle > 0 else 'left'
+  if magnitude < 60:
+    return f'slight {side}'
+  if magnitude < 135:
+    return side
+  return f'sharp {side}'
+
+
+class LocalRouter(Router):
+  '''Routes offline over a RoadGraph, loaded on first use when given a path'''
+
+  def __init__(self, graph: RoadGraph | str) -> None:
+    self._graph = graph if isinstance(graph, RoadGraph) else None
+    self._path = graph if isinstance(graph, str) else None
+
+  @property
+  def graph(self) -> RoadGraph:
+    if self._graph is None:
+      assert self._path is not None
+      self._graph = RoadGraph.load(self._path)
+    return self._graph
+
+  def generate_routes(self, start_lon, start_lat, end_lon, end_lat, bearing=None, alternatives=False) -> list[dict]:
+    '''A single route, as the graph search has no alternatives. The start is snapped to the nearest node, ignoring bearing.'''
+    start_time = time.monotonic()
+    graph = self.graph
+    source, source_distance = graph.nearest_node(start_lat, start_lon)
+    target, target_distance = graph.nearest_node(end_lat, end_lon, incoming=True)
+    if max(source_distance, target_distance) > MAX_SNAP_DISTANCE:
+      return []
+
+    path = graph.shortest_path(source, target)
+    if path is None or len(path) < 2:
+      return []
+    route = self._build_route(path)
+    logging.debug(f'Local route with {len(path)} nodes found in {(time.monotonic() - start_time) * 1000:.1f} ms')
+    return [route]
+
+  def _build_route(self, path: list[int]) -> dict:
+    graph = self.graph
+    nodes = np.asarray(path)
+    lat, lon = graph.latitudes[nodes], graph.longitudes[nodes]
+    edges = [graph.edge_between(a, b) for a, b in zip(path, path[1:], strict=False)]
+    lengths = graph.lengths[edges].astype(np.float64).tolist()
+    durations = [graph.edge_cost(edge) for edge in edges]
+    names = [graph.names[name_id] for name_id in graph.name_ids[edges].tolist()]
+    bearings = geo.bearing(lat[:-1], lon[:-1], lat[1:], lon[1:]).tolist()
+    out_degrees = np.diff(graph.offsets)[nodes].tolist()
+
+    # A new step starts where the road name changes, or at a turn at a junction
+    starts = [(0, 'depart', 'none')]
+    for idx in range(1, len(edges)):
+      angle = (bearings[idx] - bearings[idx - 1] + 540) % 360 - 180
+      modifier = turn_modifier(angle)
+      if names[idx] != names[idx - 1]:
+        starts.append((idx, 'new name' if modifier == 'straight' else 'turn', modifier))
+      elif out_degrees[idx] > 2 and abs(angle) >= TURN_ANGLE:
+        starts.append((idx, 'turn', modifier))
+
+    steps = []
+    for step_idx, (edge_start, maneuver, modifier) in enumerate(starts):
+      edge_end = starts[step_idx + 1][0] if step_idx + 1 < len(starts) else len(edges)
+      name = names[edge_start]
+      if maneuver == 'depart':
+        instruction = f'Drive {"on " + name if name else "along the road"}'
+      elif maneuver == 'new name':
+        instruction = f'Continue onto {name}' if name else 'Continue'
+      else:
+        instruction = f'Turn {modifier}' + (f' onto {name}' if name else '')
+      steps.append({
+        'maneuver': maneuver,
+        'instruction': instruction,
+        'distance': sum(lengths[edge_start:edge_end]),
+        'duration': sum(durations[edge_start:edge_end]),
+        'location': {'longitude': float(lon[edge_start]), 'latitude': float(lat[edge_start])},
+        'modifier': modifier,
+      })
+    steps.append({
+      'maneuver': 'arrive',
+      'instruction': 'You have arrived at your destination',
+      'distance': 0.0,
+      'duration': 0.0,
+      'location': {'longitude': float(lon[-1]), 'latitude': float(lat[-1])},
+      'modifier': 'none',
+    })
+
+    # Like Mapbox, a step's banner announces the maneuver that ends it
+    banner_texts = [names[edge_start] for edge_start, _, _ in starts[1:]] + ['Destination']
+    for step, following, text in zip(steps[:-1], steps[1:], banner_texts, strict=True):
+      step['bannerInstructions'] = [{
+        'distanceAlongGeometry': step['distance'],
+        'primary': {'text': text, 'type': following['maneuver'], 'modifier': following['modifier']},
+      }]
+    steps[-1]['bannerInstructions'] = []
+
+    return {
+      'steps': steps,
+      'totalDistance': sum(lengths),
+      'totalDuration': sum(durations),
+      'geometry': RouteGeometry(lat, lon),
+      'maxspeed': [{'speed': int(speed), 'unit': 'km/h'} for speed in graph.speed_limits[edges].tolist()],
+    }
+
+
+def street_name(address: str) -> str:
+  '''Street of an address for matching road names: before the first comma, without a leading house number, casefolded'''
+  words = address.split(',')[0].split()
+  if words and words[0].isdigit():
+    words = words[1:]
+  return ' '.join(words).casefold()
+
+
+class LocalGeocoder(Geocoder):
+  '''Street-level geocoding over a LocalRouter's road graph, so destinations can be set offline.
+
+  An address resolves to the point of the road with its street name closest to the given position.
+  '''
+
+  def __init__(self, router: LocalRouter) -> None:
+    self.router = router
+
+  def geocode(self, address: str, near_lon: float, near_lat: float) -> tuple[float, float] | None:
+    if not (street := street_name(address)):
+      return None
+    graph = self.router.graph
+    name_ids = [name_id for name_id, name in enumerate(graph.names) if name and name.casefold() == street]
+    if not name_ids:
+      return None
+    nodes = np.unique(graph.targets[np.isin(graph.name_ids, name_ids)])  # reached by the road, so routable to
+    east, north = geo.local_enu(graph.latitudes[nodes], graph.longitudes[nodes], near_lat, near_lon)
+    node = nodes[np.argmin(east * east + north * north)]
+    return float(graph.longitudes[node]), float(graph.latitudes[node])
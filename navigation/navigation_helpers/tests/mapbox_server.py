@@ -0,0 +1,109 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from navigation.navd.polyline import as_route_geometry, encode_polyline
+
+
+def directions_response(*routes: dict, geometries: str = 'polyline6') -> dict:
+  '''Wraps routes in the shape of a Mapbox directions API response'''
+  return {'code': 'Ok', 'routes': [directions_route(route, geometries) for route in routes]}
+
+
+def directions_route(route: dict, geometries: str = 'polyline6') -> dict:
+  steps = [
+    {
+      'distance': step['distance'],
+      'duration': step['duration'],
+      'maneuver': {
+        'type': step['maneuver'],
+        'instruction': step['instruction'],
+        'location': [step['location']['longitude'], step['location']['latitude']],
+        'modifier': step['modifier'],
+      },
+      'bannerInstructions': step['bannerInstructions'],
+    }
+    for step in route['steps']
+  ]
+  geometry = as_route_geometry(route['geometry'])
+  return {
+    'distance': route['totalDistance'],
+    'duration': route['totalDuration'],
+    'geometry': encode_polyline(geometry) if geometries == 'polyline6' else {
+      'type': 'LineString', 'coordinates': [[point.longitude, point.latitude] for point in geometry]},
+    'legs': [{'steps': steps, 'annotation': {'maxspeed': route['maxspeed']}}],
+  }
+
+
+class MapboxStandIn:
+  '''Local HTTP server mimicking the Mapbox geocoding and directions endpoints.
+
+  Every directions request returns `route`, followed by `alternatives` when requested, and every geocoding request
+  the route's last point. Counts connections and requests per endpoint, and answers the next `fail_next` requests
+  with a 503.
+  '''
+
+  def __init__(self, route: dict, alternatives: list[dict] | None = None) -> None:
+    self.route = route
+    self.alternatives = alternatives or []
+    self.connections = 0
+    self.requests: list[tuple[str, dict]] = []
+    self.fail_next = 0
+    self._lock = threading.Lock()
+    self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+    self._server.daemon_threads = True
+    self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+  @property
+  def base_url(self) -> str:
+    return f'http://127.0.0.1:{self._server.server_port}'
+
+  def __enter__(self) -> 'MapboxStandIn':
+    self._thread.start()
+    return self
+
+  def __exit__(self, *exc) -> None:
+    self._server.shutdown()
+    self._server.server_close()
+
+  def _respond(self, path: str, query: dict) -> tuple[int, dict]:
+    with self._lock:
+      self.requests.append((path, query))
+      if self.fail_next > 0:
+        self.fail_next -= 1
+        return 503, {'message': 'Service Unavailable'}
+
+    if path.startswith('/geocoding/v5/mapbox.places/'):
+      destination = self.route['geometry'][-1]
+      return 200, {'features': [{'geometry': {'coordinates': [destination['longitude'], destination['latitude']]}}]}
+    if path.startswith('/directions/v5/mapbox/driving/'):
+      alternatives = self.alternatives if query.get('alternatives') == 'true' else []
+      return 200, directions_response(self.route, *alternatives, geometries=query.get('geometries', 'geojson'))
+    return 404, {'message': 'Not Found'}
+
+  def _handler(self) -> type[BaseHTTPRequestHandler]:
+    stand_in = self
+
+    class Handler(BaseHTTPRequestHandler):
+      protocol_version = 'HTTP/1.1'  # keep-alive
+
+      def setup(self) -> None:
+        super().setup()
+        with stand_in._lock:
+          stand_in.connections += 1
+
+      def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        status, body = stand_in._respond(url.path, {key: values[0] for key, values in parse_qs(url.query).items()})
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+      def log_message(self, format, *args) -> None:
+        pass
+
+    return Handler
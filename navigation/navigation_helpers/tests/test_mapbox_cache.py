@@ -0,0 +1,110 @@
+import os
+import time
+
+import pytest
+
+from navigation.navigation_helpers.mapbox_cache import MapboxCache, geocode_key, route_key
+from navigation.navigation_helpers.mapbox_integration import MapboxIntegration
+from navigation.navigation_helpers.tests.mapbox_server import MapboxStandIn
+from navigation.tests.routes import make_route
+
+
+def age(cache: MapboxCache, key: str, seconds: float) -> None:
+  path = cache._entry_path(key)
+  stat = os.stat(path)
+  os.utime(path, (stat.st_atime - seconds, stat.st_mtime - seconds))
+
+
+class TestCacheKeys:
+  def test_geocode_key_normalizes_address(self):
+    assert geocode_key('740 E. Ventura Blvd,  Camarillo', -119.17, 34.23) == geocode_key('740 e ventura blvd camarillo', -119.16, 34.24)
+    assert geocode_key('Home', -119.17, 34.23) != geocode_key('Home', -118.2, 34.05)
+
+  def test_route_key_quantizes(self):
+    assert route_key(-119.17557, 34.23305, -119.1, 34.3, 91.0) == route_key(-119.17560, 34.23301, -119.1, 34.3, 80.0)
+    assert route_key(-119.17557, 34.23305, -119.1, 34.3, 90.0) != route_key(-119.17557, 34.23305, -119.1, 34.3, 270.0)
+    assert route_key(-119.17557, 34.23305, -119.1, 34.3, 359.0) == route_key(-119.17557, 34.23305, -119.1, 34.3, 1.0)
+    assert route_key(-119.17557, 34.23305, -119.1, 34.3) != route_key(-119.18557, 34.23305, -119.1, 34.3)
+
+
+class TestMapboxCache:
+  def test_get_put(self, tmp_path):
+    cache = MapboxCache(str(tmp_path))
+    assert cache.get('a', ttl=60) is None
+    cache.put('a', b'value')
+    assert cache.get('a', ttl=60) == b'value'
+
+  def test_ttl(self, tmp_path):
+    cache = MapboxCache(str(tmp_path))
+    cache.put('a', b'value')
+    age(cache, 'a', 120)
+    assert cache.get('a', ttl=60) is None
+    assert cache.get('a', ttl=300) == b'value'
+
+  def test_hit_keeps_stored_time(self, tmp_path):
+    cache = MapboxCache(str(tmp_path))
+    cache.put('a', b'value')
+    age(cache, 'a', 120)
+    assert cache.get('a', ttl=300) == b'value'
+    assert cache.get('a', ttl=60) is None
+
+  def test_lru_eviction(self, tmp_path):
+    cache = MapboxCache(str(tmp_path), max_entries=3)
+    for idx, key in enumerate('abc'):
+      cache.put(key, b'value')
+      age(cache, key, 10 - idx)
+    assert cache.get('a', ttl=60) == b'value'  # now the most recently used
+    cache.put('d', b'value')
+    assert cache.get('b', ttl=60) is None
+    assert all(cache.get(key, ttl=60) == b'value' for key in 'acd')
+
+  def test_size_eviction(self, tmp_path):
+    cache = MapboxCache(str(tmp_path), max_bytes=250)
+    for idx, key in enumerate('abc'):
+      cache.put(key, bytes(100))
+      age(cache, key, 10 - idx)
+    assert cache.get('a', ttl=60) is None
+    assert cache.get('b', ttl=60) is not None and cache.get('c', ttl=60) is not None
+
+  def test_clear(self, tmp_path):
+    cache = MapboxCache(str(tmp_path))
+    cache.put('a', b'value')
+    cache.clear()
+    assert cache.get('a', ttl=60) is None
+
+
+class TestMapboxIntegrationCache:
+  @pytest.fixture
+  def stand_in(self):
+    with MapboxStandIn(make_route(count=200)) as server:
+      yield server
+
+  @pytest.fixture
+  def mapbox(self, mocker, tmp_path, stand_in):
+    mapbox = MapboxIntegration(base_url=stand_in.base_url)
+    mapbox.cache = MapboxCache(str(tmp_path))
+    mocker.patch.object(mapbox, 'get_public_token', return_value='pk.test')
+    mocker.patch.object(mapbox, 'params')
+    mapbox.params.params_dir = str(tmp_path)
+    yield mapbox
+    mapbox.close()
+
+  def test_repeat_trip_without_network(self, mapbox, stand_in):
+    _, valid = mapbox.set_destination({'place_name': 'Home'}, -119.1733, 34.2299, 10.0)
+    assert valid and len(stand_in.requests) == 2
+
+    start = time.monotonic()
+    postvars, valid = mapbox.set_destination({'place_name': ' home'}, -119.17335, 34.22992, 12.0)
+    assert time.monotonic() - start < 0.5
+    assert valid and len(stand_in.requests) == 2
+    destination = stand_in.route['geometry'][-1]
+    assert (postvars['latitude'], postvars['longitude']) == (destination['latitude'], destination['longitude'])
+    assert mapbox.params.put.call_args.args[1]['navData']['current'] == destination
+
+  def test_failures_not_cached(self, mapbox, stand_in):
+    stand_in.fail_next = 10
+    assert mapbox.generate_route(-119.1733, 34.2299, -119.17, 34.24, 'pk.test') is None
+    stand_in.fail_next = 0
+    assert mapbox.generate_route(-119.1733, 34.2299, -119.17, 34.24, 'pk.test') is not None
+    assert mapbox.generate_route(-119.1733, 34.2299, -119.17, 34.24, 'pk.test') is not None
+    assert len(stand_in.requests) == 4
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from navigation.navigation_helpers.mapbox_cache import MapboxCache
+from navigation.navigation_helpers.mapbox_integration import MapboxIntegration
+from navigation.navigation_helpers.tests.mapbox_server import MapboxStandIn
+from navigation.tests.routes import make_route
+
+
+@pytest.fixture
+def stand_in():
+  with MapboxStandIn(make_route(count=200), [make_route(count=150, seed=1)]) as server:
+    yield server
+
+
+@pytest.fixture
+def mapbox(mocker, tmp_path, stand_in):
+  mapbox = MapboxIntegration(base_url=stand_in.base_url, backoff_factor=0.0)
+  mapbox.cache = MapboxCache(str(tmp_path))
+  mocker.patch.object(mapbox, 'get_public_token', return_value='pk.test')
+  yield mapbox
+  mapbox.close()
+
+
+class TestMapboxSession:
+  def test_generate_route(self, mapbox, stand_in):
+    route = mapbox.generate_route(-119.1733, 34.2299, -119.17, 34.24, 'pk.test', bearing=-90)
+    assert route is not None
+    assert np.allclose(route['geometry'].latitudes, [point['latitude'] for point in stand_in.route['geometry']], rtol=0, atol=1e-6)
+    assert np.allclose(route['geometry'].longitudes, [point['longitude'] for point in stand_in.route['geometry']], rtol=0, atol=1e-6)
+    assert route['steps'][0]['location'] == stand_in.route['steps'][0]['location']
+    path, query = stand_in.requests[0]
+    assert path == '/directions/v5/mapbox/driving/-119.1733,34.2299;-119.17,34.24'
+    assert query['access_token'] == 'pk.test' and query['bearings'] == '270,90;'
+    assert query['geometries'] == 'polyline6'
+    assert mapbox.request_times['directions'] > 0
+
+  def test_generate_routes_with_alternatives(self, mapbox, stand_in):
+    routes = mapbox.generate_routes(-119.1733, 34.2299, -119.17, 34.24, 'pk.test', alternatives=True)
+    assert [len(route['geometry']) for route in routes] == [200, 150]
+    assert stand_in.requests[0][1]['alternatives'] == 'true'
+    assert len(mapbox.generate_routes(-119.1733, 34.2299, -119.17, 34.24, 'pk.test')) == 1
+    assert stand_in.requests[1][1]['alternatives'] == 'false'
+
+  def test_nav_confirmed_keeps_alternatives(self, mocker, tmp_path, mapbox):
+    mocker.patch.object(mapbox, 'params')
+    mapbox.params.params_dir = str(tmp_path)
+    mapbox.params.get.return_value = True
+    mapbox.nav_confirmed({'latitude': 34.24, 'longitude': -119.17}, -119.1733, 34.2299)
+    assert [len(route['geometry']) for route in mapbox.alternative_routes] == [150]
+
+    mapbox.params.get.return_value = False
+    mapbox.nav_confirmed({'latitude': 34.25, 'longitude': -119.17}, -119.1733, 34.2299)
+    assert mapbox.alternative_routes == []
+
+  def test_connection_reused(self, mocker, mapbox, stand_in):
+    nav_confirmed = mocker.patch.object(mapbox, 'nav_confirmed')
+    for idx in range(3):
+      _, valid = mapbox.set_destination({'place_name': f'{idx} E Ventura Blvd'}, -119.1733, 34.2299)
+      assert valid
+      mapbox.generate_route(-119.1733 + idx, 34.2299, -119.17, 34.24, 'pk.test')
+    assert nav_confirmed.call_count == 3
+    assert len(stand_in.requests) == 6
+    assert stand_in.connections == 1
+    path, query = stand_in.requests[0]
+    assert path == '/geocoding/v5/mapbox.places/0%20E%20Ventura%20Blvd.json'
+    assert query['proximity'] == '-119.1733,34.2299'
+
+  def test_retries_server_errors(self, mapbox, stand_in):
+    stand_in.fail_next = 2
+    assert mapbox.generate_route(-119.1733, 34.2299, -119.17, 34.24, 'pk.test') is not None
+    assert len(stand_in.requests) == 3
+
+  def test_gives_up_after_retries(self, mapbox, stand_in):
+    stand_in.fail_next = 10
+    assert mapbox.generate_route(-119.1733, 34.2299, -119.17, 34.24, 'pk.test') is None
+    assert len(stand_in.requests) == 3
+
+  def test_connection_error(self, mocker, tmp_path):
+    mapbox = MapboxIntegration(base_url='http://127.0.0.1:9', retries=0)
+    mapbox.cache = MapboxCache(str(tmp_path))
+    mocker.patch.object(mapbox, 'get_public_token', return_value='pk.test')
+    assert mapbox.set_destination({'place_name': 'anywhere'}, 0.0, 0.0) == ({'place_name': 'anywhere'}, False)
+    assert 'geocoding' in mapbox.request_times
@@ -0,0 +1,184 @@
+import numpy as np
+import pytest
+
+from navigation.navd.route_matcher import RouteMatcher
+from navigation.navigation_helpers.nav_instructions import ON_ROUTE_DISTANCE, REJOIN_AHEAD, NavigationInstructions, prepare_route
+from navigation.tests.routes import make_recovery, make_route
+
+
+@pytest.fixture
+def nav(mocker):
+  route = make_route()
+  nav = NavigationInstructions()
+  mocker.patch.object(nav, 'params')
+  nav.params.get.return_value = {'navData': {'current': route['geometry'][-1], 'route': route}}
+  return nav
+
+
+class TestNavigationInstructions:
+  def test_get_current_route(self, nav):
+    route = nav.get_current_route()
+    assert len(route['geometry']) == 600
+    assert [step['cumulative_distance'] for step in route['steps']] == sorted(step['cumulative_distance'] for step in route['steps'])
+    assert route['steps'][0]['cumulative_distance'] == 0.0
+    assert route['steps'][-1]['cumulative_distance'] == pytest.approx(route['total_distance'])
+    assert nav.get_current_route() is route
+    assert nav.route_ingest_time > 0
+
+  def test_get_current_route_anchors_steps_in_order(self, nav):
+    # Out and back: the arrive step sits on the first point of the route
+    route = make_route(count=200, step_every=100)
+    route['geometry'] = route['geometry'] + route['geometry'][-2::-1]
+    route['steps'][-1]['location'] = route['geometry'][0]
+    nav.params.get.return_value = {'navData': {'route': route}}
+
+    cached = nav.get_current_route()
+    assert [step['cumulative_distance'] for step in cached['steps']][-1] == pytest.approx(cached['cumulative_distances'][-1])
+
+  def test_route_progress_on_route(self, nav):
+    route = nav.get_current_route()
+    for idx in range(0, 600, 7):
+      point = route['geometry'][idx]
+      progress = nav.get_route_progress(point.latitude, point.longitude)
+      assert progress['distance_from_route'] == pytest.approx(0.0, abs=1e-6)
+      assert progress['route_position_cumulative'] == pytest.approx(route['cumulative_distances'][idx])
+      assert progress['current_step_idx'] == min(idx // 100, len(route['steps']) - 1)
+      assert progress['total_distance_remaining'] == pytest.approx(route['total_distance'] - route['cumulative_distances'][idx])
+      assert 0 <= progress['route_progress_percent'] <= 100
+      assert progress['total_time_remaining'] >= 0
+
+  def test_route_progress_between_points(self, nav):
+    route = nav.get_current_route()
+    a, b = route['geometry'][250], route['geometry'][251]
+    progress = nav.get_route_progress((a.latitude + b.latitude) / 2, (a.longitude + b.longitude) / 2)
+    assert progress['distance_from_route'] == pytest.approx(0.0, abs=1e-3)
+    expected = (route['cumulative_distances'][250] + route['cumulative_distances'][251]) / 2
+    assert progress['route_position_cumulative'] == pytest.approx(expected, abs=1e-2)
+
+  def test_route_progress_remaining_time(self, nav):
+    route = nav.get_current_route()
+    for idx in (0, 150, 420):
+      point = route['geometry'][idx]
+      progress = nav.get_route_progress(point.latitude, point.longitude)
+      step_idx = progress['current_step_idx']
+      step = route['steps'][step_idx]
+      time_left_in_step = (1 - (progress['route_position_cumulative'] - step['cumulative_distance']) / step['distance']) * step['duration']
+      expected = time_left_in_step + sum(step['duration'] for step in route['steps'][step_idx + 1 :])
+      assert progress['total_time_remaining'] == pytest.approx(expected)
+
+  def test_route_progress_at_destination(self, nav):
+    route = nav.get_current_route()
+    end = route['geometry'][-1]
+    progress = nav.get_route_progress(end.latitude, end.longitude)
+    assert progress['current_step_idx'] == len(route['steps']) - 1
+    assert progress['next_turn'] is None
+    assert progress['total_distance_remaining'] == pytest.approx(0.0, abs=1e-6)
+    assert progress['total_time_remaining'] == pytest.approx(0.0)
+
+  def test_route_progress_no_route(self, nav):
+    nav.params.get.return_value = {}
+    assert nav.get_route_progress(34.0, -119.0) is None
+
+
+class TestRouteSplicing:
+  def test_rejoin_point(self, nav):
+    route = nav.get_current_route()
+    assert nav.rejoin_point() is None  # no progress on route yet
+
+    point = route['geometry'][100]
+    nav.get_route_progress(point.latitude, point.longitude)
+    idx, rejoin = nav.rejoin_point()
+    assert route['cumulative_distances'][idx - 1] < route['cumulative_distances'][100] + REJOIN_AHEAD <= route['cumulative_distances'][idx]
+    assert rejoin == route['geometry'][idx]
+
+    end = route['geometry'][-10]
+    nav.get_route_progress(end.latitude, end.longitude)
+    assert nav.rejoin_point() is None
+
+  def test_splice_route(self, nav):
+    route = nav.get_current_route()
+    rejoin_idx = 260
+    before = {}
+    for idx in (300, 450, 599):
+      point = route['geometry'][idx]
+      before[idx] = nav.get_route_progress(point.latitude, point.longitude)
+
+    recovery = make_recovery(make_route(), 150, rejoin_idx)
+    assert nav.splice_route(recovery, rejoin_idx)
+    spliced = nav.get_current_route()
+    assert len(spliced['geometry']) == len(recovery['geometry']) + 600 - rejoin_idx - 1
+    assert len(spliced['maxspeed']) == len(spliced['geometry'])
+    assert spliced['maxspeed'][-1] == route['maxspeed'][-1]
+
+    # Shifting the old distances gives the same result as measuring the spliced route from scratch
+    assert np.allclose(spliced['cumulative_distances'], RouteMatcher(spliced['geometry']).cumulative, rtol=1e-9, atol=1e-6)
+    assert spliced['step_cumulative_distances'] == sorted(spliced['step_cumulative_distances'])
+
+    start = spliced['geometry'][0]
+    progress = nav.get_route_progress(start.latitude, start.longitude)
+    assert progress['distance_from_route'] == pytest.approx(0.0, abs=1e-6)
+    assert progress['current_step']['bannerInstructions'][0]['primary']['text'] == 'Recovery'
+    assert progress['next_turn']['bannerInstructions'] is route['steps'][2]['bannerInstructions']  # resumes the step the rejoin point is on
+
+    # Past the rejoin point, only distances along the route changed
+    offset = spliced['total_distance'] - route['total_distance']
+    for idx, expected in before.items():
+      point = route['geometry'][idx]
+      progress = nav.get_route_progress(point.latitude, point.longitude)
+      assert progress['route_position_cumulative'] == pytest.approx(expected['route_position_cumulative'] + offset)
+      assert progress['total_distance_remaining'] == pytest.approx(expected['total_distance_remaining'])
+      assert progress['total_time_remaining'] == pytest.approx(expected['total_time_remaining'])
+      assert progress['current_step']['bannerInstructions'] is expected['current_step']['bannerInstructions']
+      assert progress['distance_to_end_of_step'] == pytest.approx(expected['distance_to_end_of_step'])
+
+  def test_splice_route_invalid(self, nav):
+    nav.get_current_route()
+    assert not nav.splice_route({}, 260)
+    assert not nav.splice_route(make_recovery(make_route(), 150, 260), 599)
+
+  def test_splice_route_rejects_recovery_ending_elsewhere(self, nav):
+    route = nav.get_current_route()
+    recovery = make_recovery(make_route(), 150, 260)
+    assert not nav.splice_route(recovery, 400)  # an index into a different route than the recovery was made for
+    assert nav.get_current_route() is route
+    assert nav.splice_route(recovery, 260)
+
+
+class TestAlternatives:
+  @pytest.fixture
+  def alternative(self):
+    # Shares the first 100 points with the primary route, then runs about 200 m north of it
+    route = make_route()
+    for point in route['geometry'][100:]:
+      point['latitude'] += 0.002
+    return route
+
+  def test_switch_to_alternative(self, nav, alternative):
+    primary = nav.get_current_route()
+    nav.set_alternatives([NavigationInstructions.ingest_route(prepare_route(alternative))])
+
+    point = alternative['geometry'][400]
+    assert primary['matcher'].locate(point['latitude'], point['longitude'])[1] > ON_ROUTE_DISTANCE
+    assert nav.switch_to_alternative(point['latitude'], point['longitude'])
+    switched = nav.get_current_route()
+    assert switched is not primary and nav.alternatives == [primary]
+
+    progress = nav.get_route_progress(point['latitude'], point['longitude'])
+    assert progress['distance_from_route'] == pytest.approx(0.0, abs=1e-6)
+    assert progress['route_position_cumulative'] == pytest.approx(switched['cumulative_distances'][400])
+
+    # Back on the primary route
+    point = primary['geometry'][300]
+    assert nav.switch_to_alternative(point.latitude, point.longitude)
+    assert nav.get_current_route() is primary
+
+  def test_no_matching_alternative(self, nav, alternative):
+    point = nav.get_current_route()['geometry'][300]
+    assert not nav.switch_to_alternative(point.latitude + 0.01, point.longitude)
+    nav.set_alternatives([NavigationInstructions.ingest_route(prepare_route(alternative))])
+    assert not nav.switch_to_alternative(point.latitude + 0.01, point.longitude)
+
+  def test_new_route_drops_alternatives(self, nav, alternative):
+    nav.set_alternatives([NavigationInstructions.ingest_route(prepare_route(alternative))])
+    nav.clear_route_cache()
+    assert nav.alternatives == []
@@ -0,0 +1,123 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from navigation.navigation_helpers.mapbox_integration import MapboxIntegration
+from navigation.navigation_helpers.nav_instructions import NavigationInstructions
+from navigation.navigation_helpers.route_store import LazyBanners, decode_route, encode_route, read_route, remove_route, route_path, write_route
+from navigation.tests.routes import make_route
+
+
+class TestRouteStore:
+  def setup_method(self):
+    self.route = make_route(count=300)
+    self.route['maxspeed'][5] = {'speed': 40, 'unit': 'mph'}
+    self.destination = self.route['geometry'][-1]
+
+  def test_round_trip(self):
+    route, destination = decode_route(encode_route(self.route, self.destination))
+    assert destination == self.destination
+    assert route['totalDistance'] == self.route['totalDistance']
+    assert route['totalDuration'] == self.route['totalDuration']
+    assert np.array_equal(route['geometry'].latitudes, [point['latitude'] for point in self.route['geometry']])
+    assert np.array_equal(route['geometry'].longitudes, [point['longitude'] for point in self.route['geometry']])
+    assert route['maxspeed'] == [(item['speed'], item['unit']) for item in self.route['maxspeed']]
+    assert route['maxspeed'][0] is route['maxspeed'][1]
+    for step, expected in zip(route['steps'], self.route['steps'], strict=True):
+      assert step['location'] == expected['location']
+      assert step['maneuver'] == expected['maneuver']
+      assert step['modifier'] == expected['modifier']
+      assert step['distance'] == expected['distance']
+      assert list(step['bannerInstructions']) == expected['bannerInstructions']
+
+  def test_encoding_is_smaller_than_json(self):
+    assert len(encode_route(self.route, self.destination)) < len(json.dumps(self.route)) / 2
+
+  def test_read_write(self, tmp_path):
+    path = route_path(str(tmp_path))
+    assert read_route(path) is None
+
+    write_route(path, self.route, self.destination)
+    route, destination = read_route(path)
+    assert destination == self.destination
+    assert len(route['geometry']) == 300
+    assert os.listdir(tmp_path) == [os.path.basename(path)]
+
+    remove_route(path)
+    remove_route(path)
+    assert read_route(path) is None
+
+  @pytest.mark.parametrize('contents', [b'', bytes(range(64)), b'\xff' * 64], ids=['empty', 'junk', 'huge_segment_table'])
+  def test_unreadable_file_removed(self, tmp_path, contents):
+    path = route_path(str(tmp_path))
+    with open(path, 'wb') as f:
+      f.write(contents)
+    assert read_route(path) is None
+    assert not os.path.exists(path)
+
+  def test_truncated_file_removed(self, tmp_path):
+    path = route_path(str(tmp_path))
+    with open(path, 'wb') as f:
+      f.write(encode_route(self.route, self.destination)[:200])
+    assert read_route(path) is None
+    assert not os.path.exists(path)
+
+  def test_lazy_banners(self):
+    banners = LazyBanners(json.dumps([{'distanceAlongGeometry': 10.0}]))
+    assert banners._banners is None
+    assert len(banners) == 1
+    assert banners[0]['distanceAlongGeometry'] == 10.0
+    assert len(LazyBanners('')) == 0
+
+
+class TestBinaryRouteLoading:
+  @pytest.fixture
+  def nav(self, mocker, tmp_path):
+    route = make_route()
+    destination = route['geometry'][-1]
+    write_route(route_path(str(tmp_path)), route, destination)
+
+    nav = NavigationInstructions()
+    mocker.patch.object(nav, 'params')
+    nav.params.params_dir = str(tmp_path)
+    nav.params.get.return_value = {'navData': {'current': destination, 'route': {}}}
+    return nav
+
+  def test_get_current_route(self, nav):
+    route = nav.get_current_route()
+    assert route is not None
+    assert len(route['geometry']) == 600
+    assert route['steps'][-1]['cumulative_distance'] == pytest.approx(route['total_distance'])
+
+    point = route['geometry'][250]
+    progress = nav.get_route_progress(point.latitude, point.longitude)
+    assert progress['distance_from_route'] == pytest.approx(0.0, abs=1e-3)
+    assert progress['current_step']['bannerInstructions'][0]['primary']['text'] == 'Road 2'
+
+  def test_stale_route_file_ignored(self, nav):
+    nav.params.get.return_value = {'navData': {'current': {'latitude': 1.0, 'longitude': 2.0}, 'route': {}}}
+    assert nav.get_current_route() is None
+
+  def test_corrupt_route_file_ignored(self, nav, tmp_path):
+    with open(route_path(str(tmp_path)), 'wb') as f:
+      f.write(bytes(range(64)))
+    assert nav.get_current_route() is None
+    assert not os.path.exists(route_path(str(tmp_path)))
+
+  def test_nav_confirmed_writes_route_file(self, mocker, tmp_path):
+    mapbox = MapboxIntegration()
+    mocker.patch.object(mapbox, 'params')
+    mapbox.params.params_dir = str(tmp_path)
+    mocker.patch.object(mapbox, 'generate_routes', return_value=[make_route(count=50)])
+
+    mapbox.nav_confirmed({'latitude': 34.0, 'longitude': -119.0}, -119.1, 34.1)
+    mapbox.params.put.assert_called_once_with('MapboxSettings', {'navData': {'current': {'latitude': 34.0, 'longitude': -119.0}, 'route': {}}})
+    route, destination = read_route(route_path(str(tmp_path)))
+    assert destination == {'latitude': 34.0, 'longitude': -119.0}
+    assert len(route['geometry']) == 50
+
+    mapbox.generate_routes.return_value = []
+    mapbox.nav_confirmed({'latitude': 34.0, 'longitude': -119.0}, -119.1, 34.1)
+    assert read_route(route_path(str(tmp_path))) is None
@@ -0,0 +1,97 @@
+import threading
+import time
+
+from navigation.navd.helpers import Coordinate
+from navigation.navigation_helpers.route_worker import RouteRequest, RouteWorker
+from navigation.tests.routes import make_route
+
+
+class SlowMapbox:
+  '''Stands in for the Mapbox client, the router and the geocoder, geocoding waits until released'''
+
+  def __init__(self):
+    self.release = threading.Event()
+    self.calls: list[str] = []
+    self.alternative_routes: list[dict] = []
+    self.stored: list[dict] = []
+
+  def geocode(self, address, near_lon, near_lat):
+    self.calls.append(address)
+    self.release.wait(timeout=5)
+    if address == 'raise':
+      raise RuntimeError('network down')
+    return None if address == 'nowhere' else (-119.2, 34.3)
+
+  def nav_confirmed(self, postvars, start_lon, start_lat, bearing=None, router=None):
+    assert router is self
+    self.stored.append(postvars)
+
+  def generate_route(self, start_lon, start_lat, end_lon, end_lat, bearing=None):
+    self.calls.append(f'route to {end_lat},{end_lon}')
+    return {'steps': [], 'geometry': [{'latitude': start_lat, 'longitude': start_lon}, {'latitude': end_lat, 'longitude': end_lon}]}
+
+
+def wait_for_result(worker: RouteWorker, timeout: float = 5.0):
+  deadline = time.monotonic() + timeout
+  while time.monotonic() < deadline:
+    if result := worker.poll():
+      return result
+    time.sleep(0.005)
+  raise TimeoutError
+
+
+class TestRouteWorker:
+  def setup_method(self):
+    self.mapbox = SlowMapbox()
+    self.worker = RouteWorker(self.mapbox, self.mapbox, self.mapbox)
+
+  def test_submit_does_not_block(self):
+    start = time.monotonic()
+    self.worker.submit(RouteRequest('home', -119.17557, 34.23305))
+    assert time.monotonic() - start < 0.1
+    assert self.worker.busy
+    assert self.worker.poll() is None
+
+    self.mapbox.release.set()
+    result = wait_for_result(self.worker)
+    assert result.valid and result.request.destination == 'home'
+    assert not self.worker.busy
+    assert self.mapbox.stored == [{'place_name': 'home', 'name': 'home', 'latitude': 34.3, 'longitude': -119.2}]
+
+  def test_latest_pending_request_wins(self):
+    self.worker.submit(RouteRequest('first', 0.0, 0.0))
+    while not self.mapbox.calls:
+      time.sleep(0.005)
+    self.worker.submit(RouteRequest('second', 0.0, 0.0))
+    self.worker.submit(RouteRequest('third', 0.0, 0.0))
+    self.mapbox.release.set()
+
+    while self.worker.busy:
+      time.sleep(0.005)
+    assert self.mapbox.calls == ['first', 'third']
+    assert self.worker.poll().request.destination == 'third'  # only the newest result is handed back
+    assert self.worker.poll() is None
+
+  def test_failures_are_invalid_results(self):
+    self.mapbox.release.set()
+    self.worker.submit(RouteRequest('nowhere', 0.0, 0.0))
+    assert not wait_for_result(self.worker).valid
+    self.worker.submit(RouteRequest('raise', 0.0, 0.0))
+    assert not wait_for_result(self.worker).valid
+    assert not self.worker.busy
+
+  def test_rejoin_requests_recovery_route(self):
+    self.mapbox.release.set()
+    self.worker.submit(RouteRequest('home', -119.1, 34.2, 90.0, rejoin=Coordinate(34.3, -119.2), rejoin_idx=42))
+    result = wait_for_result(self.worker)
+    assert result.valid and result.request.rejoin_idx == 42
+    assert result.route['geometry'][-1] == {'latitude': 34.3, 'longitude': -119.2}
+    assert self.mapbox.calls == ['route to 34.3,-119.2']
+
+  def test_alternatives_ingested(self):
+    self.mapbox.release.set()
+    self.mapbox.alternative_routes = [make_route(count=50), make_route(count=80, seed=1)]
+    self.worker.submit(RouteRequest('home', 0.0, 0.0))
+    result = wait_for_result(self.worker)
+    assert [len(alternative['geometry']) for alternative in result.alternatives] == [50, 80]
+    assert all(len(alternative['matcher']) == len(alternative['geometry']) for alternative in result.alternatives)
@@ -0,0 +1,141 @@
+import time
+
+import pytest
+
+from navigation.navd.road_graph import RoadGraph
+from navigation.navigation_helpers.mapbox_integration import MapboxGeocoder, MapboxIntegration, MapboxRouter
+from navigation.navigation_helpers.nav_instructions import NavigationInstructions, prepare_route
+from navigation.navigation_helpers.route_store import read_route, route_path
+from navigation.navigation_helpers.route_worker import RouteRequest, RouteWorker
+from navigation.navigation_helpers.router import FallbackGeocoder, FallbackRouter, Geocoder, LocalGeocoder, LocalRouter, Router, street_name, turn_modifier
+from navigation.tests.routes import SPACING, make_grid
+
+
+class StaticRouter(Router):
+  def __init__(self, routes):
+    self.routes = routes
+    self.calls = 0
+
+  def generate_routes(self, start_lon, start_lat, end_lon, end_lat, bearing=None, alternatives=False):
+    self.calls += 1
+    return self.routes
+
+
+class StaticGeocoder(Geocoder):
+  def __init__(self, location):
+    self.location = location
+
+  def geocode(self, address, near_lon, near_lat):
+    return self.location
+
+
+class TestLocalRouter:
+  def setup_method(self):
+    self.router = LocalRouter(make_grid())
+
+  def test_route_shape(self):
+    # South west to north east corner, a staircase of turns
+    route = self.router.generate_route(-119.0, 34.0, -119.0 + 9 * SPACING, 34.0 + 9 * SPACING)
+    assert route['geometry'][0].as_dict() == pytest.approx({'longitude': -119.0, 'latitude': 34.0})
+    assert route['geometry'][-1].as_dict() == pytest.approx({'longitude': -119.0 + 9 * SPACING, 'latitude': 34.0 + 9 * SPACING})
+    assert len(route['maxspeed']) == len(route['geometry']) - 1
+    assert route['totalDistance'] == pytest.approx(sum(step['distance'] for step in route['steps']))
+    assert route['totalDuration'] == pytest.approx(sum(step['duration'] for step in route['steps']))
+
+    steps = route['steps']
+    assert steps[0]['maneuver'] == 'depart' and steps[-1]['maneuver'] == 'arrive'
+    assert all(step['maneuver'] == 'turn' for step in steps[1:-1])
+    assert all(step['modifier'] in ('left', 'right') for step in steps[1:-1])
+    for step, following in zip(steps, steps[1:], strict=False):
+      banner = step['bannerInstructions'][0]
+      assert banner['distanceAlongGeometry'] == step['distance']
+      assert banner['primary']['type'] == following['maneuver']
+    assert steps[-2]['bannerInstructions'][0]['primary']['text'] == 'Destination'
+
+  def test_turn_onto_named_street(self):
+    # Along Row 4, the faster avenue one street north wins: up Col 0, east on Row 5, down Col 9
+    router = LocalRouter(make_grid(avenue_speed=120))
+    route = router.generate_route(-119.0, 34.0 + 4 * SPACING, -119.0 + 9 * SPACING, 34.0 + 4 * SPACING)
+    assert [step['instruction'] for step in route['steps']] == [
+      'Drive on Col 0', 'Turn right onto Row 5', 'Turn right onto Col 9', 'You have arrived at your destination'
+    ]
+    assert [step['bannerInstructions'][0]['primary']['text'] for step in route['steps'][:-1]] == ['Row 5', 'Col 9', 'Destination']
+    assert route['maxspeed'][1] == {'speed': 120, 'unit': 'km/h'}
+
+  def test_route_to_one_way_end(self):
+    # A two-way street, then a one-way street ending where the destination is, it has no outgoing edges
+    graph = RoadGraph.from_edges([34.0, 34.001, 34.001], [-119.0, -119.0, -118.999], [0, 1, 1], [1, 0, 2])
+    route = LocalRouter(graph).generate_route(-119.0, 34.0, -118.999, 34.001)
+    assert route['geometry'][-1].as_dict() == pytest.approx({'longitude': -118.999, 'latitude': 34.001})
+
+  def test_outside_coverage(self):
+    assert self.router.generate_routes(-118.0, 35.0, -119.0, 34.0) == []
+
+  def test_route_ingests(self):
+    route = self.router.generate_route(-119.0, 34.0, -119.0 + 9 * SPACING, 34.0 + 9 * SPACING)
+    ingested = NavigationInstructions.ingest_route(prepare_route(route))
+    assert ingested['steps'][-1]['cumulative_distance'] == pytest.approx(route['totalDistance'], rel=1e-5)
+
+  def test_loads_graph_lazily(self, tmp_path):
+    path = str(tmp_path / 'graph')
+    make_grid().save(path)
+    router = LocalRouter(path)
+    assert router._graph is None
+    assert router.generate_route(-119.0, 34.0, -119.0 + SPACING, 34.0) is not None
+
+  def test_turn_modifier(self):
+    assert turn_modifier(5) == 'straight'
+    assert turn_modifier(-40) == 'slight left'
+    assert turn_modifier(90) == 'right'
+    assert turn_modifier(-150) == 'sharp left'
+    assert turn_modifier(179) == 'uturn'
+
+
+class TestFallbackRouter:
+  def test_first_router_with_routes_wins(self):
+    empty, first, second = StaticRouter([]), StaticRouter([{'id': 1}]), StaticRouter([{'id': 2}])
+    router = FallbackRouter([empty, first, second])
+    assert router.generate_route(0, 0, 1, 1) == {'id': 1}
+    assert (empty.calls, first.calls, second.calls) == (1, 1, 0)
+    assert FallbackRouter([empty]).generate_routes(0, 0, 1, 1) == []
+
+
+class TestLocalGeocoder:
+  def test_street_name(self):
+    assert street_name('1600 Row 3, Grid Town, CA') == 'row 3'
+    assert street_name('Col 2') == 'col 2'
+    assert street_name(' 12 ') == ''
+
+  def test_nearest_point_of_street(self):
+    geocoder = LocalGeocoder(LocalRouter(make_grid()))
+    longitude, latitude = geocoder.geocode('12 row 3, Grid Town', -119.0 + 7.2 * SPACING, 34.0)
+    assert (longitude, latitude) == pytest.approx((-119.0 + 7 * SPACING, 34.0 + 3 * SPACING))
+    assert geocoder.geocode('Main Street', -119.0, 34.0) is None
+    assert geocoder.geocode('', -119.0, 34.0) is None
+
+  def test_first_geocoder_with_match_wins(self):
+    assert FallbackGeocoder([StaticGeocoder(None), StaticGeocoder((1.0, 2.0)), StaticGeocoder((3.0, 4.0))]).geocode('home', 0, 0) == (1.0, 2.0)
+    assert FallbackGeocoder([StaticGeocoder(None)]).geocode('home', 0, 0) is None
+
+
+class TestOffline:
+  def test_new_destination_without_connectivity(self, mocker, tmp_path):
+    params = mocker.patch('navigation.navigation_helpers.mapbox_integration.Params').return_value
+    params.params_dir = str(tmp_path)
+    params.get.return_value = False
+    mapbox = MapboxIntegration(base_url='http://127.0.0.1:9', retries=0)  # the Mapbox API is unreachable
+    local_router = LocalRouter(make_grid())
+    router = FallbackRouter([MapboxRouter(mapbox), local_router])
+    geocoder = FallbackGeocoder([MapboxGeocoder(mapbox), LocalGeocoder(local_router)])
+
+    # An address never geocoded before resolves to its street in the road graph
+    worker = RouteWorker(mapbox, router, geocoder)
+    worker.submit(RouteRequest('5 Row 9, Grid Town', -119.0, 34.0))
+    deadline = time.monotonic() + 5.0
+    while (result := worker.poll()) is None and time.monotonic() < deadline:
+      time.sleep(0.005)
+    assert result is not None and result.valid
+    route, destination = read_route(route_path(str(tmp_path)))
+    assert destination == pytest.approx({'latitude': 34.0 + 9 * SPACING, 'longitude': -119.0})
+    assert route['steps'][-1]['maneuver'] == 'arrive'
+    assert route['steps'][-1]['location']['latitude'] == pytest.approx(34.0 + 9 * SPACING)
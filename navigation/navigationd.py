@@ -1,19 +1,30 @@
 import logging
 import math
+import os
 import time
 
 import messaging.messenger as messenger
 from common.params.params import Params
 from common.ratekeeper import Ratekeeper
 from navigation.navd.helpers import Coordinate, parse_banner_instructions
-from navigation.navigation_helpers.mapbox_integration import MapboxIntegration
+from navigation.navigation_helpers.mapbox_integration import MapboxGeocoder, MapboxIntegration, MapboxRouter
 from navigation.navigation_helpers.nav_instructions import NavigationInstructions
+from navigation.navigation_helpers.route_worker import RouteRequest, RouteWorker
+from navigation.navigation_helpers.router import FallbackGeocoder, FallbackRouter, Geocoder, LocalGeocoder, LocalRouter, Router, road_graph_path
 
 
 class Navigationd:
   def __init__(self):
     self.params = Params()
     self.mapbox = MapboxIntegration()
+    # Mapbox first, then the offline road graph when one is installed next to the params
+    self.router: Router = MapboxRouter(self.mapbox)
+    self.geocoder: Geocoder = MapboxGeocoder(self.mapbox)
+    if os.path.exists(graph_path := road_graph_path(self.params.params_dir)):
+      local_router = LocalRouter(graph_path)
+      self.router = FallbackRouter([self.router, local_router])
+      self.geocoder = FallbackGeocoder([self.geocoder, LocalGeocoder(local_router)])
+    self.route_worker = RouteWorker(self.mapbox, self.router, self.geocoder)
     self.nav_instructions = NavigationInstructions()
 
     self.sm = messenger.SubMaster('livelocationd')
@@ -42,19 +53,46 @@ class Navigationd:
         self.new_destination = self.params.get('MapboxRoute')
         self.recompute_allowed = self.params.get('MapboxRecompute', return_default=True)
 
+      # Apply a finished result first, so a destination or route it just set is not requested again
+      if result := self.route_worker.poll():
+        logging.debug(f'Set new destination to: {result.request.destination}, valid: {result.valid}, rejoin: {result.request.rejoin}')
+        applied = result.valid
+        if result.valid and result.route is not None and result.request.route is not self.nav_instructions.get_current_route():
+          # Switched to an alternative while the recovery route was computed, it rejoins a route that is no longer current
+          logging.debug('Dropping recovery route for a replaced route')
+          applied = False
+        elif result.valid and result.route is not None:
+          applied = self.nav_instructions.splice_route(result.route, result.request.rejoin_idx)
+          if not applied:  # keep the stale route only until a full reroute to the destination finishes
+            logging.warning(f'Recovery route could not be spliced in at point {result.request.rejoin_idx}, rerouting to the destination')
+            self.route_worker.submit(RouteRequest(result.request.destination, self.last_position.longitude, self.last_position.latitude, self.last_bearing))
+        elif result.valid:
+          self.destination = result.request.destination
+          self.nav_instructions.clear_route_cache()
+          self.nav_instructions.set_alternatives(result.alternatives)
+        if applied:
+          self.route = self.nav_instructions.get_current_route()
+          self.reroute_counter = 0
+          if (ingest_time := self.nav_instructions.route_ingest_time) > self.rk.interval:
+            logging.warning(f'Route ingestion took {ingest_time * 1000:.1f} ms, longer than one {self.rk.interval * 1000:.0f} ms tick')
+
       self.allow_recompute: bool = (self.new_destination != self.destination and self.new_destination != '') or (
         self.recompute_allowed and self.reroute_counter > 3 and self.route
       )
 
-      if self.allow_recompute:
-        postvars = {'place_name': self.new_destination}
-        postvars, valid_addr = self.mapbox.set_destination(postvars, self.last_position.longitude, self.last_position.latitude, self.last_bearing)
-        logging.debug(f'Set new destination to: {self.new_destination}, valid: {valid_addr}')
-        if valid_addr:
-          self.destination = self.new_destination
-          self.nav_instructions.clear_route_cache()
-          self.route = self.nav_instructions.get_current_route()
-          self.reroute_counter = 0
+      # Off the route to the same destination: switch to a prefetched alternative the vehicle is on, if any
+      rerouting = self.allow_recompute and self.new_destination == self.destination
+      if rerouting and self.nav_instructions.switch_to_alternative(self.last_position.latitude, self.last_position.longitude):
+        self.route = self.nav_instructions.get_current_route()
+        self.reroute_counter = 0
+      # Otherwise geocoding and routing run on the route worker, the previous route stays active until the new one is ready
+      elif self.allow_recompute and not self.route_worker.busy:
+        request = RouteRequest(self.new_destination, self.last_position.longitude, self.last_position.latitude, self.last_bearing)
+        # Off route on the way to the same destination, only route back to a point further along the current route
+        if rerouting and (rejoin := self.nav_instructions.rejoin_point()):
+          request.rejoin_idx, request.rejoin = rejoin
+          request.route = self.nav_instructions.get_current_route()
+        self.route_worker.submit(request)
 
       self.valid = self.route is not None
 
@@ -103,6 +141,7 @@ class Navigationd:
     msg.totalDistanceRemaining = progress['total_distance_remaining'] if progress else 0.0
     msg.totalTimeRemaining = progress['total_time_remaining'] if progress else 0.0
     msg.valid = self.valid
+    msg.routingInProgress = self.route_worker.busy
 
     all_maneuvers = (
       [messenger.schema.MapboxSettings.Maneuver.new_message(distance=m['distance'], type=m['type'], modifier=m['modifier']) for m in progress['all_maneuvers']]
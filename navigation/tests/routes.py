@@ -0,0 +1,100 @@
+'''Synthetic routes and road graphs shared by the navigation tests'''
+import math
+import random
+
+from navigation.navd.helpers import Coordinate
+from navigation.navd.road_graph import RoadGraph
+
+SPACING = 0.001  # degrees between grid streets
+
+
+def make_geometry(count=500, start=(34.2299, -119.1733), seed=0) -> list[Coordinate]:
+  '''Random walk of points 2 to 40 m apart, turning gently'''
+  rng = random.Random(seed)
+  lat, lon = start
+  heading = 0.0
+  geometry = []
+  for _ in range(count):
+    geometry.append(Coordinate(lat, lon))
+    heading += rng.uniform(-0.3, 0.3)
+    step = rng.uniform(2.0, 40.0) / 111_000
+    lat += step * math.cos(heading)
+    lon += step * math.sin(heading) / math.cos(math.radians(lat))
+  return geometry
+
+
+def make_route(count=600, step_every=100, seed=0) -> dict:
+  '''Builds a Mapbox-style route as stored in the MapboxSettings param'''
+  coords = make_geometry(count, seed=seed)
+  geometry = [{'latitude': coord.latitude, 'longitude': coord.longitude} for coord in coords]
+  cumulative = [0.0]
+  for idx in range(1, count):
+    cumulative.append(cumulative[-1] + coords[idx - 1].distance_to(coords[idx]))
+
+  anchors = [*range(0, count - 1, step_every), count - 1]
+  steps = []
+  for i, anchor in enumerate(anchors):
+    end = anchors[i + 1] if i + 1 < len(anchors) else anchor
+    distance = cumulative[end] - cumulative[anchor]
+    steps.append({
+      'maneuver': 'arrive' if anchor == count - 1 else 'turn',
+      'instruction': f'Step {i}',
+      'distance': distance,
+      'duration': distance / 15.0,
+      'location': geometry[anchor],
+      'modifier': 'right' if i % 2 else 'slight left',
+      'bannerInstructions': [{'distanceAlongGeometry': distance, 'primary': {'text': f'Road {i}', 'type': 'turn'}}],
+    })
+
+  return {
+    'steps': steps,
+    'totalDistance': cumulative[-1],
+    'totalDuration': cumulative[-1] / 15.0,
+    'geometry': geometry,
+    'maxspeed': [{'speed': 50 + 10 * (idx // step_every), 'unit': 'km/h'} for idx in range(count)],
+  }
+
+
+def make_recovery(route: dict, start: int, rejoin: int, offset: float = 0.001) -> dict:
+  '''Recovery route as from generate_route, running parallel to route from start and ending on its point rejoin'''
+  geometry = [{'latitude': point['latitude'] + offset, 'longitude': point['longitude']} for point in route['geometry'][start:rejoin]]
+  geometry.append(route['geometry'][rejoin])
+  coords = [Coordinate(point['latitude'], point['longitude']) for point in geometry]
+  distance = sum(a.distance_to(b) for a, b in zip(coords, coords[1:], strict=False))
+  banner = [{'distanceAlongGeometry': distance, 'primary': {'text': 'Recovery', 'type': 'turn'}}]
+  return {
+    'steps': [
+      {'maneuver': 'turn', 'instruction': 'Recover', 'distance': distance, 'duration': distance / 10.0, 'location': geometry[0], 'modifier': 'left',
+       'bannerInstructions': banner},
+      {'maneuver': 'arrive', 'instruction': 'Arrive', 'distance': 0.0, 'duration': 0.0, 'location': geometry[-1], 'modifier': 'none',
+       'bannerInstructions': []},
+    ],
+    'totalDistance': distance,
+    'totalDuration': distance / 10.0,
+    'geometry': geometry,
+    'maxspeed': [{'speed': 30, 'unit': 'km/h'}] * (len(geometry) - 1),
+  }
+
+
+def make_grid(size=10, origin=(34.0, -119.0), speed=50, avenue_speed=None) -> RoadGraph:
+  '''Two-way street grid. Rows are named "Row r", columns "Col c"; the middle row is faster when avenue_speed is set.'''
+  latitudes, longitudes = [], []
+  for row in range(size):
+    for col in range(size):
+      latitudes.append(origin[0] + row * SPACING)
+      longitudes.append(origin[1] + col * SPACING)
+
+  names = [f'Row {row}' for row in range(size)] + [f'Col {col}' for col in range(size)]
+  sources, targets, speeds, name_ids = [], [], [], []
+  for row in range(size):
+    for col in range(size):
+      node = row * size + col
+      for neighbor, name_id, is_avenue in ((node + 1, row, row == size // 2), (node + size, size + col, False)):
+        if (neighbor == node + 1 and col == size - 1) or neighbor >= size * size:
+          continue
+        edge_speed = avenue_speed if is_avenue and avenue_speed else speed
+        sources += [node, neighbor]
+        targets += [neighbor, node]
+        speeds += [edge_speed, edge_speed]
+        name_ids += [name_id, name_id]
+  return RoadGraph.from_edges(latitudes, longitudes, sources, targets, speeds, speeds, name_ids, names)
@@ -0,0 +1,125 @@
+import pytest
+
+from navigation import navigationd
+from navigation.navd.helpers import Coordinate
+from navigation.navigationd import Navigationd
+from navigation.navigation_helpers.mapbox_integration import MapboxGeocoder, MapboxRouter
+from navigation.navigation_helpers.nav_instructions import ON_ROUTE_DISTANCE, NavigationInstructions, prepare_route
+from navigation.navigation_helpers.route_worker import RouteRequest, RouteResult
+from navigation.navigation_helpers.router import LocalGeocoder, LocalRouter, road_graph_path
+from navigation.tests.routes import make_grid, make_recovery, make_route
+
+
+@pytest.fixture
+def navd(mocker, tmp_path):
+  for name in ('MapboxIntegration', 'RouteWorker', 'messenger.SubMaster', 'messenger.PubMaster'):
+    mocker.patch(f'navigation.navigationd.{name}')
+  mocker.patch('navigation.navigationd.Params').return_value.params_dir = str(tmp_path)
+  navd = Navigationd()
+  navd.rk.interval = 0.2
+  navd.route_worker.busy = False
+  navd.route_worker.poll.return_value = None
+
+  route = make_route()
+  mocker.patch.object(navd.nav_instructions, 'params')
+  navd.nav_instructions.params.get.return_value = {'navData': {'current': route['geometry'][-1], 'route': route}}
+  navd.route = navd.nav_instructions.get_current_route()
+  navd.destination = navd.new_destination = 'home'
+  navd.frame = 0  # params are only read every 9th frame
+  return navd
+
+
+def drive_off_route(navd, idx):
+  '''Progress on the route up to point idx, then off the route there, long enough to reroute'''
+  point = navd.route['geometry'][idx]
+  navd.nav_instructions.get_route_progress(point.latitude, point.longitude)
+  navd.last_position = Coordinate(point.latitude + 0.001, point.longitude)
+  navd.recompute_allowed = True
+  navd.reroute_counter = 4
+
+
+class TestRouters:
+  def test_mapbox_only_without_graph(self, navd):
+    assert isinstance(navd.router, MapboxRouter) and navd.router.mapbox is navd.mapbox
+    assert isinstance(navd.geocoder, MapboxGeocoder) and navd.geocoder.mapbox is navd.mapbox
+    assert navigationd.RouteWorker.call_args.args == (navd.mapbox, navd.router, navd.geocoder)
+
+  def test_offline_fallback(self, navd, tmp_path):
+    make_grid().save(road_graph_path(str(tmp_path)))
+    navd = Navigationd()
+    assert [type(router) for router in navd.router.routers] == [MapboxRouter, LocalRouter]
+    assert [type(geocoder) for geocoder in navd.geocoder.geocoders] == [MapboxGeocoder, LocalGeocoder]
+    assert navd.geocoder.geocoders[1].router is navd.router.routers[1]  # one road graph for routing and geocoding
+    assert navigationd.RouteWorker.call_args.args == (navd.mapbox, navd.router, navd.geocoder)
+
+
+class TestReroute:
+  def test_rejoin_request(self, navd):
+    drive_off_route(navd, 100)
+    navd._update_params()
+    request = navd.route_worker.submit.call_args.args[0]
+    assert request.destination == 'home'
+    assert request.rejoin == navd.route['geometry'][request.rejoin_idx]
+
+  def test_rejected_splice_falls_back_to_full_reroute(self, navd):
+    drive_off_route(navd, 100)
+    route = navd.route
+    request = RouteRequest('home', navd.last_position.longitude, navd.last_position.latitude, rejoin_idx=599, route=route)  # past the last splicable point
+    navd.route_worker.busy = True
+    navd.route_worker.poll.return_value = RouteResult(request, True, make_recovery(make_route(), 150, 260))
+    navd._update_params()
+
+    assert navd.route is route
+    assert navd.nav_instructions.get_current_route() is route
+    assert navd.reroute_counter == 4
+    reroute = navd.route_worker.submit.call_args.args[0]
+    assert (reroute.destination, reroute.rejoin) == ('home', None)
+
+  def test_recovery_for_replaced_route_dropped(self, navd):
+    alternative = make_route(seed=1)
+    navd.nav_instructions.set_alternatives([NavigationInstructions.ingest_route(prepare_route(alternative))])
+    drive_off_route(navd, 100)
+    route = navd.route
+    navd._update_params()
+    request = navd.route_worker.submit.call_args.args[0]
+    recovery = make_recovery(make_route(), 100, request.rejoin_idx)
+
+    # While the rejoin request is in flight the vehicle turns onto the alternative, which becomes the route
+    navd.route_worker.busy = True
+    point = alternative['geometry'][300]
+    assert navd.nav_instructions.get_route_progress(point['latitude'], point['longitude'])['distance_from_route'] > ON_ROUTE_DISTANCE
+    navd.last_position = Coordinate(point['latitude'], point['longitude'])
+    navd.reroute_counter = 4
+    navd._update_params()
+    assert navd.route is not route
+    switched = navd.route
+
+    # The recovery route was made for the old route, splicing it into the alternative would jump between the two
+    navd.route_worker.poll.return_value = RouteResult(request, True, recovery)
+    navd._update_params()
+    assert navd.route is switched
+    assert navd.nav_instructions.get_current_route() is switched
+
+
+class TestDestination:
+  def test_new_destination_routed_once(self, navd):
+    start = navd.route['geometry'][0]
+    navd.last_position = Coordinate(start.latitude, start.longitude)
+    navd.new_destination = 'work'
+    navd._update_params()
+    assert navd.route_worker.submit.call_count == 1
+    request = navd.route_worker.submit.call_args.args[0]
+    assert request.destination == 'work'
+
+    navd.route_worker.busy = True
+    navd._update_params()
+    # The worker finished between ticks, its result is applied before deciding whether to route again
+    navd.route_worker.busy = False
+    navd.route_worker.poll.return_value = RouteResult(request, True)
+    navd._update_params()
+    navd.route_worker.poll.return_value = None
+    for _ in range(5):
+      navd._update_params()
+
+    assert navd.destination == 'work'
+    assert navd.route_worker.submit.call_count == 1
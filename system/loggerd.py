@@ -0,0 +1,126 @@
+"""Logger daemon: records every message of the selected messenger services to a message log (see messaging/log.py),
+one file per run in LOG_ROOT. Replay a log with tools/replay.py."""
+import logging
+import os
+import signal
+import time
+from pathlib import Path
+
+import zmq
+
+import messaging.messenger as messenger
+from messaging.log import LogWriter
+from messaging.shm import ShmRing, ring_path
+
+DEFAULT_LOG_ROOT = "/tmp/msglogs"
+
+
+def log_path(log_root=None) -> Path:
+  root = Path(log_root or os.getenv("LOG_ROOT", DEFAULT_LOG_ROOT))
+  root.mkdir(parents=True, exist_ok=True)
+  return root / f"{time.strftime('%Y-%m-%d--%H-%M-%S')}--{os.getpid()}.msglog"
+
+
+class Loggerd:
+  def __init__(self, service_names=None, path=None, registry_path="messaging/services.yaml", codec=None) -> None:
+    self._pid = os.getpid()  # a forked child must leave the parent's log, sockets and context alone
+    self.registry: dict[str, dict] = messenger.load_registry(registry_path)
+    if service_names is None:
+      service_names = list(self.registry.keys())
+    if isinstance(service_names, str):
+      service_names = [service_names]
+    for name in service_names:
+      if name not in self.registry:
+        raise ValueError(f"Unknown service {name}")
+
+    self.context: zmq.Context | None = messenger.acquire_context()
+    self.poller = zmq.Poller()
+    self.services: dict[zmq.Socket, str] = {}
+    self.rings: dict[str, ShmRing | None] = {}
+    for name in service_names:
+      socket = self.context.socket(zmq.SUB)  # never conflated, every message is logged
+      socket.connect(f"ipc:///tmp/{name}.ipc")
+      socket.setsockopt(zmq.SUBSCRIBE, b"")
+      self.poller.register(socket, zmq.POLLIN)
+      self.services[socket] = name
+      if self.registry[name]["transport"] == "shm":
+        self.rings[name] = None  # opened on the first doorbell, the publisher creates it
+
+    self.writer = LogWriter(path or log_path(), codec)
+    self.logged: dict[str, int] = dict.fromkeys(service_names, 0)
+    self.missed: dict[str, int] = dict.fromkeys(service_names, 0)  # shared-memory messages overwritten before logging
+    self._running = True
+
+  def _messages(self, name, frame) -> list:
+    if name not in self.rings:
+      return messenger.frame_messages(frame)
+    if self.rings[name] is None:
+      self.rings[name] = ShmRing.open(ring_path(name))
+    ring = self.rings[name]
+    seq, _, count, _ = messenger.STAMP.unpack_from(frame.buffer)
+    messages = [ring.read(seq + i) for i in range(count)] if ring is not None else [None] * count
+    self.missed[name] += messages.count(None)
+    return [message for message in messages if message is not None]
+
+  def poll(self, timeout_ms=messenger.POLL_TIMEOUT_MS) -> int:
+    """Logs the messages that arrived within timeout_ms, returns how many."""
+    logged = 0
+    for socket, _ in self.poller.poll(timeout_ms):
+      name = self.services[socket]
+      packed = self.registry[name]["encoding"] == "packed"
+      try:
+        while True:
+          frame = socket.recv(zmq.NOBLOCK, copy=False)
+          if len(frame) < messenger.STAMP.size:  # not from a PubMaster
+            continue
+          sent_ns = messenger.STAMP.unpack_from(frame.buffer)[1]
+          messages = self._messages(name, frame)
+          for message in messages:
+            self.writer.write(name, bytes(message), sent_ns, packed)
+          self.logged[name] += len(messages)
+          logged += len(messages)
+      except zmq.Again:
+        pass
+    self.writer.flush_due(time.monotonic_ns())
+    return logged
+
+  def run(self) -> None:
+    logging.warning(f"loggerd logging {list(self.logged)} to {self.writer.path}")
+    try:
+      while self._running:
+        self.poll()
+    finally:
+      self.close()
+
+  def stop(self) -> None:
+    """Ends run() after the current poll, safe to call from a signal handler."""
+    self._running = False
+
+  def close(self) -> None:
+    """Writes the rest of the log with its index."""
+    if self.context is None:
+      return
+    if self._pid != os.getpid():  # inherited through fork(), the parent finishes the log
+      self.context = None
+      return
+    self.writer.close()
+    for socket in self.services:
+      socket.close(linger=0)
+    for ring in self.rings.values():
+      if ring is not None:
+        ring.close()
+    self.context = None
+    messenger.release_context()
+    if any(self.missed.values()):
+      logging.warning(f"loggerd missed shared-memory messages overwritten before they were logged: {self.missed}")
+
+
+def main():
+  loggerd = Loggerd()
+  signal.signal(signal.SIGTERM, lambda signum, frame: loggerd.stop())
+  signal.signal(signal.SIGINT, lambda signum, frame: loggerd.stop())
+  loggerd.run()
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,118 @@
+import os
+import tempfile
+import time
+
+import pytest
+
+import messaging.messenger as messenger
+from messaging.log import LogReader, LogWriter
+from system.loggerd import Loggerd
+from tools.replay import Replay
+
+REGISTRY = """
+services:
+- name: logged
+  rate_hz: 5
+  schema: MapboxSettings
+- name: logged_shm
+  rate_hz: 5
+  schema: MapboxSettings
+  transport: shm
+  shm_slot_size: 4096
+- name: logged_packed
+  rate_hz: 5
+  schema: MapboxSettings
+  encoding: packed
+- name: replayed
+  rate_hz: 5
+  schema: MapboxSettings
+  encoding: packed
+"""
+
+
+@pytest.fixture
+def registry_path():
+  with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as file:
+    file.write(REGISTRY)
+  yield file.name
+  os.unlink(file.name)
+
+
+def decoded_timestamp(record):
+  if record.packed:
+    return messenger.schema.MapboxSettings.from_bytes_packed(record.data).timestamp
+  with messenger.schema.MapboxSettings.from_bytes(record.data) as msg:
+    return msg.timestamp
+
+
+def poll_until(loggerd, count, timeout=1.0):
+  deadline = time.monotonic() + timeout
+  while sum(loggerd.logged.values()) < count and time.monotonic() < deadline:
+    loggerd.poll(10)
+
+
+class TestLoggerd:
+  def test_log_and_replay(self, tmp_path, registry_path):
+    names = ["logged", "logged_shm", "logged_packed"]
+    pub = messenger.PubMaster(names, registry_path=registry_path)
+    loggerd = Loggerd(names, tmp_path / "drive.msglog", registry_path=registry_path)
+    try:
+      time.sleep(0.05)
+      for name in names:
+        for timestamp in range(3):
+          pub.send(name, messenger.schema.MapboxSettings.new_message(timestamp=timestamp))
+          time.sleep(0.01)
+        pub.send_many(name, [messenger.schema.MapboxSettings.new_message(timestamp=timestamp) for timestamp in range(3, 6)])
+      poll_until(loggerd, 18)
+    finally:
+      loggerd.close()
+      pub.close()
+    assert loggerd.logged == {name: 6 for name in names}
+
+    with LogReader(tmp_path / "drive.msglog") as reader:
+      assert reader.indexed
+      assert reader.services == set(names)
+      records = list(reader.records())
+    for name in names:
+      service_records = [record for record in records if record.name == name]
+      assert [record.packed for record in service_records] == [name == "logged_packed"] * 6
+      assert [decoded_timestamp(record) for record in service_records] == list(range(6))
+      assert all(a.time_ns <= b.time_ns for a, b in zip(service_records, service_records[1:], strict=False))
+    assert records[2].time_ns - records[0].time_ns >= 20_000_000  # publish times, 10 ms apart
+
+    replay = Replay(tmp_path / "drive.msglog", ["logged"], speed=0, registry_path=registry_path)
+    sub = messenger.SubMaster("logged", registry_path=registry_path)
+    try:
+      assert replay.run() == 6
+      assert sub.wait_for("logged", timeout=1.0)
+      deadline = time.monotonic() + 1.0
+      while sub["logged"].timestamp != 5 and time.monotonic() < deadline:
+        sub.wait_for("logged", timeout=0.1)
+      assert sub["logged"].timestamp == 5
+    finally:
+      sub.close()
+      replay.close()
+
+  def test_replay_timing_and_encoding(self, tmp_path, registry_path):
+    with LogWriter(tmp_path / "drive.msglog") as writer:
+      for timestamp in range(5):  # recorded unpacked, 20 ms apart, replayed to a packed service
+        writer.write("replayed", messenger.schema.MapboxSettings.new_message(timestamp=timestamp).to_bytes(), timestamp * 20_000_000)
+
+    sub = messenger.SubMaster("replayed", registry_path=registry_path)
+    try:
+      for speed, minimum, maximum in ((1.0, 0.08, 0.5), (4.0, 0.02, 0.08), (0, 0.0, 0.02)):
+        replay = Replay(tmp_path / "drive.msglog", speed=speed, registry_path=registry_path)
+        try:
+          assert replay.service_names == ["replayed"]
+          start = time.monotonic()
+          assert replay.run() == 5
+          elapsed = time.monotonic() - start - replay.startup_delay
+          assert minimum <= elapsed < maximum, speed
+        finally:
+          replay.close()
+        deadline = time.monotonic() + 1.0
+        while (sub["replayed"] is None or sub["replayed"].timestamp != 4) and time.monotonic() < deadline:
+          sub.wait_for("replayed", timeout=0.1)
+        assert sub["replayed"].timestamp == 4
+    finally:
+      sub.close()
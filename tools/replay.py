@@ -0,0 +1,97 @@
+"""Republishes a message log recorded by system/loggerd.py through PubMaster.
+
+  python -m tools.replay /tmp/msglogs/<log>.msglog               # at the recorded rate
+  python -m tools.replay <log> --speed 4                          # 4x faster
+  python -m tools.replay <log> --speed 0 --services livelocationd # as fast as possible, one service
+
+Run the daemons under test (e.g. navigationd) without the publishers of the replayed services, which replay replaces.
+As fast as possible, subscribers of conflated services only see the newest message whenever they look.
+"""
+import argparse
+import logging
+import time
+
+import messaging.messenger as messenger
+from messaging.log import LogReader, LogRecord
+
+DEFAULT_STARTUP_DELAY = 0.2  # seconds for subscribers to connect before the first message, ZMQ drops earlier ones
+
+
+class Replay:
+  def __init__(self, path, service_names=None, speed: float = 1.0, registry_path="messaging/services.yaml",
+               startup_delay: float = DEFAULT_STARTUP_DELAY) -> None:
+    """speed scales the recorded timing, 0 replays as fast as possible."""
+    if speed < 0:
+      raise ValueError("speed must be positive, or 0 for as fast as possible")
+    self.reader = LogReader(path)
+    self.speed = speed
+    self.startup_delay = startup_delay
+    self.registry: dict[str, dict] = messenger.load_registry(registry_path)
+    self.service_names = sorted(self.reader.services) if service_names is None else list(service_names)
+    for name in self.service_names:
+      if name not in self.registry:
+        raise ValueError(f"Unknown service {name}")
+    self.pm = messenger.PubMaster(self.service_names, registry_path=registry_path)
+    self.published: dict[str, int] = dict.fromkeys(self.service_names, 0)
+
+  def _serialized(self, record: LogRecord) -> bytes:
+    """Record data in the publishing service's encoding, converted when the log has the other one."""
+    packed = self.pm[record.name].packed
+    if record.packed == packed:
+      return record.data
+    schema_type = self.registry[record.name]["schema_type"]
+    if record.packed:
+      return bytes(schema_type.from_bytes_packed(record.data).as_builder().to_bytes())
+    with schema_type.from_bytes(record.data) as msg:
+      return bytes(msg.as_builder().to_bytes_packed())
+
+  def run(self, start_ns: int | None = None) -> int:
+    """Publishes the log's messages from start_ns on, returns how many."""
+    time.sleep(self.startup_delay)
+    services = set(self.service_names)
+    first_ns: int | None = None
+    start = time.monotonic()
+    count = 0
+    for record in self.reader.records(services, start_ns):
+      if first_ns is None:
+        first_ns = record.time_ns
+      if self.speed:
+        delay = start + (record.time_ns - first_ns) / 1e9 / self.speed - time.monotonic()
+        if delay > 0:
+          time.sleep(delay)
+      self.pm.send_serialized(record.name, self._serialized(record))
+      self.published[record.name] += 1
+      count += 1
+    self.pm.flush()
+    return count
+
+  def close(self) -> None:
+    self.pm.close()
+    self.reader.close()
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Republish a message log through PubMaster")
+  parser.add_argument("path", help="log written by system/loggerd.py")
+  parser.add_argument("--speed", type=float, default=1.0, help="multiple of the recorded rate, 0 for as fast as possible")
+  parser.add_argument("--services", nargs="+", help="services to replay, all logged ones by default")
+  parser.add_argument("--loop", action="store_true", help="replay until interrupted")
+  args = parser.parse_args()
+
+  replay = Replay(args.path, args.services, args.speed)
+  try:
+    while True:
+      start = time.monotonic()
+      count = replay.run()
+      logging.warning(f"replayed {count} messages in {time.monotonic() - start:.2f} s: {replay.published}")
+      if not args.loop:
+        break
+      replay.startup_delay = 0.0
+  except KeyboardInterrupt:
+    pass
+  finally:
+    replay.close()
+
+
+if __name__ == "__main__":
+  main()